@@ -0,0 +1,435 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2013  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+"""
+Benchmarks of the content pipeline (fetching, extraction, exploration and
+processing of the content, pre-installation rules) on synthetic content of
+configurable size.
+
+Every benchmark runs in a forked process so that its peak memory usage can be
+measured. Latency percentiles, throughput and peak RSS are reported and
+checked against the thresholds (if given), the exit code is 1 if any of the
+thresholds is exceeded or any of the benchmarks fails.
+
+Run from the top directory of the project as:
+
+    PYTHONPATH=. python benchmarks/run_benchmarks.py [options]
+
+"""
+
+import os
+import sys
+import glob
+import errno
+import json
+import time
+import shutil
+import fnmatch
+import argparse
+import tempfile
+import threading
+import traceback
+
+from collections import namedtuple
+from distutils.spawn import find_executable
+
+import BaseHTTPServer
+import SimpleHTTPServer
+
+import synthetic
+
+from org_fedora_oscap import common
+from org_fedora_oscap import rule_handling
+
+# pylint: disable-msg=C0103
+BenchmarkResult = namedtuple("BenchmarkResult", ["name", "latencies", "items",
+                                                 "unit", "peak_rss", "status"])
+
+DEFAULT_THRESHOLDS_PATH = os.path.join(os.path.dirname(__file__),
+                                       "thresholds.json")
+
+class SkipBenchmark(Exception):
+    """Exception raised if the benchmark cannot be run in the environment."""
+
+    pass
+
+class _Namespace(object):
+    """Simple object with the given attributes (stands for ksdata,...)."""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def _require_tool(tool):
+    if not find_executable(tool):
+        raise SkipBenchmark("'%s' not available" % tool)
+
+def _require_openscap():
+    try:
+        # pylint: disable-msg=W0612
+        from org_fedora_oscap import content_handling
+    except ImportError as ierr:
+        raise SkipBenchmark("openscap bindings not available: %s" % ierr)
+    return content_handling
+
+class _QuietHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    """Request handler not logging the requests."""
+
+    def log_message(self, *args):
+        pass
+
+## The benchmarks. Each of them gets the context (paths to the generated
+## content and options) and returns a function to time and the number and
+## unit of the items one call of the function processes.
+
+def bench_fetch_data(ctx):
+    from org_fedora_oscap import data_fetch
+
+    archive = ctx.archives["zip"]
+    os.chdir(os.path.dirname(archive))
+    server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), _QuietHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    url = "http://127.0.0.1:%d/%s" % (server.server_port,
+                                      os.path.basename(archive))
+    out_file = os.path.join(ctx.work_dir, "fetched.zip")
+
+    def run():
+        data_fetch.fetch_data(url, out_file)
+
+    return (run, os.path.getsize(archive), "B")
+
+def _bench_extract(fmt):
+    def bench(ctx):
+        if fmt not in ctx.archives:
+            raise SkipBenchmark("no %s archive (rpmbuild not available?)" % fmt)
+        archive = ctx.archives[fmt]
+        out_dir = os.path.join(ctx.work_dir, "extracted_" + fmt)
+
+        def run():
+            shutil.rmtree(out_dir, ignore_errors=True)
+            common.extract_data(archive, out_dir, [])
+
+        return (run, os.path.getsize(archive), "B")
+
+    return bench
+
+def bench_explore_content_files(ctx):
+    _require_tool("oscap")
+    content_handling = _require_openscap()
+    fpaths = [ctx.ds_path, ctx.xccdf_path]
+
+    def run():
+        content_handling.explore_content_files(fpaths)
+
+    return (run, len(fpaths), "files")
+
+def bench_datastream_handler(ctx):
+    content_handling = _require_openscap()
+
+    def run():
+        content_handling.DataStreamHandler(ctx.ds_path)
+
+    return (run, os.path.getsize(ctx.ds_path), "B")
+
+def bench_get_profiles(ctx):
+    content_handling = _require_openscap()
+
+    def run():
+        # new handler every time, the profiles are cached
+        handler = content_handling.DataStreamHandler(ctx.ds_path)
+        for (ds_id, checklists) in handler.get_data_streams_checklists().items():
+            for checklist_id in checklists:
+                handler.get_profiles(ds_id, checklist_id)
+
+    return (run, ctx.args.checklists * ctx.args.profiles, "profiles")
+
+def bench_get_profiles_ssg(ctx):
+    content_handling = _require_openscap()
+    if not ctx.args.ssg_ds or not os.path.exists(ctx.args.ssg_ds):
+        raise SkipBenchmark("no SSG data stream (see --ssg-ds)")
+
+    # the real content, mainly for the peak RSS of the profiles' records
+    profiles = [0]
+    def run():
+        handler = content_handling.DataStreamHandler(ctx.args.ssg_ds)
+        profiles[0] = 0
+        for (ds_id, checklists) in handler.get_data_streams_checklists().items():
+            for checklist_id in checklists:
+                profiles[0] += len(handler.get_profiles(ds_id, checklist_id))
+
+    run()
+    return (run, profiles[0], "profiles")
+
+def bench_get_fix_rules_pre(ctx):
+    _require_tool("oscap")
+
+    def run():
+        common.get_fix_rules_pre("xccdf_org.example_profile_standalone_0",
+                                 ctx.xccdf_path)
+
+    return (run, ctx.args.fixes, "fixes")
+
+def bench_rule_data_parse(ctx):
+    def run():
+        rule_handling.RuleData.from_text(ctx.rules)
+
+    return (run, ctx.args.rules, "rules")
+
+def bench_rule_data_eval(ctx):
+    rule_data = rule_handling.RuleData.from_text(ctx.rules)
+
+    mount_points = dict(("/mnt/part%d" % idx,
+                         _Namespace(format=_Namespace(options="defaults")))
+                        for idx in range(0, ctx.args.rules, 2))
+    ksdata = _Namespace(packages=_Namespace(packageList=["vim"],
+                                            excludedList=[]),
+                        rootpw=_Namespace(password="password", isCrypted=False,
+                                          seen=True))
+    storage = _Namespace(mountpoints=mount_points,
+                         bootloader=_Namespace(password=""))
+
+    def run():
+        rule_data.eval_rules(ksdata, storage, report_only=False)
+        rule_data.revert_changes(ksdata, storage)
+
+    return (run, ctx.args.rules, "rules")
+
+BENCHMARKS = [("fetch_data", bench_fetch_data)]
+BENCHMARKS.extend(("extract_data/%s" % fmt, _bench_extract(fmt))
+                  for fmt in synthetic.ARCHIVE_FORMATS)
+BENCHMARKS.extend([("explore_content_files", bench_explore_content_files),
+                   ("DataStreamHandler", bench_datastream_handler),
+                   ("get_profiles", bench_get_profiles),
+                   ("get_profiles/ssg", bench_get_profiles_ssg),
+                   ("get_fix_rules_pre", bench_get_fix_rules_pre),
+                   ("RuleData/parse", bench_rule_data_parse),
+                   ("RuleData/eval", bench_rule_data_eval),
+                   ])
+
+def percentile(values, pct):
+    """
+    Get the percentile of the values (nearest-rank method).
+
+    :param values: the values
+    :type values: list of numbers
+    :param pct: the percentile (0-100)
+    :type pct: int or float
+
+    """
+
+    values = sorted(values)
+    rank = max(int(round(pct / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+def run_benchmark(name, bench, ctx):
+    """
+    Run the benchmark in a forked process.
+
+    :return: result of the benchmark
+    :rtype: BenchmarkResult
+
+    """
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # child -- run the benchmark and send the results to the parent
+        os.close(read_fd)
+        try:
+            func, items, unit = bench(ctx)
+            latencies = []
+            for _i in range(ctx.args.repeat):
+                start = time.time()
+                func()
+                latencies.append(time.time() - start)
+            data = {"latencies": latencies, "items": items, "unit": unit,
+                    "status": "ok"}
+        except SkipBenchmark as skip:
+            data = {"status": "skipped: %s" % skip}
+        except Exception: # pylint: disable-msg=W0703
+            data = {"status": "failed: %s" %
+                    traceback.format_exc().strip().splitlines()[-1]}
+        with os.fdopen(write_fd, "w") as pipe:
+            json.dump(data, pipe)
+        os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd, "r") as pipe:
+        output = pipe.read()
+    _pid, _status, usage = os.wait4(pid, 0)
+
+    try:
+        data = json.loads(output)
+    except ValueError:
+        data = {"status": "failed: benchmark process crashed"}
+
+    return BenchmarkResult(name, data.get("latencies", []), data.get("items", 0),
+                           data.get("unit", ""), usage.ru_maxrss,
+                           data["status"])
+
+def check_thresholds(result, thresholds):
+    """
+    Check the result against the thresholds.
+
+    :param thresholds: name pattern -> {"p90": seconds, "peak_rss": KiB,...}
+    :type thresholds: dict
+    :return: messages about the exceeded thresholds
+    :rtype: list of strings
+
+    """
+
+    if result.status != "ok":
+        return []
+
+    values = {"p50": percentile(result.latencies, 50),
+              "p90": percentile(result.latencies, 90),
+              "p99": percentile(result.latencies, 99),
+              "peak_rss": result.peak_rss}
+
+    exceeded = []
+    for (pattern, limits) in sorted(thresholds.items()):
+        if not fnmatch.fnmatch(result.name, pattern):
+            continue
+        for (key, limit) in sorted(limits.items()):
+            if values.get(key, 0) > limit:
+                exceeded.append("%s: %s %.3f exceeds %.3f" % (result.name, key,
+                                                              values[key],
+                                                              limit))
+
+    return exceeded
+
+def format_result(result):
+    """Get a line for the result table."""
+
+    if result.status != "ok":
+        return "%-24s %s" % (result.name, result.status)
+
+    p50 = percentile(result.latencies, 50)
+    throughput = result.items / p50 if p50 else float("inf")
+    return ("%-24s %9.4f %9.4f %9.4f %14.1f %-8s %10d" %
+            (result.name, p50, percentile(result.latencies, 90),
+             percentile(result.latencies, 99), throughput,
+             result.unit + "/s", result.peak_rss))
+
+def generate_content(args, work_dir):
+    """
+    Generate the synthetic content.
+
+    :return: context for the benchmarks
+    :rtype: _Namespace
+
+    """
+
+    content_dir = os.path.join(work_dir, "content")
+    os.mkdir(content_dir)
+
+    ds_path = os.path.join(content_dir, "synthetic-ds.xml")
+    synthetic.generate_datastream(ds_path, args.checklists, args.profiles,
+                                  args.rules, args.fixes)
+    xccdf_path = os.path.join(content_dir, "synthetic-xccdf.xml")
+    synthetic.generate_benchmark(xccdf_path, args.profiles, args.rules,
+                                 args.fixes)
+
+    archives = dict()
+    for fmt in synthetic.ARCHIVE_FORMATS:
+        archive_path = os.path.join(work_dir, "content.%s" % fmt)
+        try:
+            synthetic.generate_archive(archive_path, [ds_path, xccdf_path], fmt)
+        except OSError as oserr:
+            if oserr.errno != errno.ENOENT:
+                raise
+            # rpmbuild not available, the benchmark is skipped
+            continue
+        archives[fmt] = archive_path
+
+    return _Namespace(args=args, work_dir=work_dir, ds_path=ds_path,
+                      xccdf_path=xccdf_path, archives=archives,
+                      rules=synthetic.generate_rules(args.rules))
+
+def _default_ssg_ds():
+    """Get the path to the installed SSG data stream or None."""
+
+    paths = sorted(glob.glob(os.path.join(common.SSG_DIR, "ssg-*-ds.xml")))
+    return paths[0] if paths else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the content "
+                                     "pipeline on synthetic content")
+    parser.add_argument("--profiles", type=int, default=20,
+                        help="number of profiles per checklist")
+    parser.add_argument("--rules", type=int, default=1000,
+                        help="number of rules per checklist")
+    parser.add_argument("--fixes", type=int, default=500,
+                        help="number of rules with fixes")
+    parser.add_argument("--checklists", type=int, default=2,
+                        help="number of checklists in the data stream")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of runs of every benchmark")
+    parser.add_argument("--ssg-ds", default=_default_ssg_ds(),
+                        help="SCAP Security Guide data stream for the "
+                        "benchmarks on real content")
+    parser.add_argument("--only", default="*",
+                        help="run only the benchmarks matching the pattern")
+    parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS_PATH,
+                        help="JSON file with the thresholds ('' for none)")
+    parser.add_argument("--json", dest="json_path", default=None,
+                        help="write the results to the given JSON file")
+    args = parser.parse_args()
+
+    thresholds = dict()
+    if args.thresholds:
+        with open(args.thresholds, "r") as thr_file:
+            thresholds = json.load(thr_file)
+
+    work_dir = tempfile.mkdtemp(prefix="oscap_bench")
+    try:
+        ctx = generate_content(args, work_dir)
+
+        print("%-24s %9s %9s %9s %14s %-8s %10s" %
+              ("benchmark", "p50 [s]", "p90 [s]", "p99 [s]", "throughput",
+               "", "peak [KiB]"))
+        results = []
+        for (name, bench) in BENCHMARKS:
+            if not fnmatch.fnmatch(name, args.only):
+                continue
+            result = run_benchmark(name, bench, ctx)
+            results.append(result)
+            print(format_result(result))
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(work_dir)
+
+    if args.json_path:
+        with open(args.json_path, "w") as json_file:
+            json.dump([result._asdict() for result in results], json_file,
+                      indent=2)
+
+    exceeded = []
+    for result in results:
+        exceeded.extend(check_thresholds(result, thresholds))
+    for msg in exceeded:
+        print("THRESHOLD EXCEEDED: %s" % msg)
+
+    failed = [result for result in results if result.status.startswith("failed")]
+    return 1 if exceeded or failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
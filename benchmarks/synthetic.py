@@ -0,0 +1,240 @@
+#
+# Copyright (C) 2013  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+"""
+Module generating synthetic SCAP content (data streams, benchmarks), archives
+with it and pre-installation rules of configurable size for the benchmarks.
+
+"""
+
+import os
+import shutil
+import tarfile
+import zipfile
+import tempfile
+import subprocess
+
+from xml.sax.saxutils import escape
+
+POST_INSTALL_FIX_SYSTEM_ATTR = "urn:xccdf:fix:script:sh"
+PRE_INSTALL_FIX_SYSTEM_ATTR = "urn:redhat:anaconda:pre"
+
+# languages of the titles and descriptions of the profiles
+LANGS = ("en-US", "cs-CZ", "de-DE")
+
+# archive formats supported by generate_archive
+ARCHIVE_FORMATS = ("zip", "tar.gz", "tar.bz2", "rpm")
+
+def pre_install_rule(idx):
+    """
+    Get a pre-installation rule (as used by the rule_handling module).
+
+    :param idx: index of the rule, different indices give different rules
+    :type idx: int
+    :rtype: str
+
+    """
+
+    kind = idx % 5
+    if kind == 0:
+        return "part /mnt/part%d --mountoptions=nodev,noexec" % idx
+    elif kind == 1:
+        return "package --add=package%d" % idx
+    elif kind == 2:
+        return "package --remove=removed%d" % idx
+    elif kind == 3:
+        return "passwd --minlen=%d" % (idx % 20)
+    else:
+        return "bootloader --passwd"
+
+def generate_rules(num_rules):
+    """
+    Get the text of pre-installation rules.
+
+    :param num_rules: number of the rules
+    :type num_rules: int
+    :rtype: str
+
+    """
+
+    return "\n".join(pre_install_rule(idx) for idx in range(num_rules)) + "\n"
+
+def _texts(tag, text, indent):
+    """Helper function giving the element in all the languages."""
+
+    return "".join('%s<%s xml:lang="%s">%s (%s)</%s>\n'
+                   % (indent, tag, lang, escape(text), lang, tag)
+                   for lang in LANGS)
+
+def _benchmark(bench_id, num_profiles, num_rules, num_fixes, indent=""):
+    """
+    Helper function giving an XCCDF 1.2 benchmark. Every profile selects all
+    the rules, the first num_fixes rules have both post-installation and
+    pre-installation fixes.
+
+    """
+
+    lines = ['%s<Benchmark xmlns="http://checklists.nist.gov/xccdf/1.2" '
+             'id="xccdf_org.example_benchmark_%s">\n' % (indent, bench_id),
+             "%s  <status>draft</status>\n" % indent,
+             "%s  <version>1.0</version>\n" % indent]
+
+    rule_ids = ["xccdf_org.example_rule_%s_%d" % (bench_id, idx)
+                for idx in range(num_rules)]
+
+    for idx in range(num_profiles):
+        lines.append('%s  <Profile id="xccdf_org.example_profile_%s_%d">\n'
+                     % (indent, bench_id, idx))
+        lines.append(_texts("title", "Profile %d" % idx, indent + "    "))
+        lines.append(_texts("description", "Synthetic profile %d of the %s "
+                            "benchmark selecting all the rules. " % (idx, bench_id)
+                            * 5, indent + "    "))
+        lines.extend('%s    <select selected="true" idref="%s"/>\n'
+                     % (indent, rule_id) for rule_id in rule_ids)
+        lines.append("%s  </Profile>\n" % indent)
+
+    for (idx, rule_id) in enumerate(rule_ids):
+        lines.append('%s  <Rule selected="true" id="%s">\n' % (indent, rule_id))
+        lines.append(_texts("title", "Rule %d" % idx, indent + "    "))
+        if idx < num_fixes:
+            lines.append('%s    <fix system="%s">touch /root/fixed_%d</fix>\n'
+                         % (indent, POST_INSTALL_FIX_SYSTEM_ATTR, idx))
+            lines.append('%s    <fix system="%s">%s</fix>\n'
+                         % (indent, PRE_INSTALL_FIX_SYSTEM_ATTR,
+                            escape(pre_install_rule(idx))))
+        lines.append("%s  </Rule>\n" % indent)
+
+    lines.append("%s</Benchmark>\n" % indent)
+
+    return "".join(lines)
+
+def generate_benchmark(fpath, num_profiles, num_rules, num_fixes):
+    """
+    Generate a standalone XCCDF benchmark.
+
+    :param fpath: path the benchmark should be written to
+    :type fpath: str
+    :param num_profiles: number of the profiles
+    :type num_profiles: int
+    :param num_rules: number of the rules (all selected by every profile)
+    :type num_rules: int
+    :param num_fixes: number of the rules with fixes
+    :type num_fixes: int
+
+    """
+
+    with open(fpath, "w") as fobj:
+        fobj.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        fobj.write(_benchmark("standalone", num_profiles, num_rules,
+                              num_fixes))
+
+def generate_datastream(fpath, num_checklists, num_profiles, num_rules,
+                        num_fixes):
+    """
+    Generate a source data stream collection with one data stream containing
+    the given number of checklists (benchmarks).
+
+    :see: generate_benchmark
+    :param num_checklists: number of the checklists
+    :type num_checklists: int
+
+    """
+
+    with open(fpath, "w") as fobj:
+        fobj.write('<?xml version="1.0" encoding="utf-8"?>\n'
+                   '<ds:data-stream-collection '
+                   'xmlns:ds="http://scap.nist.gov/schema/scap/source/1.2" '
+                   'xmlns:xlink="http://www.w3.org/1999/xlink" '
+                   'id="scap_org.example_collection_synthetic" '
+                   'schematron-version="1.0">\n'
+                   '  <ds:data-stream id="scap_org.example_datastream_synthetic" '
+                   'scap-version="1.2" use-case="OTHER">\n'
+                   '    <ds:checklists>\n')
+        for idx in range(num_checklists):
+            fobj.write('      <ds:component-ref '
+                       'id="scap_org.example_cref_xccdf%d" '
+                       'xlink:href="#scap_org.example_comp_xccdf%d"/>\n'
+                       % (idx, idx))
+        fobj.write('    </ds:checklists>\n'
+                   '  </ds:data-stream>\n')
+        for idx in range(num_checklists):
+            fobj.write('  <ds:component id="scap_org.example_comp_xccdf%d" '
+                       'timestamp="2014-01-01T00:00:00">\n' % idx)
+            fobj.write(_benchmark("checklist%d" % idx, num_profiles, num_rules,
+                                  num_fixes, indent="    "))
+            fobj.write('  </ds:component>\n')
+        fobj.write('</ds:data-stream-collection>\n')
+
+def _generate_rpm(archive_path, fpaths):
+    """Helper function generating an RPM with the files using rpmbuild."""
+
+    build_dir = tempfile.mkdtemp(prefix="oscap_bench_rpm")
+    try:
+        spec_path = os.path.join(build_dir, "content.spec")
+        with open(spec_path, "w") as spec:
+            spec.write("Name: synthetic-content\nVersion: 1\nRelease: 1\n"
+                       "Summary: Synthetic content\nLicense: GPLv2+\n"
+                       "BuildArch: noarch\n%description\nSynthetic content\n"
+                       "%install\nmkdir -p %{buildroot}/content\n")
+            for fpath in fpaths:
+                spec.write("cp %s %%{buildroot}/content/\n" % fpath)
+            spec.write("%files\n/content\n")
+
+        # rpmbuild's errors go to stderr to be seen if the build fails
+        with open(os.devnull, "w") as devnull:
+            subprocess.check_call(["rpmbuild", "-bb", "--quiet",
+                                   "--define", "_topdir %s" % build_dir,
+                                   spec_path], stdout=devnull)
+
+        rpms_dir = os.path.join(build_dir, "RPMS", "noarch")
+        shutil.copy(os.path.join(rpms_dir, os.listdir(rpms_dir)[0]),
+                    archive_path)
+    finally:
+        shutil.rmtree(build_dir)
+
+def generate_archive(archive_path, fpaths, fmt):
+    """
+    Generate an archive with the given files (stored without directories).
+
+    :param archive_path: path the archive should be written to
+    :type archive_path: str
+    :param fpaths: paths of the files to put into the archive
+    :type fpaths: list of strings
+    :param fmt: format of the archive (see ARCHIVE_FORMATS)
+    :type fmt: str
+    :raise OSError: if the rpmbuild tool (needed for RPMs) is not available
+    :raise subprocess.CalledProcessError: if the RPM cannot be built
+
+    """
+
+    if fmt == "zip":
+        with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED) as zfile:
+            for fpath in fpaths:
+                zfile.write(fpath, os.path.basename(fpath))
+    elif fmt in ("tar.gz", "tar.bz2"):
+        mode = "w:gz" if fmt == "tar.gz" else "w:bz2"
+        tfile = tarfile.open(archive_path, mode)
+        try:
+            for fpath in fpaths:
+                tfile.add(fpath, os.path.basename(fpath))
+        finally:
+            tfile.close()
+    elif fmt == "rpm":
+        _generate_rpm(archive_path, fpaths)
+    else:
+        raise ValueError("Unsupported archive format: '%s'" % fmt)
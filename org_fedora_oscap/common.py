@@ -25,14 +25,22 @@ specific to any installation mode (tui, gui, ks).
 """
 
 import os
+import re
+import sys
+import shutil
+import stat
+import hashlib
 import tempfile
-import subprocess
+import threading
+import Queue
 import zipfile
 import tarfile
+import logging
 import cpioarchive
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from functools import wraps
+from xml.etree import cElementTree as ElementTree
 
 from pyanaconda import constants
 from pyanaconda import nm
@@ -40,11 +48,19 @@ from pyanaconda.constants import product
 from pyanaconda.threads import threadMgr, AnacondaThread
 
 from org_fedora_oscap import utils
+from org_fedora_oscap import tool_runner
+from org_fedora_oscap import timing
 from org_fedora_oscap.data_fetch import fetch_data
 
+log = logging.getLogger("anaconda")
+
 # everything else should be private
-__all__ = ["run_oscap_remediate", "get_fix_rules_pre", "wait_and_fetch_net_data",
-           "extract_data", "strip_content_dir", "OSCAPaddonError"]
+__all__ = ["run_oscap_remediate", "iter_oscap_remediate",
+           "run_oscap_remediate_parallel", "run_oscap_remediate_cached",
+           "get_fix_rules_pre", "iter_fix_rules_pre", "wait_and_fetch_net_data",
+           "extract_data", "extract_data_staged", "commit_staged_data",
+           "discard_staged_data", "extract_data_verified",
+           "strip_content_dir", "OSCAPaddonError"]
 
 INSTALLATION_CONTENT_DIR = "/tmp/openscap_data/"
 TARGET_CONTENT_DIR = "/root/openscap_data/"
@@ -57,9 +73,27 @@ if product.productName.lower() != 'anaconda':
 
 RESULTS_PATH = utils.join_paths(TARGET_CONTENT_DIR, "eval_remediate_results.xml")
 
+# tab-separated values: rule ID, result, start and duration (in seconds)
+TIMING_LOG_PATH = utils.join_paths(TARGET_CONTENT_DIR, "eval_remediate_timing.log")
+
+# rules sorted by the total time spent on them (slowest first)
+HOT_RULES_PATH = utils.join_paths(TARGET_CONTENT_DIR, "eval_remediate_hot_rules.txt")
+
+# results of the re-evaluation of the rules fixed by the parallel remediation
+REEVAL_RESULTS_PATH = utils.join_paths(TARGET_CONTENT_DIR, "reeval_results.xml")
+
+# JSON timeline of the addon's phases (see the timing module)
+TIMELINE_PATH = utils.join_paths(TARGET_CONTENT_DIR, "oscap_addon_timeline.json")
+
+# name of the file with the fixes in the entries of the remediation cache
+CACHED_FIXES_NAME = "fixes.sh"
+
+POST_INSTALL_FIX_SYSTEM_ATTR = "urn:xccdf:fix:script:sh"
+
 PRE_INSTALL_FIX_SYSTEM_ATTR = "urn:redhat:anaconda:pre"
 
 THREAD_FETCH_DATA = "AnaOSCAPdataFetchThread"
+THREAD_PREFETCH_CONTENT = "AnaOSCAPcontentPrefetchThread"
 
 SUPPORTED_ARCHIVES = (".zip", ".tar", ".tar.gz", ".tar.bz2", )
 
@@ -90,6 +124,45 @@ MESSAGE_TYPE_INFO = 2
 #   text -- the actual message that should be displayed, logged, ...
 RuleMessage = namedtuple("RuleMessage", ["type", "text"])
 
+# namedtuple for the progress of the evaluation and remediation
+#   done -- number of rules processed so far (evaluated or fixed)
+#   rule -- ID of the last processed rule
+#   result -- result of the last processed rule (e.g. "pass", "fixed",...)
+#   elapsed -- seconds elapsed since the evaluation started
+RemediationProgress = namedtuple("RemediationProgress",
+                                 ["done", "rule", "result", "elapsed"])
+
+# line printed by 'oscap xccdf eval --progress' for every processed rule
+PROGRESS_LINE_RE = re.compile(r"^(?P<rule>[^\s:]+):(?P<result>[a-z]+)$")
+
+# lines delimiting fixes of the rules in the generated fix script
+FIX_BEGIN_RE = re.compile(r"^# BEGIN fix \(\d+ / \d+\) for '(?P<rule>[^']+)'$")
+FIX_END_RE = re.compile(r"^# END fix for '(?P<rule>[^']+)'$")
+
+# groups of fixes that need to be run serially and regular expressions for
+# recognizing them, fixes matching none of them are grouped by the files they
+# touch
+FIX_GROUPS = (("packages", re.compile(r"\b(yum|dnf|rpm|package_command)\b")),
+              ("services", re.compile(r"\b(systemctl|service_command|chkconfig)\b")),
+              ("sysctl", re.compile(r"\bsysctl\b")),
+              )
+
+# lines of fixes that only install or remove packages
+PACKAGE_FIX_LINE_RE = re.compile(r"^(?:package_command|yum|dnf)(?:\s+-y)?\s+"
+                                 r"(?P<action>install|remove|erase)(?:\s+-y)?"
+                                 r"(?P<pkgs>(?:\s+[\w.+-]+)+)$")
+
+# lines of fixes that have no effect on the system (comments, messages,
+# sourcing of the shared functions)
+NOOP_FIX_LINE_RE = re.compile(r"^(?:#.*|\(?(?:>&2\s+)?echo\b.*|(?:\.|source)\s+\S+)?$")
+
+# absolute paths in fixes
+FIX_PATH_RE = re.compile(r"(?<![\w$.}/-])(/[\w.@+-]+(?:/[\w.@+*-]+)+)")
+
+# paths built from variables in fixes (e.g. "$dir/file" or "${prefix}/file")
+FIX_VAR_PATH_RE = re.compile(r"\$(?:\w+|\{[^}]+\})/")
+
+@timing.timed("fix generation")
 def get_fix_rules_pre(profile, fpath, ds_id="", xccdf_id="", tailoring=""):
     """
     Get fix rules for the pre-installation environment for a given profile in a
@@ -102,10 +175,53 @@ def get_fix_rules_pre(profile, fpath, ds_id="", xccdf_id="", tailoring=""):
 
     """
 
+    return "".join(iter_fix_rules_pre(profile, fpath, ds_id=ds_id,
+                                      xccdf_id=xccdf_id, tailoring=tailoring))
+
+def iter_fix_rules_pre(profile, fpath, ds_id="", xccdf_id="", tailoring=""):
+    """
+    Same as get_fix_rules_pre, but yields the lines with fix rules as they are
+    produced by the oscap tool.
+
+    :see: get_fix_rules_pre
+    :return: generator of lines with fix rules for a given profile
+    :rtype: generator of strings
+
+    """
+
     return _run_oscap_gen_fix(profile, fpath, PRE_INSTALL_FIX_SYSTEM_ATTR,
                               ds_id=ds_id, xccdf_id=xccdf_id,
                               tailoring=tailoring)
 
+def _run_oscap(args, error_msg, ok_codes=(0,), root=None):
+    """
+    Run the oscap tool with the given arguments and yield lines from its stdout
+    as they come.
+
+    :param args: the command and its arguments
+    :type args: list of strings
+    :param error_msg: message used if the oscap tool fails, '%s' is replaced
+                      by the tool's stderr
+    :type error_msg: str
+    :param ok_codes: return codes of the tool meaning success
+    :type ok_codes: tuple of ints
+    :param root: path to the root the tool should be run in or None
+    :type root: str or None
+    :return: generator of the lines from the tool's stdout
+    :rtype: generator of strings
+    :raise OSCAPaddonError: if the tool cannot be run, finishes with a return
+                            code not in ok_codes or writes something to stderr
+
+    """
+
+    try:
+        for line in tool_runner.iter_tool_lines(args, ok_codes=ok_codes,
+                                                check_stderr=True,
+                                                root=root):
+            yield line
+    except tool_runner.ToolRunError as err:
+        raise OSCAPaddonError(error_msg % (err.stderr or err))
+
 def _run_oscap_gen_fix(profile, fpath, template, ds_id="", xccdf_id="",
                        tailoring=""):
     """
@@ -116,13 +232,13 @@ def _run_oscap_gen_fix(profile, fpath, template, ds_id="", xccdf_id="",
     :see: run_oscap_remediate
     :param template: the value of the 'system' attribute of the fix elements
     :type template: str
-    :return: oscap tool's stdout
-    :rtype: str
+    :return: generator of the lines from oscap tool's stdout
+    :rtype: generator of strings
 
     """
 
     if not profile:
-        return ""
+        return iter(())
 
     args = ["oscap", "xccdf", "generate", "fix"]
     args.append("--template=%s" % template)
@@ -139,25 +255,11 @@ def _run_oscap_gen_fix(profile, fpath, template, ds_id="", xccdf_id="",
 
     args.append(fpath)
 
-    try:
-        proc = subprocess.Popen(args, stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE)
-    except OSError as oserr:
-        msg = "Failed to run the oscap tool: %s" % oserr
-        raise OSCAPaddonError(msg)
-
-    (stdout, stderr) = proc.communicate()
-
-    # pylint thinks Popen has no attribute returncode
-    # pylint: disable-msg=E1101
-    if proc.returncode != 0 or stderr:
-        msg = "Failed to generate fix rules with the oscap tool: %s" % stderr
-        raise OSCAPaddonError(msg)
-
-    return stdout
+    return _run_oscap(args, "Failed to generate fix rules with the oscap "
+                      "tool: %s")
 
 def run_oscap_remediate(profile, fpath, ds_id="", xccdf_id="", tailoring="",
-                        chroot=""):
+                        chroot="", progress_cb=None):
     """
     Run the evaluation and remediation with the oscap tool on a given file,
     doing the remediation as defined in a given profile defined in a given
@@ -177,19 +279,35 @@ def run_oscap_remediate(profile, fpath, ds_id="", xccdf_id="", tailoring="",
     :type tailoring: str
     :param chroot: path to the root the oscap tool should be run in
     :type chroot: str
-    :return: oscap tool's stdout (summary of the rules, checks and fixes)
+    :param progress_cb: function called with a RemediationProgress instance
+                        every time a rule is processed; times of processing of
+                        the rules are logged to the TIMING_LOG_PATH file and
+                        summarized in the HOT_RULES_PATH file
+    :type progress_cb: RemediationProgress -> None
+    :return: oscap tool's stdout (the rules and their results)
     :rtype: str
 
     """
 
-    if not profile:
-        return ""
+    return "".join(iter_oscap_remediate(profile, fpath, ds_id=ds_id,
+                                        xccdf_id=xccdf_id, tailoring=tailoring,
+                                        chroot=chroot, progress_cb=progress_cb))
+
+def iter_oscap_remediate(profile, fpath, ds_id="", xccdf_id="", tailoring="",
+                         chroot="", progress_cb=None):
+    """
+    Same as run_oscap_remediate, but yields the lines of the oscap tool's
+    stdout as they are produced. The oscap tool is only started once the
+    iteration starts.
 
-    def do_chroot():
-        """Helper function doing the chroot if requested."""
-        if chroot and chroot != "/":
-            os.chroot(chroot)
-            os.chdir("/")
+    :see: run_oscap_remediate
+    :return: generator of the lines from the oscap tool's stdout
+    :rtype: generator of strings
+
+    """
+
+    if not profile:
+        return iter(())
 
     # make sure the directory for the results exists
     results_dir = os.path.dirname(RESULTS_PATH)
@@ -199,6 +317,7 @@ def run_oscap_remediate(profile, fpath, ds_id="", xccdf_id="", tailoring="",
 
     args = ["oscap", "xccdf", "eval"]
     args.append("--remediate")
+    args.append("--progress")
     args.append("--results=%s" % RESULTS_PATH)
 
     # oscap uses the default profile by default
@@ -213,39 +332,862 @@ def run_oscap_remediate(profile, fpath, ds_id="", xccdf_id="", tailoring="",
 
     args.append(fpath)
 
+    # 0 -- success; 2 -- no error, but checks/remediation failed
+    lines = _run_oscap(args, "Content evaluation and remediation with the "
+                       "oscap tool failed: %s", ok_codes=(0, 2),
+                       root=chroot or None)
+
+    timing_log_path = TIMING_LOG_PATH
+    hot_rules_path = HOT_RULES_PATH
+    if chroot:
+        timing_log_path = os.path.normpath(chroot + "/" + timing_log_path)
+        hot_rules_path = os.path.normpath(chroot + "/" + hot_rules_path)
+
+    return _track_remediation_progress(lines, timing_log_path, hot_rules_path,
+                                       progress_cb)
+
+def _track_remediation_progress(lines, timing_log_path, hot_rules_path,
+                                progress_cb=None):
+    """
+    Pass through the lines of the 'oscap xccdf eval --progress' output while
+    logging the times of processing of the rules and reporting progress. Once
+    the output ends, the rules sorted by the time spent on them are written
+    out.
+
+    :param lines: lines of the oscap tool's output
+    :type lines: iterable of strings
+    :param timing_log_path: path to the file the times should be logged to
+                            (only created if some rule is processed)
+    :type timing_log_path: str
+    :param hot_rules_path: path to the file the sorted rules should be
+                           written to (only created if some rule is processed)
+    :type hot_rules_path: str
+    :param progress_cb: function called with a RemediationProgress instance
+                        every time a rule is processed
+    :type progress_cb: RemediationProgress -> None
+    :return: generator of the same lines
+    :rtype: generator of strings
+
+    The clock is started when the first rule is reported so that the time
+    the oscap tool spends loading the content is not attributed to any rule
+    (the first rule is thus logged with a zero duration).
+
+    """
+
+    start = last = None
+    done = 0
+    timing_log = None
+
+    # rule ID -> [total duration, results]
+    rule_times = dict()
+
     try:
-        proc = subprocess.Popen(args,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                preexec_fn=do_chroot)
-    except OSError as oserr:
-        msg = "Failed to run the oscap tool: %s" % oserr
-        raise OSCAPaddonError(msg)
-
-    (stdout, stderr) = proc.communicate()
-
-    # save stdout?
-    # pylint thinks Popen has no attribute returncode
-    # pylint: disable-msg=E1101
-    if proc.returncode not in (0, 2) or stderr:
-        # 0 -- success; 2 -- no error, but checks/remediation failed
-        msg = "Content evaluation and remediation with the oscap tool "\
-            "failed: %s" % stderr
-        raise OSCAPaddonError(msg)
-
-    return stdout
+        for line in lines:
+            match = PROGRESS_LINE_RE.match(line.strip())
+            if match:
+                # oscap reports the rule once it is processed
+                now = timing.monotonic()
+                if start is None:
+                    start = last = now
+                done += 1
+
+                if timing_log is None:
+                    timing_log = open(timing_log_path, "w")
+                duration = now - last
+                timing_log.write("%s\t%s\t%.3f\t%.3f\n" % (match.group("rule"),
+                                                         match.group("result"),
+                                                         last - start,
+                                                         duration))
+                last = now
+
+                # a rule is reported twice if it is fixed
+                rule_time = rule_times.setdefault(match.group("rule"), [0.0, []])
+                rule_time[0] += duration
+                rule_time[1].append(match.group("result"))
+
+                if progress_cb:
+                    progress_cb(RemediationProgress(done, match.group("rule"),
+                                                    match.group("result"),
+                                                    now - start))
+            yield line
+    finally:
+        # make sure the tool is not left running if the caller gave up
+        if hasattr(lines, "close"):
+            lines.close()
+
+        if timing_log is not None:
+            timing_log.close()
+            try:
+                write_hot_rules_report(rule_times, hot_rules_path)
+            except IOError as ioerr:
+                # just a report, must not hide the remediation's result
+                log.warning("Failed to write the hot rules report to '%s': %s",
+                            hot_rules_path, ioerr)
+
+def write_hot_rules_report(rule_times, report_path):
+    """
+    Write out the rules sorted by the time spent on them (slowest first).
+
+    :param rule_times: total durations (in seconds) and results of the rules
+    :type rule_times: dict(rule ID -> (float, list of strings))
+    :param report_path: path to the file the report should be written to
+    :type report_path: str
 
-def wait_and_fetch_net_data(url, out_file, ca_certs=None):
     """
-    Function that waits for network connection and starts a thread that fetches
-    data over network.
 
-    :see: org_fedora_oscap.data_fetch.fetch_data
-    :return: the name of the thread running fetch_data
+    total = sum(duration for (duration, _results) in rule_times.itervalues())
+    hot_rules = sorted(rule_times.iteritems(), key=lambda item: item[1][0],
+                       reverse=True)
+
+    with open(report_path, "w") as report:
+        report.write("# %d rules processed in %.3f s\n" % (len(rule_times),
+                                                          total))
+        report.write("# seconds\t%% of total\trule ID\tresults\n")
+        for (rule, (duration, results)) in hot_rules:
+            share = 100.0 * duration / total if total else 0.0
+            report.write("%.3f\t%.1f\t%s\t%s\n" % (duration, share, rule,
+                                                   ",".join(results)))
+
+def split_fix_script(script):
+    """
+    Split the fix script generated by the oscap tool into the fixes of the
+    particular rules.
+
+    :param script: the fix script (or its lines)
+    :type script: str or iterable of strings
+    :return: the part of the script before the first fix (shared by all the
+             fixes) and the fixes of the rules
+    :rtype: (str, OrderedDict(rule ID -> str))
+
+    """
+
+    if isinstance(script, basestring):
+        script = script.splitlines(True)
+
+    prologue = []
+    fixes = OrderedDict()
+    rule = None
+    fix_lines = []
+    for line in script:
+        if rule is None:
+            match = FIX_BEGIN_RE.match(line.strip())
+            if match:
+                rule = match.group("rule")
+                fix_lines = [line]
+            elif not fixes:
+                prologue.append(line)
+        else:
+            fix_lines.append(line)
+            if FIX_END_RE.match(line.strip()):
+                fixes[rule] = "".join(fix_lines)
+                rule = None
+
+    return ("".join(prologue), fixes)
+
+def _fix_path_prefix(path):
+    """
+    Get the part of the path found in a fix before the first component with
+    wildcards (e.g. '/etc/pam.d' for '/etc/pam.d/*').
+
+    """
+
+    components = path.split("/")
+    for (idx, component) in enumerate(components):
+        if any(char in component for char in "*?["):
+            return "/".join(components[:idx]) or "/"
+    return path
+
+def _paths_overlap(paths1, paths2):
+    """
+    Check if the fixes touching the given paths may touch the same files. Every
+    path stands for the file and everything under it if it is a directory
+    (e.g. 'find /etc/ssh ...' touches '/etc/ssh/sshd_config').
+
+    :param paths1: paths touched by the first fix (see _fix_path_prefix)
+    :type paths1: set of strings
+    :param paths2: paths touched by the second fix (see _fix_path_prefix)
+    :type paths2: set of strings
+    :rtype: bool
+
+    """
+
+    if paths1 & paths2:
+        return True
+
+    for path1 in paths1:
+        for path2 in paths2:
+            if path2.startswith(path1.rstrip("/") + "/") or \
+               path1.startswith(path2.rstrip("/") + "/"):
+                return True
+
+    return False
+
+def group_fixes(fixes):
+    """
+    Partition the fixes into groups that can be run concurrently. Fixes in a
+    single group need to be run serially in the given order. Fixes working
+    with packages, services or sysctl are put into a group of their own kind,
+    the other ones are grouped by the files they touch. Groups touching the
+    same files (or files under the same directories, see _paths_overlap) are
+    merged. Fixes with no files recognized or with paths built
+    from variables end up in the "misc" group that must not be run
+    concurrently with any other group.
+
+    :param fixes: fixes of the rules
+    :type fixes: OrderedDict(rule ID -> str)
+    :return: groups of the (rule ID, fix) pairs with the names of the groups as
+             keys, the "packages" group comes first and the "misc" group
+             second if present
+    :rtype: OrderedDict(str -> list of (str, str))
+
+    """
+
+    groups = OrderedDict([("packages", []), ("misc", [])])
+
+    # (names of the kinds, files touched, fixes) for the rest of the fixes
+    kind_groups = OrderedDict((name, (set([name]), set(), []))
+                              for (name, _regexp) in FIX_GROUPS
+                              if name != "packages")
+    file_groups = []
+    for (rule, fix) in fixes.iteritems():
+        kind = next((name for (name, regexp) in FIX_GROUPS
+                     if regexp.search(fix)), None)
+        paths = set(_fix_path_prefix(path) for path in FIX_PATH_RE.findall(fix))
+        if kind == "packages":
+            groups["packages"].append((rule, fix))
+        elif FIX_VAR_PATH_RE.search(fix):
+            # no idea what files the fix touches
+            groups["misc"].append((rule, fix))
+        elif kind:
+            kind_groups[kind][1].update(paths)
+            kind_groups[kind][2].append((rule, fix))
+        elif paths:
+            file_groups.append((set(), paths, [(rule, fix)]))
+        else:
+            groups["misc"].append((rule, fix))
+
+    # merge the groups with common files (e.g. a service fix and a file fix
+    # both touching the service's configuration file)
+    merged = []
+    for (names, paths, group) in kind_groups.values() + file_groups:
+        overlapping = [other for other in merged
+                       if _paths_overlap(other[1], paths)]
+        new_group = (set(names), set(paths), list(group))
+        for other in overlapping:
+            new_group[0].update(other[0])
+            new_group[1].update(other[1])
+            new_group[2].extend(other[2])
+            merged.remove(other)
+        merged.append(new_group)
+
+    # keep the original order of the fixes in the groups
+    order = dict((rule, idx) for (idx, rule) in enumerate(fixes))
+    file_idx = 0
+    for (names, _paths, group) in merged:
+        if names:
+            name = "+".join(sorted(names))
+        else:
+            name = "files%d" % file_idx
+            file_idx += 1
+        group.sort(key=lambda item: order[item[0]])
+        groups[name] = group
+
+    return OrderedDict((name, group) for (name, group) in groups.iteritems()
+                       if group)
+
+@timing.timed("fix generation")
+def get_package_fixes(profile, fpath, ds_id="", xccdf_id="", tailoring=""):
+    """
+    Get the packages the post-installation fixes for the given profile would
+    install or remove so that they can be handled by the installation
+    transaction instead. The rules are then satisfied when they are evaluated
+    after the installation and their fixes are not run.
+
+    Only the fixes consisting of unconditional package_command/yum/dnf
+    install or remove lines are recognized. Conditional package fixes (as
+    generated by SSG, e.g. installing a package only if some other one is
+    installed) are not handled here and are left to the remediation.
+
+    :see: run_oscap_remediate
+    :see: package_fixes_from_script
+    :return: packages to be installed and packages to be removed
+    :rtype: (set, set)
+
+    """
+
+    script = _run_oscap_gen_fix(profile, fpath, POST_INSTALL_FIX_SYSTEM_ATTR,
+                                ds_id=ds_id, xccdf_id=xccdf_id,
+                                tailoring=tailoring)
+
+    _prologue, fixes = split_fix_script(script)
+
+    return package_fixes_from_script(fixes)
+
+def package_fixes_from_script(fixes):
+    """
+    Get the packages installed or removed by the fixes that do nothing else
+    than unconditional package_command/yum/dnf install or remove lines. Fixes
+    doing anything more than that (including the conditional installation or
+    removal used by SSG) are not handled and are ignored.
+
+    :param fixes: fixes of the rules
+    :type fixes: OrderedDict(rule ID -> str)
+    :return: packages to be installed and packages to be removed
+    :rtype: (set, set)
+
+    """
+
+    add_pkgs = set()
+    remove_pkgs = set()
+    for fix in fixes.itervalues():
+        fix_adds = set()
+        fix_removes = set()
+        for line in fix.splitlines():
+            line = line.strip()
+            match = PACKAGE_FIX_LINE_RE.match(line)
+            if match:
+                if match.group("action") == "install":
+                    fix_adds.update(match.group("pkgs").split())
+                else:
+                    fix_removes.update(match.group("pkgs").split())
+            elif not NOOP_FIX_LINE_RE.match(line):
+                # the fix does something else, leave it to the remediation
+                break
+        else:
+            add_pkgs.update(fix_adds)
+            remove_pkgs.update(fix_removes)
+
+    return (add_pkgs, remove_pkgs)
+
+def _get_rule_results(results_path):
+    """
+    Get the ID of the test result and the results of the rules from the XCCDF
+    results file.
+
+    :param results_path: path to the XCCDF results file
+    :type results_path: str
+    :return: ID of the test result and the results of the rules
+    :rtype: (str, OrderedDict(rule ID -> str))
+
+    """
+
+    result_id = None
+    results = OrderedDict()
+    for (_event, elem) in ElementTree.iterparse(results_path):
+        tag = elem.tag.rsplit("}", 1)[-1]
+        if tag == "rule-result":
+            for child in elem:
+                if child.tag.rsplit("}", 1)[-1] == "result":
+                    results[elem.get("idref")] = child.text
+                    break
+            elem.clear()
+        elif tag == "TestResult":
+            result_id = elem.get("id")
+
+    return (result_id, results)
+
+def _get_failed_rules(results_path):
+    """
+    Get the ID of the test result and the IDs of the failed rules from the
+    XCCDF results file.
+
+    :param results_path: path to the XCCDF results file
+    :type results_path: str
+    :return: ID of the test result and IDs of the failed rules
+    :rtype: (str, list of strings)
+
+    """
+
+    result_id, results = _get_rule_results(results_path)
+
+    return (result_id, [rule for (rule, result) in results.iteritems()
+                        if result == "fail"])
+
+def _merge_fix_results(results_path, fix_results):
+    """
+    Update the results of the rules in the XCCDF results file of the
+    evaluation done before the remediation with the results of their fixes the
+    way 'oscap xccdf eval --remediate' does. The score is not recomputed.
+
+    :param results_path: path to the XCCDF results file
+    :type results_path: str
+    :param fix_results: results of the fixes
+    :type fix_results: dict(rule ID -> "fixed" or "error")
+
+    """
+
+    # keep the namespace prefixes used in the file
+    for (_event, (prefix, uri)) in ElementTree.iterparse(results_path,
+                                                         events=("start-ns",)):
+        try:
+            ElementTree.register_namespace(prefix, uri)
+        except ValueError:
+            # reserved prefix (ns0, ns1,...), a generated one is used instead
+            pass
+
+    tree = ElementTree.parse(results_path)
+    for elem in tree.iter():
+        if elem.tag.rsplit("}", 1)[-1] != "rule-result" or \
+           elem.get("idref") not in fix_results:
+            continue
+        for child in elem:
+            if child.tag.rsplit("}", 1)[-1] == "result":
+                child.text = fix_results[elem.get("idref")]
+                break
+
+    tree.write(results_path, encoding="UTF-8", xml_declaration=True)
+
+def _run_fix(fix_script, chroot=""):
+    """
+    Run the given fix script with bash (in the chroot if requested).
+
+    :param fix_script: the fix script
+    :type fix_script: str
+    :param chroot: path to the root the script should be run in
+    :type chroot: str
+    :return: whether the fix succeeded or not
+    :rtype: bool
+
+    """
+
+    # run concurrently, no preexec_fn (see tool_runner.CHROOT_CMD)
+    tool_root, _in_chroot = _chroot_helpers(chroot)
+
+    try:
+        result = tool_runner.run_tool(["bash"], ok_codes=None,
+                                      stdin_data=fix_script, merge_stderr=True,
+                                      root=tool_root)
+    except tool_runner.ToolRunError as err:
+        raise OSCAPaddonError("Failed to run bash: %s" % err)
+
+    return result.returncode == 0
+
+def _chroot_helpers(chroot):
+    """
+    Function returning helpers for running processes in the chroot
+    and for getting paths of files in the chroot from outside of it.
+
+    :param chroot: path to the root the processes should be run in
+    :type chroot: str
+    :return: a tuple of the root the tools should be run in (see
+             tool_runner.ToolRunner.run) and the function giving the path of
+             a file outside of the chroot
+    :rtype: tuple(str or None, callable)
+
+    """
+
+    def in_chroot(path):
+        """Helper function giving the path of the file outside of chroot."""
+        if chroot:
+            return os.path.normpath(chroot + "/" + path)
+        return path
+
+    return (chroot or None, in_chroot)
+
+def _get_eval_opts(profile, ds_id="", xccdf_id="", tailoring=""):
+    """
+    Function returning the oscap options selecting the profile to evaluate.
+
+    :see: run_oscap_remediate
+    :rtype: list of strings
+
+    """
+
+    opts = []
+    if profile.lower() != "default":
+        opts.append("--profile=%s" % profile)
+    if ds_id:
+        opts.append("--datastream-id=%s" % ds_id)
+    if xccdf_id:
+        opts.append("--xccdf-id=%s" % xccdf_id)
+    if tailoring:
+        opts.append("--tailoring-file=%s" % tailoring)
+
+    return opts
+
+def _evaluate(opts, fpath, chroot, progress_cb=None):
+    """
+    Function evaluating the content (without remediation) and returning the
+    rules that failed.
+
+    :param opts: options selecting the profile (see _get_eval_opts)
+    :type opts: list of strings
+    :param progress_cb: see run_oscap_remediate
+    :return: see _get_failed_rules
+    :rtype: tuple(str, list of strings)
+
+    """
+
+    tool_root, in_chroot = _chroot_helpers(chroot)
+    utils.ensure_dir_exists(os.path.dirname(in_chroot(RESULTS_PATH)))
+
+    args = ["oscap", "xccdf", "eval", "--progress",
+            "--results=%s" % RESULTS_PATH] + opts + [fpath]
+    lines = _run_oscap(args, "Content evaluation with the oscap tool failed: %s",
+                       ok_codes=(0, 2), root=tool_root)
+    for _line in _track_remediation_progress(lines,
+                                             in_chroot(TIMING_LOG_PATH),
+                                             in_chroot(HOT_RULES_PATH),
+                                             progress_cb):
+        pass
+
+    return _get_failed_rules(in_chroot(RESULTS_PATH))
+
+def _run_fix_groups(prologue, fixes, chroot, jobs, report):
+    """
+    Function running the fixes in independent groups concurrently. Package
+    fixes are run first (and serially) because the other fixes may depend on
+    the installed packages, then the fixes that cannot be grouped safely are
+    run (serially too) and only then the other groups are run concurrently.
+
+    :param prologue: see split_fix_script
+    :type prologue: str
+    :param fixes: see split_fix_script
+    :type fixes: OrderedDict
+    :param jobs: maximum number of groups of fixes run concurrently
+    :type jobs: int
+    :param report: function called with the rule ID and "fixed" or "error"
+                   when a fix is finished (needs to be thread-safe)
+    :type report: callable
+    :raise OSCAPaddonError: if some of the fixes cannot be run
+
+    """
+
+    groups = group_fixes(fixes)
+
+    def run_group(group):
+        """Helper function running fixes in a group serially."""
+        for (rule, fix) in group:
+            result = "fixed" if _run_fix(prologue + fix, chroot) else "error"
+            report(rule, result)
+
+    # packages first, the other fixes may need them, then the fixes that may
+    # touch anything
+    for name in ("packages", "misc"):
+        if name in groups:
+            run_group(groups.pop(name))
+
+    queue = Queue.Queue()
+    for group in groups.itervalues():
+        queue.put(group)
+
+    # exceptions raised in the worker threads (as returned by sys.exc_info)
+    errors = []
+    def worker():
+        """Helper function running groups until there are no more."""
+        while not errors:
+            try:
+                group = queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                run_group(group)
+            except Exception: # pylint: disable-msg=W0703
+                # re-raised in the main thread
+                errors.append(sys.exc_info())
+
+    threads = [threading.Thread(target=worker)
+               for _i in range(min(max(jobs, 1), len(groups)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0][0], errors[0][1], errors[0][2]
+
+def _make_reporter(results, done, progress_cb):
+    """
+    Function returning a thread-safe function storing results of the fixes
+    and reporting progress.
+
+    :param results: dictionary the results should be stored in
+    :type results: dict
+    :param done: one-item list holding the number of finished steps
+    :type done: list
+    :param progress_cb: see run_oscap_remediate
+
+    """
+
+    start = timing.monotonic()
+    lock = threading.Lock()
+
+    def report(rule, result):
+        """Helper function storing results and reporting progress."""
+
+        with lock:
+            results[rule] = result
+            done[0] += 1
+            if progress_cb:
+                progress_cb(RemediationProgress(done[0], rule, result,
+                                                timing.monotonic() - start))
+
+    return report
+
+def run_oscap_remediate_parallel(profile, fpath, ds_id="", xccdf_id="",
+                                 tailoring="", chroot="", jobs=2,
+                                 progress_cb=None, fix_script_path=None):
+    """
+    Alternative to run_oscap_remediate that first evaluates the content, then
+    runs the fixes of the failed rules in independent groups concurrently and
+    in the end re-evaluates the fixed rules. Package fixes are run first (and
+    serially) because the other fixes may depend on the installed packages.
+    The results of the evaluation saved to RESULTS_PATH are updated with the
+    results of the fixes (as verified by the re-evaluation).
+
+    :see: run_oscap_remediate
+    :param jobs: maximum number of groups of fixes run concurrently
+    :type jobs: int
+    :param fix_script_path: path (outside of the chroot) the fix script for
+                            the failed rules should be saved to or None
+    :type fix_script_path: str
+    :return: results of the fixes
+    :rtype: dict(rule ID -> "fixed" or "error")
+
+    """
+
+    if not profile:
+        return dict()
+
+    tool_root, in_chroot = _chroot_helpers(chroot)
+    opts = _get_eval_opts(profile, ds_id, xccdf_id, tailoring)
+
+    ## evaluation
+    done = [0]
+    def eval_report(progress):
+        """Helper function reporting progress of the evaluation."""
+        # fixes are counted on top of the evaluated rules
+        done[0] = progress.done
+        if progress_cb:
+            progress_cb(progress)
+
+    result_id, failed = _evaluate(opts, fpath, chroot, eval_report)
+
+    ## remediation
+    script = ""
+    if failed:
+        args = ["oscap", "xccdf", "generate", "fix",
+                "--template=%s" % POST_INSTALL_FIX_SYSTEM_ATTR]
+        if result_id:
+            args.append("--result-id=%s" % result_id)
+        args.append(RESULTS_PATH)
+        script = "".join(_run_oscap(args, "Failed to generate fix script with "
+                                    "the oscap tool: %s", root=tool_root))
+
+    if fix_script_path:
+        try:
+            with open(fix_script_path, "w") as fobj:
+                fobj.write(script)
+        except IOError as ioerr:
+            # just a copy for the caller, must not break the remediation
+            log.warning("Failed to save the fix script to '%s': %s",
+                        fix_script_path, ioerr)
+
+    if not failed:
+        return dict()
+
+    results = dict()
+    prologue, fixes = split_fix_script(script)
+    _run_fix_groups(prologue, fixes, chroot, jobs,
+                    _make_reporter(results, done, progress_cb))
+
+    ## re-evaluation of the fixed rules (needs oscap supporting multiple
+    ## --rule options)
+    if results:
+        args = ["oscap", "xccdf", "eval", "--results=%s" % REEVAL_RESULTS_PATH]
+        args.extend("--rule=%s" % rule for rule in sorted(results))
+        args.extend(opts)
+        args.append(fpath)
+        for _line in _run_oscap(args, "Re-evaluation with the oscap tool "
+                                "failed: %s", ok_codes=(0, 2),
+                                root=tool_root):
+            pass
+
+        # a fix may succeed without actually fixing the rule
+        _result_id, reeval = _get_rule_results(in_chroot(REEVAL_RESULTS_PATH))
+        for (rule, result) in reeval.iteritems():
+            if rule not in results:
+                continue
+            if result == "pass":
+                results[rule] = "fixed"
+            elif result in ("fail", "error", "unknown"):
+                results[rule] = "error"
+
+    _merge_fix_results(in_chroot(RESULTS_PATH), results)
+
+    return results
+
+def get_remediation_cache_key(content_path, profile, ds_id="", xccdf_id="",
+                              tailoring_path="", packages=()):
+    """
+    Function computing the key of the cached remediation results. Installations
+    with the same key are expected to need the same fixes.
+
+    :param content_path: path to the content file
+    :type content_path: str
+    :param profile: ID of the profile
+    :type profile: str
+    :param ds_id: see run_oscap_remediate
+    :param xccdf_id: see run_oscap_remediate
+    :param tailoring_path: path to the tailoring file or ""
+    :type tailoring_path: str
+    :param packages: names of the packages (and groups) installed
+    :type packages: iterable of strings
+    :return: the key
     :rtype: str
 
     """
 
+    def digest(data):
+        """Helper function returning SHA-256 digest of the data."""
+        return hashlib.sha256(data).hexdigest()
+
+    parts = [utils.get_file_fingerprint(content_path, hashlib.sha256()),
+             profile, ds_id, xccdf_id]
+    if tailoring_path:
+        parts.append(utils.get_file_fingerprint(tailoring_path,
+                                                hashlib.sha256()))
+    else:
+        parts.append("")
+    parts.append(digest("\n".join(sorted(set(packages)))))
+
+    return digest("\0".join(parts))
+
+def _is_trusted_cache_dir(cache_dir):
+    """
+    Check that the remediation cache directory (created if it doesn't exist)
+    can be used. Anybody who can write to it could make the following
+    installations run arbitrary scripts as root, so it has to be owned by
+    root (the user running the remediation) and not writable by the group or
+    others.
+
+    :param cache_dir: path to the remediation cache directory
+    :type cache_dir: str
+    :rtype: bool
+
+    """
+
+    try:
+        utils.ensure_dir_exists(cache_dir)
+        dir_stat = os.stat(cache_dir)
+    except EnvironmentError as err:
+        log.warning("Cannot use the remediation cache '%s': %s", cache_dir,
+                    err)
+        return False
+
+    if dir_stat.st_uid != os.geteuid():
+        log.warning("Not using the remediation cache '%s', it is not owned "
+                    "by root", cache_dir)
+        return False
+
+    if dir_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        log.warning("Not using the remediation cache '%s', it is writable by "
+                    "the group or others", cache_dir)
+        return False
+
+    return True
+
+def run_oscap_remediate_cached(profile, fpath, cache_dir, packages=(),
+                               ds_id="", xccdf_id="", tailoring="", chroot="",
+                               jobs=1, progress_cb=None):
+    """
+    Alternative to run_oscap_remediate for many identical installations. The
+    first installation runs the remediation as run_oscap_remediate_parallel
+    does and records the fixes in the cache directory. The
+    following installations with the same content, profile, tailoring and
+    packages just replay the recorded fixes and run a verification evaluation
+    (and fall back to the full remediation if some rules still fail).
+
+    The cache directory has to be on a persistent storage shared by the
+    installations (e.g. an NFS share mounted by the administrator), a
+    directory in the installation environment does not survive between the
+    installations. The recorded fixes are replayed as root, so the cache
+    directory is not used (the full remediation is run instead) if it is not
+    owned by root or if it is writable by the group or others.
+
+    :see: run_oscap_remediate_parallel
+    :param cache_dir: directory (outside of the chroot) with the cached
+                      remediation results, shared by the installations
+    :type cache_dir: str
+    :param packages: names of the packages (and groups) installed
+    :type packages: iterable of strings
+    :return: True if the recorded fixes were replayed successfully, False if
+             the full remediation was run
+    :rtype: bool
+
+    """
+
+    if not profile:
+        return False
+
+    if not _is_trusted_cache_dir(cache_dir):
+        run_oscap_remediate_parallel(profile, fpath, ds_id, xccdf_id,
+                                     tailoring, chroot, jobs, progress_cb)
+        return False
+
+    _tool_root, in_chroot = _chroot_helpers(chroot)
+    key = get_remediation_cache_key(in_chroot(fpath), profile, ds_id,
+                                    xccdf_id,
+                                    tailoring and in_chroot(tailoring),
+                                    packages)
+    entry_dir = os.path.join(cache_dir, key)
+    script_path = os.path.join(entry_dir, CACHED_FIXES_NAME)
+
+    if os.path.exists(script_path):
+        with open(script_path, "r") as fobj:
+            prologue, fixes = split_fix_script(fobj)
+
+        results = dict()
+        _run_fix_groups(prologue, fixes, chroot, jobs,
+                        _make_reporter(results, [0], progress_cb))
+
+        opts = _get_eval_opts(profile, ds_id, xccdf_id, tailoring)
+        _result_id, failed = _evaluate(opts, fpath, chroot)
+        if not failed and "error" not in results.itervalues():
+            return True
+
+        # something changed, fix what is left (no recording, the entry
+        # describes the installations the key was computed for well enough)
+        run_oscap_remediate_parallel(profile, fpath, ds_id, xccdf_id,
+                                     tailoring, chroot, jobs, progress_cb)
+        return False
+
+    # recording is just an optimization, it must not break the remediation
+    try:
+        tmp_dir = tempfile.mkdtemp(prefix=key + ".", dir=cache_dir)
+    except EnvironmentError as err:
+        log.warning("Failed to record the remediation in '%s': %s",
+                    cache_dir, err)
+        tmp_dir = None
+
+    tmp_script_path = tmp_dir and os.path.join(tmp_dir, CACHED_FIXES_NAME)
+    try:
+        run_oscap_remediate_parallel(profile, fpath, ds_id, xccdf_id,
+                                     tailoring, chroot, jobs, progress_cb,
+                                     tmp_script_path)
+        if tmp_dir and os.path.exists(tmp_script_path):
+            # atomic, another installation may have recorded the results
+            # already
+            try:
+                os.rename(tmp_dir, entry_dir)
+            except EnvironmentError as err:
+                log.warning("Failed to record the remediation in '%s': %s",
+                            entry_dir, err)
+    finally:
+        if tmp_dir and os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return False
+
+def wait_for_network():
+    """
+    Function that waits for network connection to be established (if NM is
+    still connecting).
+
+    :raise OSCAPaddonNetworkError: if there is no network connection
+
+    """
+
     # get thread that tries to establish a network connection
     nm_conn_thread = threadMgr.get(constants.THREAD_WAIT_FOR_CONNECTING_NM)
     if nm_conn_thread:
@@ -255,6 +1197,19 @@ def wait_and_fetch_net_data(url, out_file, ca_certs=None):
     if not nm.nm_is_connected():
         raise OSCAPaddonNetworkError("Network connection needed to fetch data.")
 
+def wait_and_fetch_net_data(url, out_file, ca_certs=None):
+    """
+    Function that waits for network connection and starts a thread that fetches
+    data over network.
+
+    :see: org_fedora_oscap.data_fetch.fetch_data
+    :return: the name of the thread running fetch_data
+    :rtype: str
+
+    """
+
+    wait_for_network()
+
     fetch_data_thread = AnacondaThread(name=THREAD_FETCH_DATA,
                                        target=fetch_data,
                                        args=(url, out_file, ca_certs),
@@ -265,6 +1220,7 @@ def wait_and_fetch_net_data(url, out_file, ca_certs=None):
 
     return THREAD_FETCH_DATA
 
+@timing.timed("extraction")
 def extract_data(archive, out_dir, ensure_has_files=None):
     """
     Fuction that extracts the given archive to the given output directory. It
@@ -302,6 +1258,10 @@ def extract_data(archive, out_dir, ensure_has_files=None):
                                                                    archive)
                 raise ExtractionError(msg)
 
+        # the archive may not be verified yet
+        for info in zfile.filelist:
+            _check_member_path(archive, out_dir, info.filename)
+
         utils.ensure_dir_exists(out_dir)
         zfile.extractall(path=out_dir)
         zfile.close()
@@ -322,6 +1282,198 @@ def extract_data(archive, out_dir, ensure_has_files=None):
     else:
         raise ExtractionError("Unsuported archive type")
 
+def extract_data_staged(archive, out_dir, ensure_has_files=None):
+    """
+    Extract the given archive to a staging directory next to the given output
+    directory. The extracted data can then be committed to the output
+    directory with commit_staged_data or dropped with discard_staged_data.
+
+    :see: extract_data
+    :return: the staging directory and a list of files and directories
+             extracted to it
+    :rtype: (str, [str])
+
+    """
+
+    out_dir = os.path.normpath(out_dir)
+    parent_dir = os.path.dirname(out_dir)
+    utils.ensure_dir_exists(parent_dir)
+
+    # the same file system as the output directory so that committing the
+    # data is just a matter of renames
+    staging_dir = tempfile.mkdtemp(prefix=".%s_staging" % os.path.basename(out_dir),
+                                   dir=parent_dir)
+    try:
+        fpaths = extract_data(archive, staging_dir, ensure_has_files)
+    except:
+        discard_staged_data(staging_dir)
+        raise
+
+    return (staging_dir, fpaths)
+
+def _merge_dirs(src_dir, dst_dir):
+    """
+    Move the contents of the src_dir directory into the dst_dir directory
+    replacing the existing files.
+
+    """
+
+    is_dir = lambda path: os.path.isdir(path) and not os.path.islink(path)
+
+    for name in os.listdir(src_dir):
+        src_path = os.path.join(src_dir, name)
+        dst_path = os.path.join(dst_dir, name)
+        if is_dir(src_path) and is_dir(dst_path):
+            _merge_dirs(src_path, dst_path)
+            continue
+
+        if is_dir(dst_path):
+            shutil.rmtree(dst_path)
+        elif os.path.lexists(dst_path) and is_dir(src_path):
+            os.unlink(dst_path)
+        shutil.move(src_path, dst_path)
+
+def commit_staged_data(staging_dir, out_dir, fpaths):
+    """
+    Move the data extracted by extract_data_staged to the output directory and
+    remove the staging directory.
+
+    :param staging_dir: the staging directory the data was extracted to
+    :type staging_dir: str
+    :param out_dir: output directory the data should be moved to
+    :type out_dir: str
+    :param fpaths: paths of the files and directories extracted to the staging
+                   directory
+    :type fpaths: [str]
+    :return: paths of the files and directories in the output directory
+    :rtype: [str]
+
+    """
+
+    staging_dir = os.path.normpath(staging_dir)
+    utils.ensure_dir_exists(out_dir)
+    _merge_dirs(staging_dir, out_dir)
+    discard_staged_data(staging_dir)
+
+    return [utils.join_paths(out_dir, fpath[len(staging_dir):])
+            for fpath in fpaths]
+
+def discard_staged_data(staging_dir):
+    """
+    Remove the data extracted by extract_data_staged.
+
+    :param staging_dir: the staging directory the data was extracted to
+    :type staging_dir: str
+
+    """
+
+    shutil.rmtree(staging_dir, ignore_errors=True)
+
+def extract_data_verified(archive, out_dir, ensure_has_files, check_func):
+    """
+    Extract the given archive to the given output directory while the given
+    check of the archive (e.g. of its fingerprint) runs in a separate thread.
+    The extracted data is only committed to the output directory if the check
+    passes.
+
+    :see: extract_data
+    :param check_func: function checking the archive, raising an exception if
+                       the check fails
+    :type check_func: () -> None
+    :return: a list of files and directories extracted from the archive
+    :rtype: [str]
+    :raise: the exception raised by check_func (has priority over extraction
+            errors)
+
+    """
+
+    check_exc_info = []
+    def run_check():
+        try:
+            check_func()
+        except Exception:
+            check_exc_info.append(sys.exc_info())
+
+    check_thread = threading.Thread(target=run_check,
+                                    name="AnaOSCAPcontentCheckThread")
+    check_thread.daemon = True
+    check_thread.start()
+
+    staged = None
+    extraction_exc_info = None
+    try:
+        staged = extract_data_staged(archive, out_dir, ensure_has_files)
+    except Exception:
+        extraction_exc_info = sys.exc_info()
+    finally:
+        check_thread.join()
+
+    if check_exc_info:
+        if staged:
+            discard_staged_data(staged[0])
+        exc_info = check_exc_info[0]
+        raise exc_info[0], exc_info[1], exc_info[2]
+
+    if extraction_exc_info:
+        raise extraction_exc_info[0], extraction_exc_info[1], extraction_exc_info[2]
+
+    return commit_staged_data(staged[0], out_dir, staged[1])
+
+def _check_member_path(archive, out_dir, name):
+    """
+    Make sure the archive member with the given name (path) is extracted into
+    the output directory, i.e. that its path is not absolute, has no ".."
+    components and doesn't resolve to a path outside the output directory.
+
+    :param archive: path to the archive (for the error message)
+    :type archive: str
+    :param out_dir: output directory the archive is extracted to
+    :type out_dir: str
+    :param name: name (path) of the member
+    :type name: str
+    :raise ExtractionError: if the member would end up outside of the output
+                            directory
+
+    """
+
+    if os.path.isabs(name) or ".." in name.replace("\\", "/").split("/"):
+        msg = "Unsafe path '%s' in the archive '%s'" % (name, archive)
+        raise ExtractionError(msg)
+
+    real_out_dir = os.path.realpath(out_dir)
+    real_path = os.path.realpath(os.path.join(out_dir, name))
+    if real_path != real_out_dir and \
+            not real_path.startswith(os.path.join(real_out_dir, "")):
+        msg = "Path '%s' in the archive '%s' points outside of the output "\
+              "directory" % (name, archive)
+        raise ExtractionError(msg)
+
+def _check_tar_member(archive, out_dir, member):
+    """
+    Make sure the TAR archive member (and the target of a link) is extracted
+    into the output directory and is a file, directory or link.
+
+    :see: _check_member_path
+    :type member: tarfile.TarInfo
+
+    """
+
+    _check_member_path(archive, out_dir, member.name)
+
+    if member.issym():
+        # relative to the link's directory, with no ".." components the link
+        # (and a chain of links) can only point down the directory tree
+        _check_member_path(archive, out_dir,
+                           os.path.join(os.path.dirname(member.name),
+                                        member.linkname))
+    elif member.islnk():
+        # relative to the root of the archive
+        _check_member_path(archive, out_dir, member.linkname)
+    elif not (member.isfile() or member.isdir()):
+        msg = "Unsupported type of '%s' in the archive '%s'" % (member.name,
+                                                              archive)
+        raise ExtractionError(msg)
+
 def _extract_tarball(archive, out_dir, ensure_has_files, alg):
     """
     Extract the given TAR archive to the given output directory and make sure
@@ -356,11 +1508,16 @@ def _extract_tarball(archive, out_dir, ensure_has_files, alg):
             msg = "File '%s' not found in the archive '%s'" % (fpath, archive)
             raise ExtractionError(msg)
 
+    # the archive may not be verified yet
+    members = tfile.getmembers()
+    for member in members:
+        _check_tar_member(archive, out_dir, member)
+
     utils.ensure_dir_exists(out_dir)
     tfile.extractall(path=out_dir)
     tfile.close()
 
-    return [utils.join_paths(out_dir, member.path) for member in tfile.getmembers()]
+    return [utils.join_paths(out_dir, member.path) for member in members]
 
 def _extract_rpm(rpm_path, root="/", ensure_has_files=None):
     """
@@ -381,13 +1538,13 @@ def _extract_rpm(rpm_path, root="/", ensure_has_files=None):
 
     # run rpm2cpio and process the output with the cpioarchive module
     temp_fd, temp_path = tempfile.mkstemp(prefix="oscap_rpm")
-    proc = subprocess.Popen(["rpm2cpio", rpm_path], stdout=temp_fd)
-    proc.wait()
-    if proc.returncode != 0:
+    try:
+        tool_runner.run_tool(["rpm2cpio", rpm_path], stdout=temp_fd)
+    except tool_runner.ToolRunError:
         msg = "Failed to convert RPM '%s' to cpio archive" % rpm_path
         raise ExtractionError(msg)
-
-    os.close(temp_fd)
+    finally:
+        os.close(temp_fd)
 
     try:
         archive = cpioarchive.CpioArchive(temp_path)
@@ -405,6 +1562,10 @@ def _extract_rpm(rpm_path, root="/", ensure_has_files=None):
             msg = "File '%s' not found in the archive '%s'" % (fpath, rpm_path)
             raise ExtractionError(msg)
 
+    # the archive may not be verified yet
+    for entry in entries:
+        _check_member_path(rpm_path, root, entry.name)
+
     for entry in entries:
         dirname = os.path.dirname(entry.name.lstrip("."))
         out_dir = os.path.normpath(root + dirname)
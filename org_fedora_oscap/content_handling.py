@@ -27,8 +27,11 @@ it.
 import os.path
 
 from collections import namedtuple, OrderedDict
+from xml.etree import cElementTree as ElementTree
 from openscap_api import OSCAP
-from pyanaconda.iutil import execReadlines
+from org_fedora_oscap import tool_runner
+from org_fedora_oscap import timing
+from org_fedora_oscap import utils
 
 class ContentHandlingError(Exception):
     """Exception class for errors related to SCAP content handling."""
@@ -58,24 +61,106 @@ ProfileInfo = namedtuple("ProfileInfo", ["id", "title", "description"])
 # pylint: disable-msg=C0103
 ContentFiles = namedtuple("ContentFiles", ["xccdf", "cpe", "tailoring"])
 
-def oscap_text_itr_get_text(itr):
+def get_preferred_langs(locale=None):
     """
-    Helper function for getting a text from the oscap_text_iterator.
+    Get the languages (as used in the xml:lang attributes) the texts should be
+    preferably shown in, the most preferred first.
+
+    :param locale: locale to get the languages for, the one from the LANG
+                   environment variable by default
+    :type locale: str or None
+    :return: preferred languages
+    :rtype: tuple of strings
+
+    """
+
+    if locale is None:
+        locale = os.environ.get("LANG", "")
+
+    # e.g. cs_CZ.UTF-8@latin -> cs-CZ, cs
+    lang = locale.split(".", 1)[0].split("@", 1)[0].replace("_", "-")
+    langs = []
+    if lang and lang not in ("C", "POSIX"):
+        langs.append(lang)
+        langs.append(lang.split("-", 1)[0])
+    langs.extend(["en-US", "en"])
+
+    # remove duplicates, keep the order
+    return tuple(OrderedDict.fromkeys(lang.lower() for lang in langs))
+
+def oscap_text_itr_get_text(itr, langs=None):
+    """
+    Helper function for getting a text from the oscap_text_iterator. Only the
+    fragments in the most preferred language available are used. The iterator
+    is freed.
 
     :param itr: oscap_text_iterator to get the text from
     :type itr: oscap_text_iterator
+    :param langs: preferred languages (see get_preferred_langs)
+    :type langs: tuple of strings or None
     :return: text gotten from the iterator
     :rtype: str
 
     """
 
-    ret = ""
+    # fragments of the text per language in one pass over the iterator
+    fragments = OrderedDict()
     while OSCAP.oscap_text_iterator_has_more(itr):
         text_item = OSCAP.oscap_text_iterator_next(itr)
-        ret += OSCAP.oscap_text_get_text(text_item)
+        lang = (OSCAP.oscap_text_get_lang(text_item) or "").lower()
+        text = OSCAP.oscap_text_get_text(text_item)
+        fragments.setdefault(lang, []).append(text)
+    OSCAP.oscap_text_iterator_free(itr)
+
+    if not fragments:
+        return ""
+
+    for lang in (langs or get_preferred_langs()) + ("",):
+        if lang in fragments:
+            return "".join(fragments[lang])
+
+    # none of the preferred languages, use the first one available
+    return "".join(next(fragments.itervalues()))
+
+def get_profiles_info(profile_itr, langs=None, texts=None):
+    """
+    Helper function for getting the info about all the profiles from the
+    xccdf_profile_iterator. The iterator is freed.
+
+    :param profile_itr: xccdf_profile_iterator to get the profiles from
+    :type profile_itr: xccdf_profile_iterator
+    :param langs: preferred languages (see get_preferred_langs)
+    :type langs: tuple of strings or None
+    :param texts: storage of the titles and descriptions shared by the calls
+                  (the same profiles often appear in multiple data streams)
+    :type texts: dict or None
+    :return: info about the profiles
+    :rtype: list of ProfileInfo instances
+
+    """
+
+    # select the languages once for all the texts
+    langs = langs or get_preferred_langs()
+    if texts is None:
+        texts = dict()
+
+    profiles = []
+    while OSCAP.xccdf_profile_iterator_has_more(profile_itr):
+        profile = OSCAP.xccdf_profile_iterator_next(profile_itr)
+
+        id_ = utils.intern_value(OSCAP.xccdf_profile_get_id(profile))
+        title = oscap_text_itr_get_text(OSCAP.xccdf_profile_get_title(profile),
+                                        langs)
+        desc = oscap_text_itr_get_text(OSCAP.xccdf_profile_get_description(profile),
+                                       langs)
+        profiles.append(ProfileInfo(id_, texts.setdefault(title, title),
+                                    texts.setdefault(desc, desc)))
+
+    OSCAP.xccdf_profile_iterator_free(profile_itr)
 
-    return ret
+    return profiles
 
+@timing.timed("content exploration")
 def explore_content_files(fpaths):
     """
     Function for finding content files in a list of file paths. SIMPLY PICKS THE
@@ -91,8 +176,8 @@ def explore_content_files(fpaths):
 
     """
 
-    def get_doc_type(file_path):
-        for line in execReadlines("oscap", ["info", file_path]):
+    def get_doc_type(info):
+        for line in info.splitlines():
             if line.startswith("Document type:"):
                 _prefix, _sep, type_info = line.partition(":")
                 return type_info.strip()
@@ -103,8 +188,13 @@ def explore_content_files(fpaths):
     found_ds = False
     content_class = None
 
-    for fpath in fpaths:
-        doc_type = get_doc_type(fpath)
+    # get info about all the files concurrently, the oscap tool's return code
+    # doesn't matter, only the document type is needed
+    infos = tool_runner.run_tools([["oscap", "info", fpath] for fpath in fpaths],
+                                  ok_codes=None)
+
+    for (fpath, info) in zip(fpaths, infos):
+        doc_type = get_doc_type(info.stdout)
 
         # prefer DS over standalone XCCDF
         if doc_type == "Source Data Stream" and (not xccdf_file or not found_ds):
@@ -123,6 +213,49 @@ def explore_content_files(fpaths):
     files = ContentFiles(xccdf_file, cpe_file, tailoring_file)
     return (content_class, files)
 
+# elements referring to other files (by their href attributes) and the xlink
+# namespaced href attribute
+REFERRING_ELEMENTS = ("check-content-ref", "check", "component-ref",
+                      "benchmark")
+XLINK_HREF = "{http://www.w3.org/1999/xlink}href"
+
+def get_referenced_files(fpath):
+    """
+    Get local files referenced by the given content file. For example OVAL
+    files referenced by checks in a standalone benchmark or CPE dictionary or
+    components of a data stream stored in separate files.
+
+    :param fpath: path to the content file (XCCDF, CPE dictionary, data stream
+                  or tailoring)
+    :type fpath: str
+    :return: normalized paths of the referenced files that exist
+    :rtype: set of strings
+    :raise ContentHandlingError: if the file cannot be parsed
+
+    """
+
+    base_dir = os.path.dirname(fpath)
+    fpaths = set()
+
+    try:
+        for (_event, elem) in ElementTree.iterparse(fpath):
+            # tags are "{namespace}local-name"
+            if elem.tag.rsplit("}", 1)[-1] in REFERRING_ELEMENTS:
+                href = elem.get("href") or elem.get(XLINK_HREF) or ""
+                # references within the file and remote ones are not files
+                if href and not href.startswith("#") and "://" not in href:
+                    ref_path = os.path.normpath(os.path.join(base_dir, href))
+                    if os.path.isfile(ref_path):
+                        fpaths.add(ref_path)
+            # nothing needed from the parsed elements
+            elem.clear()
+    except (SyntaxError, IOError) as err:
+        # cElementTree's ParseError is a SyntaxError
+        msg = "Failed to get files referenced by '%s': %s" % (fpath, err)
+        raise ContentHandlingError(msg)
+
+    return fpaths
+
 class DataStreamHandler(object):
     """
     Class for handling data streams in the data stream collection and retrieving
@@ -131,6 +264,7 @@ class DataStreamHandler(object):
 
     """
 
+    @timing.timed("handler construction")
     def __init__(self, dsc_file_path, tailoring_file_path=""):
         """
         Constructor for the DataStreamHandler class.
@@ -145,6 +279,10 @@ class DataStreamHandler(object):
         # is used to speed up getting lists of profiles
         self._profiles_cache = dict()
 
+        # titles and descriptions shared by the profiles from all the data
+        # streams and checklists
+        self._texts = dict()
+
         if not os.path.exists(dsc_file_path):
             msg = "Invalid file path: '%s'" % dsc_file_path
             raise DataStreamHandlingError(msg)
@@ -250,8 +388,8 @@ class DataStreamHandler(object):
         :type data_stream_id: str
         :param checklist_id: ID of the checklist to get profiles from
         :type checklist_id: str
-        :return: list of profiles found in the checklist
-        :rtype: list of ProfileInfo instances
+        :return: profiles found in the checklist
+        :rtype: tuple of ProfileInfo instances
 
         """
 
@@ -268,26 +406,16 @@ class DataStreamHandler(object):
         if OSCAP.xccdf_session_load(self._session) != 0:
             raise DataStreamHandlingError(OSCAP.oscap_err_desc())
 
-        # will hold items for the profiles for the speficied DS and checklist
-        profiles = [ProfileInfo("default", "Default", "The default profile")]
-
         # get the benchmark (checklist)
         policy_model = OSCAP.xccdf_session_get_policy_model(self._session)
         benchmark = OSCAP.xccdf_policy_model_get_benchmark(policy_model)
 
-        # iterate over the profiles in the benchmark and store them
+        # profiles for the speficied DS and checklist (immutable, the result
+        # is cached and shared)
         profile_itr = OSCAP.xccdf_benchmark_get_profiles(benchmark)
-        while OSCAP.xccdf_profile_iterator_has_more(profile_itr):
-            profile = OSCAP.xccdf_profile_iterator_next(profile_itr)
-
-            id_ = OSCAP.xccdf_profile_get_id(profile)
-            title = oscap_text_itr_get_text(OSCAP.xccdf_profile_get_title(profile))
-            desc = oscap_text_itr_get_text(OSCAP.xccdf_profile_get_description(profile))
-            info = ProfileInfo(id_, title, desc)
-
-            profiles.append(info)
-
-        OSCAP.xccdf_profile_iterator_free(profile_itr)
+        profiles = tuple([ProfileInfo("default", "Default",
+                                      "The default profile")] +
+                         get_profiles_info(profile_itr, texts=self._texts))
 
         # cache the result
         self._profiles_cache[cache_id] = profiles
@@ -301,6 +429,7 @@ class BenchmarkHandler(object):
 
     """
 
+    @timing.timed("handler construction")
     def __init__(self, xccdf_file_path, tailoring_file_path=""):
         """
         Constructor for the BenchmarkHandler class.
@@ -315,9 +444,8 @@ class BenchmarkHandler(object):
             msg = "Invalid file path: '%s'" % xccdf_file_path
             raise BenchmarkHandlingError(msg)
 
-        # stores a list of profiles in the benchmark
-        self._profiles = [ProfileInfo("default", "Default",
-                                      "The default profile")]
+        # stores the profiles in the benchmark
+        profiles = [ProfileInfo("default", "Default", "The default profile")]
 
         session = OSCAP.xccdf_session_new(xccdf_file_path)
         if not session:
@@ -338,32 +466,20 @@ class BenchmarkHandler(object):
             msg = "Not a valid benchmark file: '%s'" % xccdf_file_path
             raise BenchmarkHandlingError(msg)
 
-        # iterate over the profiles in the benchmark and store them
+        # get the profiles in the benchmark (and the tailoring file)
+        langs = get_preferred_langs()
+        texts = dict()
         profile_itr = OSCAP.xccdf_benchmark_get_profiles(benchmark)
-        while OSCAP.xccdf_profile_iterator_has_more(profile_itr):
-            profile = OSCAP.xccdf_profile_iterator_next(profile_itr)
-
-            id_ = OSCAP.xccdf_profile_get_id(profile)
-            title = oscap_text_itr_get_text(OSCAP.xccdf_profile_get_title(profile))
-            desc = oscap_text_itr_get_text(OSCAP.xccdf_profile_get_description(profile))
-            info = ProfileInfo(id_, title, desc)
-
-            self._profiles.append(info)
+        profiles.extend(get_profiles_info(profile_itr, langs, texts))
 
         if tailoring_file_path:
             tailoring = OSCAP.xccdf_policy_model_get_tailoring(policy_model)
             profile_itr = OSCAP.xccdf_tailoring_get_profiles(tailoring)
-            while OSCAP.xccdf_profile_iterator_has_more(profile_itr):
-                profile = OSCAP.xccdf_profile_iterator_next(profile_itr)
-
-                id_ = OSCAP.xccdf_profile_get_id(profile)
-                title = oscap_text_itr_get_text(OSCAP.xccdf_profile_get_title(profile))
-                desc = oscap_text_itr_get_text(OSCAP.xccdf_profile_get_description(profile))
-                info = ProfileInfo(id_, title, desc)
+            profiles.extend(get_profiles_info(profile_itr, langs, texts))
 
-                self._profiles.append(info)
+        # immutable, the property gives it to the callers
+        self._profiles = tuple(profiles)
 
-        OSCAP.xccdf_profile_iterator_free(profile_itr)
         OSCAP.xccdf_session_free(session)
 
     @property
@@ -10,6 +10,7 @@ import os.path
 import pycurl
 
 from org_fedora_oscap import utils
+from org_fedora_oscap import timing
 
 # everything else should be private
 __all__ = ["fetch_data", "can_fetch_from"]
@@ -72,11 +73,13 @@ def can_fetch_from(url):
     resources = NET_URL_PREFIXES + LOCAL_URL_PREFIXES
     return any(url.startswith(prefix) for prefix in resources)
 
-def fetch_data(url, out_file, ca_certs=None):
+@timing.timed("fetch")
+def fetch_data(url, out_file, ca_certs=None, consumers=()):
     """
     Fetch data from a given URL. If the URL starts with https://, ca_certs can
     be a path to PEM file with CA certificate chain to validate server
-    certificate.
+    certificate. The data can be passed to consumers (e.g. hash objects) as
+    it is being written out, i.e. without reading the output file again.
 
     :param url: URL of the data
     :type url: str
@@ -84,6 +87,9 @@ def fetch_data(url, out_file, ca_certs=None):
     :type out_file: str
     :param ca_certs: path to a PEM file with CA certificate chain
     :type ca_certs: str
+    :param consumers: objects with the update method that should be called
+                      with every chunk of the data
+    :type consumers: iterable of objects (e.g. hashlib.HASH objects)
     :raise WrongRequestError: if a wrong combination of arguments is passed
                               (ca_certs file path given and url starting with
                               http://) or arguments don't have required format
@@ -97,12 +103,12 @@ def fetch_data(url, out_file, ca_certs=None):
     utils.ensure_dir_exists(out_dir)
 
     if can_fetch_from(url):
-        _curl_fetch(url, out_file, ca_certs)
+        _curl_fetch(url, out_file, ca_certs, consumers)
     else:
         msg = "Cannot fetch data from '%s': unknown URL format" % url
         raise UnknownURLformatError(msg)
 
-def _curl_fetch(url, out_file, ca_certs=None):
+def _curl_fetch(url, out_file, ca_certs=None, consumers=()):
     """
     Function that fetches data and writes it out to the given file path. If a
     path to the file with CA certificates is given and the url starts with
@@ -115,6 +121,9 @@ def _curl_fetch(url, out_file, ca_certs=None):
     :param ca_certs: path to the file with CA certificates for server
                      certificate validation
     :type ca_certs: str
+    :param consumers: objects with the update method that should be called
+                      with every chunk of the data
+    :type consumers: iterable of objects
     :raise WrongRequestError: if a wrong combination of arguments is passed
                               (ca_certs file path given and url starting with
                               http://) or arguments don't have required format
@@ -164,7 +173,14 @@ def _curl_fetch(url, out_file, ca_certs=None):
 
     try:
         with open(out_file, "w") as fobj:
-            curl.setopt(pycurl.WRITEDATA, fobj)
+            if consumers:
+                def write_data(data):
+                    fobj.write(data)
+                    for consumer in consumers:
+                        consumer.update(data)
+                curl.setopt(pycurl.WRITEFUNCTION, write_data)
+            else:
+                curl.setopt(pycurl.WRITEDATA, fobj)
             curl.perform()
     except pycurl.error as err:
         # first arg is the error code
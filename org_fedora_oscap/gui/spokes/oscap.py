@@ -18,6 +18,7 @@
 # Red Hat Author(s): Vratislav Podzimek <vpodzime@redhat.com>
 #
 
+import sys
 import threading
 
 import gettext
@@ -32,17 +33,20 @@ from org_fedora_oscap import data_fetch
 from org_fedora_oscap import rule_handling
 from org_fedora_oscap import content_handling
 from org_fedora_oscap import utils
+from org_fedora_oscap import timing
+from org_fedora_oscap import signatures
+from org_fedora_oscap.pipeline import Pipeline, StageSkippedError
 
 from org_fedora_oscap.common import dry_run_skip
 
-from pyanaconda.threads import threadMgr, AnacondaThread
 from pyanaconda.ui.gui.spokes import NormalSpoke
 from pyanaconda.ui.communication import hubQ
+from pyanaconda.threads import threadMgr
 from pyanaconda.ui.gui.utils import gtk_action_wait, really_hide, really_show
-from pyanaconda.ui.gui.utils import set_treeview_selection, fire_gtk_action
+from pyanaconda.ui.gui.utils import fire_gtk_action
 
 # pylint: disable-msg=E0611
-from gi.repository import Gdk
+from gi.repository import Gdk, Gtk, GLib
 
 # export only the spoke, no helper functions, classes or constants
 __all__ = ["OSCAPSpoke"]
@@ -51,6 +55,26 @@ __all__ = ["OSCAPSpoke"]
 SET_PARAMS_PAGE = 0
 GET_CONTENT_PAGE = 1
 
+# stages of the pipeline preparing the content
+STAGE_FETCH = "fetch"
+STAGE_FINGERPRINT = "fingerprint"
+STAGE_EXTRACTION = "extraction"
+STAGE_COMMIT = "commit"
+STAGE_HANDLER = "handler"
+STAGE_PROFILES_MODELS = "profiles models"
+STAGE_INITIALIZATION = "initialization"
+
+# messages sent to the hub when the stages are done
+STAGE_MESSAGES = {STAGE_FETCH: N_("Content fetched"),
+                  STAGE_FINGERPRINT: N_("Content integrity checked"),
+                  STAGE_EXTRACTION: N_("Content extracted"),
+                  STAGE_HANDLER: N_("Content loaded"),
+                  STAGE_PROFILES_MODELS: N_("Profiles prepared"),
+                  }
+
+# number of rows added to a displayed profiles store in one idle callback
+PROFILES_CHUNK_SIZE = 50
+
 # helper functions
 def set_combo_selection(combo, item):
     """
@@ -103,6 +127,101 @@ def render_message_type(column, renderer, model, itr, user_data=None):
     else:
         renderer.set_property("stock-id", "gtk-dialog-question")
 
+def _to_search_text(*items):
+    """Helper function joining the items into a lowercase unicode text."""
+
+    return u"\n".join(item.decode("utf-8") if isinstance(item, str) else item
+                      for item in items).lower()
+
+class ProfilesModel(object):
+    """
+    Class holding the store with profiles from one checklist, the filter
+    model shown in the profiles view, the index of the store's rows and the
+    search index. Rows can be added to the store in chunks.
+
+    The rows and the search index are plain Python data that can be prepared
+    in any thread, the store and the filter model are GTK objects that are
+    only created and changed in the main thread.
+
+    """
+
+    def __init__(self, profiles):
+        """
+        :param profiles: profiles to be shown in the store
+        :type profiles: iterable of content_handling.ProfileInfo
+
+        """
+
+        # created once the model is shown (see create_store)
+        self.store = None
+        self.filter = None
+
+        # profile ID -> Gtk.TreeRowReference
+        self.rows = dict()
+
+        # profile ID -> lowercase text with the ID, title and description
+        self.search_index = dict()
+
+        # rows waiting to be added to the store
+        self._pending = []
+        for profile in profiles:
+            profile_markup = '<span weight="bold">%s</span>\n%s' \
+                                % (profile.title, profile.description)
+            self._pending.append((profile.id, profile_markup))
+            self.search_index[profile.id] = _to_search_text(profile.id,
+                                                            profile.title,
+                                                            profile.description)
+        self._pending.reverse()
+
+    @property
+    def populated(self):
+        """Whether all the rows were added to the store or not."""
+
+        return not self._pending
+
+    def create_store(self, visible_func):
+        """
+        Create the (empty) store and the filter model. Needs to be called in
+        the main thread.
+
+        :param visible_func: visible function of the filter model (called
+                             with the store, the row's iterator and this
+                             model)
+        :type visible_func: callable
+
+        """
+
+        self.store = Gtk.ListStore(str, str, bool)
+        self.filter = self.store.filter_new()
+        self.filter.set_visible_func(visible_func, self)
+
+    def add_rows(self, marked_profile, count=None):
+        """
+        Add rows to the store (see create_store). Needs to be called in the
+        main thread.
+
+        :param marked_profile: ID of the profile that should be marked as
+                               selected
+        :type marked_profile: str or None
+        :param count: maximum number of rows to add or None to add all of them
+        :type count: int or None
+        :return: whether some rows are still waiting to be added or not
+        :rtype: bool
+
+        """
+
+        if count is None:
+            count = len(self._pending)
+
+        for _i in xrange(min(count, len(self._pending))):
+            (profile_id, profile_markup) = self._pending.pop()
+            itr = self.store.append([profile_id, profile_markup,
+                                     profile_id == marked_profile])
+            self.rows[profile_id] = Gtk.TreeRowReference.new(self.store,
+                                                self.store.get_path(itr))
+
+        return bool(self._pending)
+
 class OSCAPSpoke(NormalSpoke):
     """
     Main class of the OSCAP addon spoke that will appear in the Security
@@ -176,6 +295,35 @@ class OSCAPSpoke(NormalSpoke):
         # used to check if the profile was changed or not
         self._active_profile = None
 
+        # (inputs, status) from the last rule evaluation done for the status
+        self._status_cache = None
+
+        # (data stream ID, checklist ID) -> ProfilesModel, built (in a
+        # background thread) for the current content and swapped in the
+        # profiles view when the checklist is changed
+        self._profiles_models = dict()
+        self._profiles_models_lock = threading.Lock()
+
+        # ProfilesModel shown in the profiles view
+        self._profiles_model = None
+
+        # profile marked as selected in the profiles models
+        self._marked_profile = None
+
+        # profile to be selected in the view once its row is added
+        self._profile_to_select = None
+
+        # lowercase text the profiles are searched for
+        self._profiles_search = u""
+
+        # whether the content was prepared by the prefetch started when the
+        # kickstart was parsed
+        self._prefetched = False
+
+        # staging directory and paths of the content extracted to it (waiting
+        # for the integrity check) or None
+        self._staged_content = None
+
         # prevent multiple simultaneous data fetches
         self._fetching = False
         self._fetch_flag_lock = threading.Lock()
@@ -265,7 +413,12 @@ class OSCAPSpoke(NormalSpoke):
             renderer.set_property("stock-id", None)
 
     def _fetch_data_and_initialize(self):
-        """Fetch data from a specified URL and initialize everything."""
+        """
+        Fetch data from a specified URL and initialize everything. The work is
+        done by a pipeline of stages run concurrently where their dependencies
+        allow it.
+
+        """
 
         with self._fetch_flag_lock:
             if self._fetching:
@@ -273,71 +426,106 @@ class OSCAPSpoke(NormalSpoke):
                 return
             self._fetching = True
 
-        thread_name = None
-        if any(self._addon_data.content_url.startswith(net_prefix)
-               for net_prefix in data_fetch.NET_URL_PREFIXES):
-            # need to fetch data over network
-            thread_name = common.wait_and_fetch_net_data(
-                                     self._addon_data.content_url,
-                                     self._addon_data.raw_preinst_content_path,
-                                     self._addon_data.certificates)
-
         # pylint: disable-msg=E1101
         hubQ.send_message(self.__class__.__name__,
                           _("Fetching content data"))
         # pylint: disable-msg=E1101
         hubQ.send_not_ready(self.__class__.__name__)
-        threadMgr.add(AnacondaThread(name="OSCAPguiWaitForDataFetchThread",
-                                     target=self._init_after_data_fetch,
-                                     args=(thread_name,)))
 
-    def _init_after_data_fetch(self, wait_for):
+        self._prefetched = False
+        self._staged_content = None
+        pipeline = Pipeline(self._content_stage_done,
+                            lambda: self._content_pipeline_finished(pipeline))
+        pipeline.add_stage(STAGE_FETCH, self._fetch_content)
+        pipeline.add_stage(STAGE_FINGERPRINT, self._check_fingerprint,
+                           [STAGE_FETCH])
+        pipeline.add_stage(STAGE_EXTRACTION, self._extract_content,
+                           [STAGE_FETCH])
+        pipeline.add_stage(STAGE_COMMIT, self._commit_content,
+                           [STAGE_FINGERPRINT, STAGE_EXTRACTION])
+        pipeline.add_stage(STAGE_HANDLER, self._create_content_handler,
+                           [STAGE_COMMIT])
+        pipeline.add_stage(STAGE_PROFILES_MODELS, self._build_profiles_models,
+                           [STAGE_HANDLER])
+        pipeline.add_stage(STAGE_INITIALIZATION, self._init_after_data_fetch,
+                           [STAGE_FINGERPRINT, STAGE_HANDLER])
+        pipeline.start()
+
+    def _fetch_content(self):
+        """Fetch stage of the content pipeline."""
+
+        if self._addon_data.prefetch_started:
+            try:
+                if self._addon_data.wait_for_prefetch():
+                    # fetched, checked, extracted and loaded by the prefetch
+                    self._prefetched = True
+                    return
+            except (data_fetch.DataFetchError, common.OSCAPaddonError,
+                    content_handling.ContentHandlingError,
+                    signatures.SignatureError):
+                # try again without the prefetch, failures are reported below
+                pass
+        else:
+            # a cancelled prefetch (see OSCAPdata.clear_all) may still be
+            # writing the files
+            threadMgr.wait(common.THREAD_PREFETCH_CONTENT)
+
+        if self._is_net_content:
+            # also verifies the signature (if any)
+            self._addon_data.fetch_content()
+
+    def _check_fingerprint(self):
+        """Fingerprint check stage of the content pipeline."""
+
+        if self._prefetched or not self._addon_data.fingerprint:
+            return
+
+        hash_obj = utils.get_hashing_algorithm(self._addon_data.fingerprint)
+        digest = utils.get_file_fingerprint(\
+                                   self._addon_data.raw_preinst_content_path,
+                                   hash_obj)
+        if digest != self._addon_data.fingerprint:
+            msg = _("Integrity check failed")
+            raise content_handling.ContentCheckError(msg)
+
+    def _extract_content(self):
         """
-        Waits for data fetching to be finished, extracts it (if needed),
-        populates the stores and evaluates pre-installation fixes from the
-        content and marks the spoke as ready in the end.
+        Extraction stage of the content pipeline. Archives are extracted to a
+        staging directory the content is only committed from once its
+        integrity is checked.
 
-        :param wait_for: name of the thread to wait for (if any)
-        :type wait_for: str or None
+        """
 
+        if self._prefetched:
+            return
+
+        # RPM is an archive at this phase
+        if self._addon_data.content_type in ("archive", "rpm"):
+            self._staged_content = common.extract_data_staged(\
+                                self._addon_data.raw_preinst_content_path,
+                                common.INSTALLATION_CONTENT_DIR,
+                                [self._addon_data.xccdf_path])
+
+    def _commit_content(self):
         """
+        Commit stage of the content pipeline run once the content's integrity
+        is checked (also finds out the content handling class).
 
-        try:
-            threadMgr.wait(wait_for)
-        except data_fetch.DataFetchError:
-            self._data_fetch_failed()
-            with self._fetch_flag_lock:
-                self._fetching = False
+        """
+
+        if self._prefetched:
+            self._content_handling_cls = self._addon_data.content_handling_cls
             return
-        finally:
-            # stop the spinner in any case
-            fire_gtk_action(self._progress_spinner.stop)
-
-        if self._addon_data.fingerprint:
-            hash_obj = utils.get_hashing_algorithm(self._addon_data.fingerprint)
-            digest = utils.get_file_fingerprint(\
-                                       self._addon_data.raw_preinst_content_path,
-                                       hash_obj)
-            if digest != self._addon_data.fingerprint:
-                msg = _("Integrity check failed")
-                raise content_handling.ContentCheckError(msg)
 
         # RPM is an archive at this phase
         if self._addon_data.content_type in ("archive", "rpm"):
-            # extract the content
-            try:
-                fpaths = common.extract_data(\
-                                    self._addon_data.raw_preinst_content_path,
-                                    common.INSTALLATION_CONTENT_DIR,
-                                    [self._addon_data.xccdf_path])
-            except common.ExtractionError as err:
-                self._extraction_failed(err.message)
-                # fetching done
-                with self._fetch_flag_lock:
-                    self._fetching = False
-                return
+            staging_dir, fpaths = self._staged_content
+            self._staged_content = None
+            fpaths = common.commit_staged_data(staging_dir,
+                                               common.INSTALLATION_CONTENT_DIR,
+                                               fpaths)
 
-            # and populate missing fields
+            # populate missing fields
             self._content_handling_cls, files = \
                                  content_handling.explore_content_files(fpaths)
             files = common.strip_content_dir(files)
@@ -354,20 +542,100 @@ class OSCAPSpoke(NormalSpoke):
         else:
             raise common.OSCAPaddonError("Unsupported content type")
 
-        try:
+    def _create_content_handler(self):
+        """
+        Content handler stage of the content pipeline (also gets the data
+        streams and checklists from the content).
+
+        """
+
+        if self._prefetched:
+            self._content_handler = self._addon_data.content_handler
+        else:
             self._content_handler = self._content_handling_cls(\
                                       self._addon_data.preinst_content_path,
                                       self._addon_data.preinst_tailoring_path)
-        except content_handling.ContentHandlingError:
-            self._invalid_content()
-            # fetching done
-            with self._fetch_flag_lock:
-                self._fetching = False
+
+        if self._using_ds:
+            self._ds_checklists = self._content_handler.get_data_streams_checklists()
+
+        # models built for the previous content are no longer valid
+        with self._profiles_models_lock:
+            self._profiles_models.clear()
+
+    def _content_stage_done(self, stage, error):
+        """
+        Callback reporting the stages of the content pipeline to the hub.
+
+        :param stage: name of the finished stage
+        :type stage: str
+        :param error: error the stage failed with or None
+        :type error: Exception or None
+
+        """
+
+        if error is None and stage in STAGE_MESSAGES:
+            # pylint: disable-msg=E1101
+            hubQ.send_message(self.__class__.__name__,
+                              _(STAGE_MESSAGES[stage]))
+
+    def _content_pipeline_finished(self, pipeline):
+        """
+        Callback reporting failures of the content pipeline (if any) once all
+        its stages are finished.
+
+        :param pipeline: the finished pipeline
+        :type pipeline: org_fedora_oscap.pipeline.Pipeline
+
+        """
+
+        # stop the spinner in any case
+        fire_gtk_action(self._progress_spinner.stop)
+
+        # content not committed because of a failure (e.g. of the integrity
+        # check) must not be used
+        if self._staged_content:
+            common.discard_staged_data(self._staged_content[0])
+            self._staged_content = None
+
+        # fetching done
+        with self._fetch_flag_lock:
+            self._fetching = False
+
+        for stage in (STAGE_FETCH, STAGE_FINGERPRINT, STAGE_EXTRACTION,
+                      STAGE_COMMIT, STAGE_HANDLER, STAGE_INITIALIZATION):
+            error = pipeline.get_error(stage)
+            if error is None or isinstance(error, StageSkippedError):
+                continue
+
+            if isinstance(error, (data_fetch.DataFetchError,
+                                  common.OSCAPaddonNetworkError)):
+                self._data_fetch_failed()
+            elif isinstance(error, content_handling.ContentCheckError):
+                self._integrity_check_failed()
+            elif isinstance(error, signatures.SignatureError):
+                self._signature_check_failed()
+            elif isinstance(error, common.ExtractionError):
+                self._extraction_failed(error.message)
+            elif isinstance(error, content_handling.ContentHandlingError):
+                self._invalid_content()
+            else:
+                # unexpected error, let Anaconda's exception handling know
+                sys.excepthook(*pipeline.get_exc_info(stage))
+
+            # the first failure is the cause of the others
             return
 
+    def _init_after_data_fetch(self):
+        """
+        Initialization stage of the content pipeline. Populates the stores and
+        evaluates pre-installation fixes from the content and marks the spoke
+        as ready in the end.
+
+        """
+
         if self._using_ds:
             # populate the stores from items from the content
-            self._ds_checklists = self._content_handler.get_data_streams_checklists()
             for dstream in self._ds_checklists.iterkeys():
                 self._add_ds_id(dstream)
         else:
@@ -401,9 +669,10 @@ class OSCAPSpoke(NormalSpoke):
         hubQ.send_ready(self.__class__.__name__, True)
         hubQ.send_message(self.__class__.__name__, self.status)
 
-        # fetching done
-        with self._fetch_flag_lock:
-            self._fetching = False
+    @property
+    def _is_net_content(self):
+        return any(self._addon_data.content_url.startswith(net_prefix)
+                   for net_prefix in data_fetch.NET_URL_PREFIXES)
 
     @property
     def _using_ds(self):
@@ -451,10 +720,101 @@ class OSCAPSpoke(NormalSpoke):
         for xccdf_id in self._ds_checklists[self._current_ds_id]:
             self._xccdf_store.append([xccdf_id])
 
+    def _get_profiles_model(self, ds_id, xccdf_id, handler=None):
+        """
+        Get the model with profiles from the given data stream and checklist.
+        The model is created if it doesn't exist yet (without the store, see
+        ProfilesModel.create_store).
+
+        :param ds_id: data stream ID or None if not using a data stream
+        :type ds_id: str or None
+        :param xccdf_id: checklist ID or None if not using a data stream
+        :type xccdf_id: str or None
+        :param handler: content handler to get the profiles from or None to use
+                        the current one
+        :return: the model or None if the handler is no longer the current one
+        :rtype: ProfilesModel or None
+
+        """
+
+        if handler is None:
+            handler = self._content_handler
+        model_id = (ds_id, xccdf_id)
+
+        # the lock also serializes the content handler's queries
+        with self._profiles_models_lock:
+            if handler is not self._content_handler:
+                # content changed in the meantime
+                return None
+
+            if model_id in self._profiles_models:
+                return self._profiles_models[model_id]
+
+            if ds_id is None:
+                # pylint: disable-msg=E1103
+                profiles = handler.profiles
+            else:
+                profiles = handler.get_profiles(ds_id, xccdf_id)
+
+            model = ProfilesModel(profiles)
+            self._profiles_models[model_id] = model
+
+        return model
+
+    def _build_profiles_models(self):
+        """
+        Profiles models stage of the content pipeline. Builds the models with
+        profiles for all the checklists so that switching between them is
+        instantaneous (only the rows, the stores are created and populated in
+        the main thread when the models are shown).
+
+        """
+
+        handler = self._content_handler
+        if self._using_ds:
+            checklists = [(ds_id, xccdf_id)
+                          for (ds_id, xccdf_ids) in self._ds_checklists.iteritems()
+                          for xccdf_id in xccdf_ids]
+        else:
+            checklists = [(None, None)]
+
+        for (ds_id, xccdf_id) in checklists:
+            if self._get_profiles_model(ds_id, xccdf_id, handler) is None:
+                # content changed, the models are no longer needed
+                return
+
+    def _add_profiles_chunk(self, model):
+        """
+        Add a chunk of rows to the given model (displayed in the profiles
+        view). Used as an idle callback.
+
+        :param model: the model to add the rows to
+        :type model: ProfilesModel
+        :return: whether to be called again or not
+        :rtype: bool
+
+        """
+
+        with self._profiles_models_lock:
+            if model not in self._profiles_models.itervalues():
+                # content changed, no longer needed
+                return False
+            more_rows = model.add_rows(self._marked_profile,
+                                       PROFILES_CHUNK_SIZE)
+
+        if model is self._profiles_model and \
+                self._profile_to_select in model.rows:
+            self._set_profiles_selection(self._profile_to_select)
+
+        return more_rows
+
     def _update_profiles_store(self):
         """
-        Clears and repopulates the store with profiles from the currently
-        selected data stream and checklist.
+        Swaps the profiles view's model to the one with profiles from the
+        currently selected data stream and checklist (its store is created
+        if it is shown for the first time). Rows of a model that is not fully
+        populated yet are added in chunks. Needs to be called in the main
+        thread.
 
         """
 
@@ -466,21 +826,108 @@ class OSCAPSpoke(NormalSpoke):
             # not initialized, cannot do anything
             return
 
-        self._profiles_store.clear()
-
         if self._using_ds:
-            profiles = self._content_handler.get_profiles(self._current_ds_id,
-                                                     self._current_xccdf_id)
+            model = self._get_profiles_model(self._current_ds_id,
+                                             self._current_xccdf_id)
         else:
-            # pylint: disable-msg=E1103
-            profiles = self._content_handler.profiles
+            model = self._get_profiles_model(None, None)
 
-        for profile in profiles:
-            profile_markup = '<span weight="bold">%s</span>\n%s' \
-                                % (profile.title, profile.description)
-            self._profiles_store.append([profile.id,
-                                         profile_markup,
-                                         profile.id == self._active_profile])
+        if model.store is None:
+            with self._profiles_models_lock:
+                model.create_store(self._profile_visible)
+
+        self._profiles_model = model
+        self._profiles_store = model.store
+
+        # the search text may have changed since the model was shown
+        model.filter.refilter()
+        self._profiles_view.set_model(model.filter)
+
+        # first rows right away, the rest when idle
+        if not model.populated and self._add_profiles_chunk(model):
+            GLib.idle_add(self._add_profiles_chunk, model)
+
+    def _profile_visible(self, store, itr, model):
+        """
+        Visible function of the profiles filter models.
+
+        :param model: the model the store belongs to
+        :type model: ProfilesModel
+        :return: whether the profile in the row matches the searched text
+        :rtype: bool
+
+        """
+
+        if not self._profiles_search:
+            return True
+
+        search_text = model.search_index.get(store[itr][0])
+        return search_text is not None and self._profiles_search in search_text
+
+    def _get_profile_path(self, profile_id):
+        """
+        Get the path of the given profile's row in the profiles view.
+
+        :param profile_id: ID of the profile
+        :type profile_id: str
+        :return: path of the row or None if the profile is not in the view
+        :rtype: Gtk.TreePath or None
+
+        """
+
+        if self._profiles_model is None:
+            return None
+
+        row_ref = self._profiles_model.rows.get(profile_id)
+        if row_ref is None or not row_ref.valid():
+            return None
+
+        return self._profiles_model.filter.convert_child_path_to_path(
+                                                           row_ref.get_path())
+
+    def _mark_profile(self, profile_id):
+        """
+        Mark the given profile as selected (and the previously marked one as
+        not selected) in all the profiles models.
+
+        :param profile_id: ID of the profile or None to just unmark
+        :type profile_id: str or None
+
+        """
+
+        with self._profiles_models_lock:
+            for model in self._profiles_models.itervalues():
+                for (item, selected) in ((self._marked_profile, False),
+                                         (profile_id, True)):
+                    row_ref = model.rows.get(item)
+                    if row_ref is not None and row_ref.valid():
+                        model.store[row_ref.get_path()][2] = selected
+
+            self._marked_profile = profile_id
+
+    def _set_profiles_selection(self, profile_id):
+        """
+        Select the given profile's row in the profiles view. If the row is not
+        added yet, it is selected once it is.
+
+        :param profile_id: ID of the profile
+        :type profile_id: str
+
+        """
+
+        model = self._profiles_model
+        if model and not model.populated and profile_id not in model.rows:
+            # row not added yet
+            self._profile_to_select = profile_id
+            return
+
+        self._profile_to_select = None
+        path = self._get_profile_path(profile_id)
+        if path is None:
+            return
+
+        self._profiles_selection.select_path(path)
+        self._profiles_view.scroll_to_cell(path, None, True, 0.5, 0.0)
 
     def _add_message(self, message):
         """
@@ -529,6 +976,27 @@ class OSCAPSpoke(NormalSpoke):
         for msg in messages:
             self._add_message(msg)
 
+    def _get_status_inputs(self):
+        """
+        Get a snapshot of all the values the status (the rule evaluation)
+        depends on.
+
+        :return: snapshot of the values or None if they are not known and the
+                 status has to be evaluated
+        :rtype: tuple or None
+
+        """
+
+        if self._addon_data.dry_run or not self._rule_data:
+            # no rule evaluation, the status is given by the message store
+            return None
+
+        inputs = self._rule_data.get_inputs(self.data, self._storage)
+        if inputs is None:
+            return None
+
+        return (self._rule_data, self._active_profile, inputs)
+
     @gtk_action_wait
     def _unselect_profile(self, profile_id):
         """Unselects the given profile."""
@@ -537,11 +1005,8 @@ class OSCAPSpoke(NormalSpoke):
             # no profile specified, nothing to do
             return
 
-        itr = self._profiles_store.get_iter_first()
-        while itr:
-            if self._profiles_store[itr][0] == profile_id:
-                self._profiles_store.set_value(itr, 2, False)
-            itr = self._profiles_store.iter_next(itr)
+        if profile_id == self._marked_profile:
+            self._mark_profile(None)
 
         if self._rule_data:
             # revert changes and clear rule_data (no longer valid)
@@ -558,11 +1023,7 @@ class OSCAPSpoke(NormalSpoke):
             # no profile specified, nothing to do
             return
 
-        itr = self._profiles_store.get_iter_first()
-        while itr:
-            if self._profiles_store[itr][0] == profile_id:
-                self._profiles_store.set_value(itr, 2, True)
-            itr = self._profiles_store.iter_next(itr)
+        self._mark_profile(profile_id)
 
         if self._using_ds:
             ds = self._current_ds_id
@@ -575,16 +1036,15 @@ class OSCAPSpoke(NormalSpoke):
             ds = None
             xccdf = None
 
-        # get pre-install fix rules from the content
-        rules = common.get_fix_rules_pre(profile_id,
-                                         self._addon_data.preinst_content_path,
-                                         ds, xccdf,
-                                         self._addon_data.preinst_tailoring_path)
+        with timing.span("fix generation"):
+            # get pre-install fix rules from the content (parsed as they come)
+            rules = common.iter_fix_rules_pre(profile_id,
+                                        self._addon_data.preinst_content_path,
+                                        ds, xccdf,
+                                        self._addon_data.preinst_tailoring_path)
 
-        # parse and store rules with a clean RuleData instance
-        self._rule_data = rule_handling.RuleData()
-        for rule in rules.splitlines():
-            self._rule_data.new_rule(rule)
+            # parse and store rules with a clean RuleData instance
+            self._rule_data = rule_handling.RuleData.from_text(rules)
 
         # remember the active profile
         self._active_profile = profile_id
@@ -622,6 +1082,24 @@ class OSCAPSpoke(NormalSpoke):
                                         "please."))
         self._wrong_content()
 
+    @gtk_action_wait
+    def _integrity_check_failed(self):
+        """Adapts the UI if the integrity check of the content failed"""
+
+        self._progress_label.set_markup("<b>%s</b>" % _("Integrity check of "
+                                        "the content failed. Enter a "
+                                        "different URL, please."))
+        self._wrong_content()
+
+    @gtk_action_wait
+    def _signature_check_failed(self):
+        """Adapts the UI if the signature verification of the content failed"""
+
+        self._progress_label.set_markup("<b>%s</b>" % _("Signature "
+                                        "verification of the content failed. "
+                                        "Enter a different URL, please."))
+        self._wrong_content()
+
     @gtk_action_wait
     def _extraction_failed(self, err_msg):
         """Adapts the UI if extracting data from entered URL failed"""
@@ -717,6 +1195,7 @@ class OSCAPSpoke(NormalSpoke):
         self._switch_dry_run(dry_run)
 
         self._active_profile = self._addon_data.profile_id
+        self._mark_profile(self._active_profile)
 
         if self._using_ds:
             if self._addon_data.datastream_id:
@@ -738,8 +1217,7 @@ class OSCAPSpoke(NormalSpoke):
             self._update_profiles_store()
 
         if self._addon_data.profile_id:
-            set_treeview_selection(self._profiles_view,
-                                   self._addon_data.profile_id)
+            self._set_profiles_selection(self._addon_data.profile_id)
 
         self._rule_data = self._addon_data.rule_data
 
@@ -821,8 +1299,30 @@ class OSCAPSpoke(NormalSpoke):
         if not self._addon_data.content_defined:
             return _("No content found")
 
+        # nothing changed from the last evaluation, no need to do it again
+        inputs = self._get_status_inputs()
+        if inputs is not None and self._status_cache and \
+                self._status_cache[0] == inputs:
+            return self._status_cache[1]
+
         # update message store, something may changed from the last update
         self._update_message_store(report_only=True)
+        status = self._get_store_status()
+
+        if inputs is not None:
+            self._status_cache = (inputs, status)
+        else:
+            self._status_cache = None
+
+        return status
+
+    def _get_store_status(self):
+        """
+        Get the status string given by the messages in the message store.
+
+        :rtype: str
+
+        """
 
         warning_found = False
         for row in self._message_store:
@@ -850,9 +1350,16 @@ class OSCAPSpoke(NormalSpoke):
     def on_xccdf_combo_changed(self, *args):
         """Handler for the XCCDF ID change."""
 
-        # may take a while
+        # just swaps the prebuilt model (if already built)
         self._update_profiles_store()
 
+    def on_profiles_search_changed(self, entry, *args):
+        """Handler for the change of the text profiles are searched for."""
+
+        self._profiles_search = _to_search_text(entry.get_text())
+        if self._profiles_model:
+            self._profiles_model.filter.refilter()
+
     @dry_run_skip
     def on_profiles_selection_changed(self, *args):
         """Handler for the profile selection change."""
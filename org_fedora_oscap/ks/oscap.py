@@ -20,17 +20,25 @@
 
 """Module with the OSCAPdata class."""
 
-import shutil
+import os
 import re
+import copy
+import threading
 
 from pyanaconda.addons import AddonData
 from pyanaconda.iutil import getSysroot
-from pyanaconda import iutil
+from pyanaconda.progress import progressQ
+from pyanaconda.threads import threadMgr, AnacondaThread
 from pykickstart.errors import KickstartParseError, KickstartValueError
-from org_fedora_oscap import utils, common, rule_handling
+from org_fedora_oscap import utils, common, rule_handling, tool_runner
+from org_fedora_oscap import timing, data_fetch, content_handling, signatures
+from org_fedora_oscap import transfer
 from org_fedora_oscap.common import SUPPORTED_ARCHIVES
 from org_fedora_oscap.content_handling import ContentCheckError
 
+import gettext
+_ = lambda x: gettext.ldgettext("oscap-anaconda-addon", x)
+
 # export OSCAPdata class to prevent Anaconda's collect method from taking
 # AddonData class instead of the OSCAPdata class
 # @see: pyanaconda.kickstart.AnacondaKSHandler.__init__
@@ -48,6 +56,20 @@ REQUIRED_PACKAGES = ("openscap", "openscap-utils", )
 
 FINGERPRINT_REGEX = re.compile(r'^[a-z0-9]+$')
 
+# how long the prefetch waits for the network connection (in seconds) and how
+# often it checks it, the kickstart is parsed before NM starts connecting
+PREFETCH_NETWORK_TIMEOUT = 120
+PREFETCH_NETWORK_CHECK_INTERVAL = 2
+
+# values set by the content preparation (see OSCAPdata.prepare_content)
+PREPARED_ATTRS = ("xccdf_path", "cpe_path", "tailoring_path",
+                  "content_handler", "content_handling_cls")
+
+# errors of the content preparation (see OSCAPdata.prepare_content)
+CONTENT_ERRORS = (data_fetch.DataFetchError, common.OSCAPaddonError,
+                  content_handling.ContentHandlingError,
+                  signatures.SignatureError)
+
 class MisconfigurationError(common.OSCAPaddonError):
     """Exception for reporting misconfiguration."""
 
@@ -88,10 +110,40 @@ class OSCAPdata(AddonData):
         # certificate to verify HTTPS connection or signed data
         self.certificates = ""
 
+        # URL of the detached signature (OpenPGP or CMS) of the content, if
+        # given, the certificates (or OpenPGP keyring) are used to verify it
+        self.signature = ""
+
+        # number of groups of fixes run concurrently (1 means the fixes are
+        # run by the oscap tool one after another)
+        self.remediation_jobs = 1
+
+        # directory with the remediation results shared by many installations
+        # (the recorded fixes are replayed on the installations with the same
+        # content, profile, tailoring and packages), it has to be on a
+        # persistent storage mounted by the administrator (nothing in the
+        # installation environment survives between the installations) and
+        # owned by root and not writable by the group or others
+        self.remediation_cache = ""
+
         ## internal values
         self.rule_data = rule_handling.RuleData()
         self.dry_run = False
 
+        # content handler (and its class) for the content prepared by the
+        # prefetch started when the %addon section is parsed
+        self.content_handler = None
+        self.content_handling_cls = None
+
+        # (content type, content URL) of the prefetched content, the error
+        # the prefetch failed with (if any) and the event cancelling it
+        self._prefetch_id = None
+        self._prefetch_error = None
+        self._prefetch_cancelled = None
+        if not just_clear:
+            # guards the results of the prefetch
+            self._prefetch_lock = threading.Lock()
+
     def __str__(self):
         """
         What should end up in the resulting kickstart file, i.e. string
@@ -129,6 +181,17 @@ class OSCAPdata(AddonData):
         if self.certificates:
             ret += "\n%s" % key_value_pair("certificates", self.certificates)
 
+        if self.signature:
+            ret += "\n%s" % key_value_pair("signature", self.signature)
+
+        if self.remediation_jobs != 1:
+            ret += "\n%s" % key_value_pair("remediation-jobs",
+                                           self.remediation_jobs)
+
+        if self.remediation_cache:
+            ret += "\n%s" % key_value_pair("remediation-cache",
+                                           self.remediation_cache)
+
         ret += "\n%end"
         return ret
 
@@ -187,6 +250,34 @@ class OSCAPdata(AddonData):
     def _parse_certificates(self, value):
         self.certificates = value
 
+    def _parse_signature(self, value):
+        if any(value.startswith(prefix)
+               for prefix in SUPPORTED_URL_PREFIXES):
+            self.signature = value
+        else:
+            msg = "Unsupported signature url '%s' in the %s addon" % (value,
+                                                                      self.name)
+            raise KickstartValueError(msg)
+
+    def _parse_remediation_jobs(self, value):
+        try:
+            jobs = int(value)
+        except ValueError:
+            jobs = 0
+
+        if jobs < 1:
+            msg = "Invalid number of remediation jobs '%s'" % value
+            raise KickstartValueError(msg)
+
+        self.remediation_jobs = jobs
+
+    def _parse_remediation_cache(self, value):
+        if not value.startswith("/"):
+            msg = "Remediation cache '%s' is not an absolute path" % value
+            raise KickstartValueError(msg)
+
+        self.remediation_cache = value
+
     def handle_line(self, line):
         """
         The handle_line method that is called with every line from this addon's
@@ -207,6 +298,9 @@ class OSCAPdata(AddonData):
                     "tailoring-path": self._parse_tailoring_path,
                     "fingerprint": self._parse_fingerprint,
                     "certificates": self._parse_certificates,
+                    "signature": self._parse_signature,
+                    "remediation-jobs": self._parse_remediation_jobs,
+                    "remediation-cache": self._parse_remediation_cache,
                     }
 
         line = line.strip()
@@ -266,6 +360,263 @@ class OSCAPdata(AddonData):
 
             self.xccdf_path = common.SSG_DIR + common.SSG_XCCDF
 
+        if self.signature:
+            if self.content_type == "scap-security-guide":
+                msg = "Signature cannot be verified for the SCAP Security Guide"
+                raise KickstartValueError(msg)
+            if not self.certificates:
+                msg = "%s (needed for the signature verification)" % \
+                      (tmpl % ("certificates", self.name))
+                raise KickstartValueError(msg)
+
+        # get the content ready while the rest of the installer is being set up
+        self.start_prefetch()
+
+    def start_prefetch(self):
+        """
+        Start preparing the content (see prepare_content) in a background
+        thread so that it is ready when the spoke or the setup method need it.
+
+        """
+
+        if threadMgr.get(common.THREAD_PREFETCH_CONTENT):
+            # some content already being prefetched
+            return
+
+        self._prefetch_id = (self.content_type, self.content_url)
+        self._prefetch_error = None
+        self._prefetch_cancelled = threading.Event()
+        threadMgr.add(AnacondaThread(name=common.THREAD_PREFETCH_CONTENT,
+                                     target=self._prefetch_content,
+                                     args=(copy.copy(self),
+                                           self._prefetch_cancelled),
+                                     fatal=False))
+
+    def _prefetch_content(self, data, cancelled):
+        """
+        Target of the prefetch thread. The content is prepared with a copy of
+        the data and the results are only taken if the prefetch was not
+        cancelled in the meantime (see clear_all).
+
+        :param data: copy of the data made when the prefetch was started
+        :type data: OSCAPdata
+        :param cancelled: event set if the prefetch is no longer needed
+        :type cancelled: threading.Event
+
+        """
+
+        error = None
+        try:
+            with timing.span("prefetch"):
+                if data._is_net_content:
+                    self._wait_for_network(cancelled)
+                data.prepare_content()
+        except CONTENT_ERRORS as err:
+            # reported by wait_for_prefetch
+            error = err
+
+        with self._prefetch_lock:
+            if cancelled.is_set():
+                # the values were cleared, the results are of no use
+                return
+            if error:
+                self._prefetch_error = error
+            else:
+                for attr in PREPARED_ATTRS:
+                    setattr(self, attr, getattr(data, attr))
+
+    @staticmethod
+    def _wait_for_network(cancelled):
+        """
+        Wait for the network connection needed to prefetch the content. NM may
+        not even be connecting when the prefetch is started.
+
+        :param cancelled: event set if the prefetch is no longer needed
+        :type cancelled: threading.Event
+        :raise OSCAPaddonNetworkError: if there is no network connection in
+                                       time
+
+        """
+
+        deadline = timing.monotonic() + PREFETCH_NETWORK_TIMEOUT
+        while True:
+            try:
+                common.wait_for_network()
+                return
+            except common.OSCAPaddonNetworkError:
+                if cancelled.is_set() or timing.monotonic() >= deadline:
+                    raise
+                cancelled.wait(PREFETCH_NETWORK_CHECK_INTERVAL)
+
+    @property
+    def prefetch_started(self):
+        """Whether the prefetch of the current content was started or not."""
+
+        return self._prefetch_id == (self.content_type, self.content_url)
+
+    def wait_for_prefetch(self):
+        """
+        Wait for the prefetch of the content to finish.
+
+        :return: whether the current content was prepared by the prefetch
+        :rtype: bool
+        :raise: the error the prefetch of the current content failed with (the
+                prefetch is forgotten, so the error is raised only once)
+
+        """
+
+        threadMgr.wait(common.THREAD_PREFETCH_CONTENT)
+
+        if not self.prefetch_started:
+            return False
+
+        if self._prefetch_error:
+            err = self._prefetch_error
+            self._prefetch_id = None
+            self._prefetch_error = None
+            raise err
+
+        return True
+
+    def prepare_content(self):
+        """
+        Fetch the content (if needed), check its fingerprint, extract it (if
+        it is an archive or RPM), find the content files and create the
+        content handler.
+
+        :raise DataFetchError: if the content cannot be fetched
+        :raise SignatureError: if the signature verification fails
+        :raise ContentCheckError: if the fingerprint check fails
+        :raise ExtractionError: if the content cannot be extracted
+        :raise ContentHandlingError: if the content cannot be loaded
+
+        """
+
+        if self._is_net_content:
+            self.fetch_content()
+
+        # RPM is an archive at this phase
+        if self.content_type in ("archive", "rpm"):
+            # the fingerprint is checked while the archive is being extracted
+            # (to a staging directory the data is only moved from if the
+            # check passes)
+            fpaths = common.extract_data_verified(self.raw_preinst_content_path,
+                                                  common.INSTALLATION_CONTENT_DIR,
+                                                  [self.xccdf_path],
+                                                  self._check_fingerprint)
+
+            # populate missing fields
+            content_cls, files = content_handling.explore_content_files(fpaths)
+            files = common.strip_content_dir(files)
+
+            # pylint: disable-msg=E1103
+            self.xccdf_path = self.xccdf_path or files.xccdf
+            self.cpe_path = self.cpe_path or files.cpe
+            self.tailoring_path = self.tailoring_path or files.tailoring
+
+            if content_cls is None:
+                msg = "No content found in '%s'" % self.content_url
+                raise content_handling.ContentHandlingError(msg)
+        elif self.content_type == "datastream":
+            self._check_fingerprint()
+            content_cls = content_handling.DataStreamHandler
+        else:
+            self._check_fingerprint()
+            content_cls = content_handling.BenchmarkHandler
+
+        self.content_handler = content_cls(self.preinst_content_path,
+                                           self.preinst_tailoring_path)
+        self.content_handling_cls = content_cls
+
+    @property
+    def _is_net_content(self):
+        """Whether the content needs to be fetched over the network or not."""
+
+        return self.content_type != "scap-security-guide" and \
+            any(self.content_url.startswith(net_prefix)
+                for net_prefix in data_fetch.NET_URL_PREFIXES)
+
+    @property
+    def ca_certs(self):
+        """
+        CA certificates the server certificate should be validated with when
+        fetching data over HTTPS (or None for the default ones)
+
+        """
+
+        if self.signature:
+            # the certificates (or OpenPGP keys) are there for the signature
+            # verification
+            return None
+
+        return self.certificates
+
+    def fetch_content(self):
+        """
+        Fetch the content and its signature (if given). The signature is
+        verified and the digest for the fingerprint check computed as the
+        content is being downloaded, i.e. without extra passes over the
+        content file.
+
+        :raise DataFetchError: if the content or its signature cannot be
+                               fetched
+        :raise SignatureError: if the signature verification fails
+
+        """
+
+        common.wait_for_network()
+
+        hash_objs = []
+        if self.fingerprint:
+            hash_objs.append(utils.get_hashing_algorithm(self.fingerprint))
+
+        consumers = list(hash_objs)
+        verifier = None
+        if self.signature:
+            data_fetch.fetch_data(self.signature,
+                                  self.raw_preinst_signature_path,
+                                  self.ca_certs)
+            verifier = signatures.SignatureVerifier(\
+                                            self.raw_preinst_signature_path,
+                                            self.certificates)
+            consumers.append(verifier)
+
+        try:
+            data_fetch.fetch_data(self.content_url,
+                                  self.raw_preinst_content_path,
+                                  self.ca_certs,
+                                  consumers)
+        except:
+            if verifier:
+                verifier.abort()
+            raise
+
+        if verifier:
+            with timing.span("signature verification"):
+                verifier.verify()
+
+        if hash_objs:
+            # the fingerprint check doesn't need to read the content again
+            utils.cache_file_digests(self.raw_preinst_content_path, hash_objs)
+
+    def _check_fingerprint(self):
+        """
+        Check the fingerprint of the raw content (if given).
+
+        :raise ContentCheckError: if the fingerprint doesn't match
+
+        """
+
+        if not self.fingerprint:
+            return
+
+        hash_obj = utils.get_hashing_algorithm(self.fingerprint)
+        digest = utils.get_file_fingerprint(self.raw_preinst_content_path,
+                                            hash_obj)
+        if digest != self.fingerprint:
+            msg = "Integrity check of the content failed!"
+            raise ContentCheckError(msg)
+
     @property
     def content_defined(self):
         return self.content_url or self.content_type == "scap-security-guide"
@@ -290,6 +641,13 @@ class OSCAPdata(AddonData):
         return utils.join_paths(common.INSTALLATION_CONTENT_DIR,
                                 self.content_name)
 
+    @property
+    def raw_preinst_signature_path(self):
+        """Path to the pre-installation detached signature of the content"""
+
+        return utils.join_paths(common.INSTALLATION_CONTENT_DIR,
+                                self.signature.rsplit("/", 1)[-1])
+
     @property
     def raw_postinst_content_path(self):
         """Path to the raw (unextracted, ...) post-installation content file"""
@@ -365,14 +723,19 @@ class OSCAPdata(AddonData):
 
         """
 
+        # content being prepared since the %addon section was parsed (the
+        # fingerprint is checked as part of that)
+        try:
+            prefetched = self.wait_for_prefetch()
+        except CONTENT_ERRORS:
+            # try again without the prefetch (e.g. there was no network
+            # connection yet), failures are fatal now
+            self.prepare_content()
+            prefetched = True
+
         # check fingerprint if given
-        if self.fingerprint:
-            hash_obj = utils.get_hashing_algorithm(self.fingerprint)
-            digest = utils.get_file_fingerprint(self.raw_preinst_content_path,
-                                                hash_obj)
-            if digest != self.fingerprint:
-                msg = "Integrity check of the content failed!"
-                raise ContentCheckError(msg)
+        if not prefetched:
+            self._check_fingerprint()
 
         if self.dry_run:
             # nothing more to be done in the dry-run mode
@@ -385,14 +748,38 @@ class OSCAPdata(AddonData):
                for message in messages):
             raise MisconfigurationError("Wrong configuration detected!")
 
+        # the lists are changed only through these until the end of the method
+        package_list = rule_handling.IndexedList(ksdata.packages.packageList)
+        excluded_list = rule_handling.IndexedList(ksdata.packages.excludedList)
+
         # add packages needed on the target system to the list of packages
         # that are requested to be installed
         pkgs_to_install = list(REQUIRED_PACKAGES)
         if self.content_type == "scap-security-guide":
             pkgs_to_install.append("scap-security-guide")
         for pkg in pkgs_to_install:
-            if pkg not in ksdata.packages.packageList:
-                ksdata.packages.packageList.append(pkg)
+            if pkg not in package_list:
+                package_list.append(pkg)
+
+        # install/remove packages the post-installation fixes would install
+        # or remove in the installation transaction
+        try:
+            add_pkgs, remove_pkgs = common.get_package_fixes(self.profile_id,
+                                                self.preinst_content_path,
+                                                self.datastream_id,
+                                                self.xccdf_id,
+                                                self.preinst_tailoring_path)
+        except common.OSCAPaddonError:
+            # not fatal, the fixes will be done by the remediation
+            add_pkgs, remove_pkgs = set(), set()
+
+        for pkg in sorted(add_pkgs):
+            if pkg not in package_list:
+                package_list.append(pkg)
+        for pkg in sorted(remove_pkgs):
+            # explicitly requested packages have priority
+            if pkg not in package_list and pkg not in excluded_list:
+                excluded_list.append(pkg)
 
     def execute(self, storage, ksdata, instclass, users):
         """
@@ -409,35 +796,123 @@ class OSCAPdata(AddonData):
             # nothing to be done in the dry-run mode
             return
 
-        target_content_dir = utils.join_paths(getSysroot(),
-                                              common.TARGET_CONTENT_DIR)
-        utils.ensure_dir_exists(target_content_dir)
+        try:
+            with timing.span("content copy"):
+                target_content_dir = utils.join_paths(getSysroot(),
+                                                      common.TARGET_CONTENT_DIR)
+                utils.ensure_dir_exists(target_content_dir)
+
+                if self.content_type == "datastream":
+                    transfer.transfer_files(common.INSTALLATION_CONTENT_DIR,
+                                            [self.content_name],
+                                            target_content_dir)
+                elif self.content_type == "rpm":
+                    # copy the RPM to the target system
+                    transfer.transfer_files(common.INSTALLATION_CONTENT_DIR,
+                                            [self.content_name],
+                                            target_content_dir)
+
+                    # and install it with yum
+                    # (yum's output goes to the program log)
+                    try:
+                        tool_runner.run_tool(["yum", "-y", "install",
+                                              self.raw_postinst_content_path],
+                                             merge_stderr=True,
+                                             root=getSysroot())
+                    except tool_runner.ToolRunError as err:
+                        raise common.ExtractionError("Failed to install content "
+                                                     "RPM to the target system: "
+                                                     "%s" % err)
+                elif self.content_type == "archive":
+                    transfer.transfer_files(common.INSTALLATION_CONTENT_DIR,
+                                            self._get_files_to_transfer(),
+                                            target_content_dir)
+
+            with timing.span("remediation"):
+                if self.remediation_cache:
+                    packages = list(ksdata.packages.packageList)
+                    packages.extend("-" + pkg for pkg in ksdata.packages.excludedList)
+                    packages.extend("@" + group.name
+                                    for group in ksdata.packages.groupList)
+                    common.run_oscap_remediate_cached(self.profile_id,
+                                             self.postinst_content_path,
+                                             self.remediation_cache, packages,
+                                             self.datastream_id, self.xccdf_id,
+                                             self.postinst_tailoring_path,
+                                             chroot=getSysroot(),
+                                             jobs=self.remediation_jobs,
+                                             progress_cb=self._report_remediation_progress)
+                elif self.remediation_jobs > 1:
+                    common.run_oscap_remediate_parallel(self.profile_id,
+                                             self.postinst_content_path,
+                                             self.datastream_id, self.xccdf_id,
+                                             self.postinst_tailoring_path,
+                                             chroot=getSysroot(),
+                                             jobs=self.remediation_jobs,
+                                             progress_cb=self._report_remediation_progress)
+                else:
+                    common.run_oscap_remediate(self.profile_id, self.postinst_content_path,
+                                               self.datastream_id, self.xccdf_id,
+                                               self.postinst_tailoring_path, chroot=getSysroot(),
+                                               progress_cb=self._report_remediation_progress)
+        finally:
+            # the timeline of the addon's phases next to the results
+            timeline_path = utils.join_paths(getSysroot(), common.TIMELINE_PATH)
+            try:
+                timing.write_timeline(timeline_path)
+            except IOError:
+                # just instrumentation, not worth failing the installation
+                timing.write_timeline()
+            tool_runner.log_tool_stats()
+
+    def _get_files_to_transfer(self):
+        """
+        Get the files from the extracted archive needed on the target system,
+        i.e. the content files and the files they reference (not the rest of
+        the archive). Everything is needed if the references cannot be found
+        out.
 
-        if self.content_type == "datastream":
-            shutil.copy2(self.preinst_content_path, target_content_dir)
-        elif self.content_type == "rpm":
-            # copy the RPM to the target system
-            shutil.copy2(self.raw_preinst_content_path, target_content_dir)
-
-            # and install it with yum
-            ret = iutil.execInSysroot("yum", ["-y", "install",
-                                              self.raw_postinst_content_path])
-            if ret != 0:
-                raise common.ExtractionError("Failed to install content "
-                                             "RPM to the target system")
-        elif self.content_type == "scap-security-guide":
-            # nothing needed
-            pass
-        else:
-            utils.universal_copy(utils.join_paths(common.INSTALLATION_CONTENT_DIR,
-                                              "*"),
-                                 target_content_dir)
+        :return: paths of the files relative to the installation content
+                 directory
+        :rtype: list of strings
+
+        """
+
+        content_dir = os.path.normpath(common.INSTALLATION_CONTENT_DIR)
+        fpaths = set(utils.join_paths(content_dir, path)
+                     for path in (self.xccdf_path, self.cpe_path,
+                                  self.tailoring_path)
+                     if path)
+        try:
+            for fpath in list(fpaths):
+                fpaths.update(content_handling.get_referenced_files(fpath))
+        except content_handling.ContentHandlingError:
+            return os.listdir(content_dir)
+
+        return sorted(os.path.relpath(fpath, content_dir) for fpath in fpaths
+                      if fpath.startswith(content_dir + os.path.sep))
+
+    def _report_remediation_progress(self, progress):
+        """
+        Report progress of the evaluation and remediation to the installer.
+
+        :param progress: progress of the evaluation and remediation
+        :type progress: common.RemediationProgress
+
+        """
 
-        common.run_oscap_remediate(self.profile_id, self.postinst_content_path,
-                                   self.datastream_id, self.xccdf_id,
-                                   self.postinst_tailoring_path, chroot=getSysroot())
+        # pylint: disable-msg=E1101
+        msg = _("Applying security policy: %(done)d rules processed "
+                "(%(elapsed)d s)") % { "done": progress.done,
+                                       "elapsed": progress.elapsed }
+        progressQ.send_message(msg)
 
     def clear_all(self):
         """Clear all the stored values."""
 
-        self.__init__(self.name, just_clear=True)
+        # no waiting for the prefetch (called from the GUI), its results are
+        # just ignored
+        with self._prefetch_lock:
+            if self._prefetch_cancelled:
+                self._prefetch_cancelled.set()
+            self.__init__(self.name, just_clear=True)
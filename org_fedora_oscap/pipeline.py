@@ -0,0 +1,198 @@
+#
+# Copyright (C) 2013  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+
+"""
+Module with a simple pipeline of stages (functions) with explicit
+dependencies. Every stage is run in its own thread as soon as all the stages
+it depends on are finished, so independent stages run concurrently.
+
+"""
+
+import sys
+import threading
+
+from collections import OrderedDict
+
+# everything else should be private
+__all__ = ["PipelineError", "StageSkippedError", "Pipeline"]
+
+class PipelineError(Exception):
+    """Base class for the pipeline errors."""
+
+    pass
+
+class StageSkippedError(PipelineError):
+    """Exception for stages not run because a stage they depend on failed."""
+
+    pass
+
+class _Stage(object):
+    """Class holding a stage of the pipeline and the outcome of its run."""
+
+    __slots__ = ("name", "func", "deps", "result", "exc_info", "done")
+
+    def __init__(self, name, func, deps):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.result = None
+        self.exc_info = None
+        self.done = threading.Event()
+
+class Pipeline(object):
+    """Class running the stages in threads respecting their dependencies."""
+
+    def __init__(self, stage_done_cb=None, finished_cb=None):
+        """
+        :param stage_done_cb: function called (in the stage's thread) with the
+                              name of a stage and the exception it failed with
+                              or None once it is finished
+        :type stage_done_cb: (str, Exception or None) -> None
+        :param finished_cb: function called (in the last stage's thread) once
+                            all the stages are finished
+        :type finished_cb: () -> None
+
+        """
+
+        self._stages = OrderedDict()
+        self._stage_done_cb = stage_done_cb
+        self._finished_cb = finished_cb
+        self._threads = []
+        self._lock = threading.Lock()
+        self._running = 0
+
+    def add_stage(self, name, func, deps=()):
+        """
+        Add a stage to the pipeline.
+
+        :param name: unique name of the stage
+        :type name: str
+        :param func: function run by the stage (with no arguments), its return
+                     value is the stage's result
+        :type func: () -> object
+        :param deps: names of the (previously added) stages this one depends
+                     on
+        :type deps: iterable of strings
+        :raise ValueError: if the name is not unique or a dependency is unknown
+
+        """
+
+        if name in self._stages:
+            raise ValueError("Stage '%s' already in the pipeline" % name)
+
+        deps = tuple(deps)
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError("Unknown stage '%s' required by '%s'"
+                                 % (dep, name))
+
+        self._stages[name] = _Stage(name, func, deps)
+
+    def start(self):
+        """Start running the stages (each in its own thread)."""
+
+        with self._lock:
+            self._running = len(self._stages)
+
+        for stage in self._stages.itervalues():
+            thread = threading.Thread(name="OSCAPpipeline-%s" % stage.name,
+                                      target=self._run_stage, args=(stage,))
+            thread.daemon = True
+            self._threads.append(thread)
+            thread.start()
+
+    def wait(self):
+        """Wait for all the stages to finish."""
+
+        for thread in self._threads:
+            thread.join()
+
+    def run(self):
+        """Run all the stages and wait for them to finish."""
+
+        self.start()
+        self.wait()
+
+    def get_result(self, name):
+        """
+        :return: result of the given (finished) stage
+        :raise: the exception the stage failed with (StageSkippedError if it
+                was skipped)
+
+        """
+
+        stage = self._stages[name]
+        if stage.exc_info is not None:
+            raise stage.exc_info[0], stage.exc_info[1], stage.exc_info[2]
+
+        return stage.result
+
+    def get_error(self, name):
+        """
+        :return: the exception the given (finished) stage failed with or None
+        :rtype: Exception or None
+
+        """
+
+        exc_info = self._stages[name].exc_info
+        return exc_info[1] if exc_info else None
+
+    def get_exc_info(self, name):
+        """
+        :return: exception info (as returned by sys.exc_info) of the error the
+                 given (finished) stage failed with or None
+        :rtype: tuple or None
+
+        """
+
+        return self._stages[name].exc_info
+
+    def _run_stage(self, stage):
+        """Target of the stage threads."""
+
+        failed = None
+        for dep in stage.deps:
+            self._stages[dep].done.wait()
+            if self._stages[dep].exc_info is not None:
+                failed = failed or dep
+
+        try:
+            if failed:
+                err = StageSkippedError("Stage '%s' skipped, stage '%s' failed"
+                                        % (stage.name, failed))
+                stage.exc_info = (StageSkippedError, err, None)
+            else:
+                try:
+                    stage.result = stage.func()
+                # pylint: disable-msg=W0703
+                except Exception:
+                    # reported to the callback and to the dependent stages
+                    stage.exc_info = sys.exc_info()
+
+            if self._stage_done_cb:
+                self._stage_done_cb(stage.name, self.get_error(stage.name))
+        finally:
+            stage.done.set()
+
+            with self._lock:
+                self._running -= 1
+                last = self._running == 0
+
+            if last and self._finished_cb:
+                self._finished_cb()
@@ -23,10 +23,13 @@ Module with various classes for handling pre-installation rules.
 
 """
 
-import optparse
-import shlex
+import re
+
+from collections import namedtuple
 
 from org_fedora_oscap import common
+from org_fedora_oscap import timing
+from org_fedora_oscap import utils
 from org_fedora_oscap.common import OSCAPaddonError, RuleMessage
 
 # everything else should be private
@@ -35,34 +38,194 @@ __all__ = ["RuleData"]
 import gettext
 _ = lambda x: gettext.ldgettext("oscap-anaconda-addon", x)
 
-# TODO: use set instead of list for mount options?
-def parse_csv(option, opt_str, value, parser):
-    for item in value.split(","):
-        if item:
-            parser.values.ensure_value(option.dest, []).append(item)
+# namedtuple classes (not constants, pylint!) for the parsed rules
+# pylint: disable-msg=C0103
+PartRuleRecord = namedtuple("PartRuleRecord", ["mount_point", "mount_options"])
+PasswdRuleRecord = namedtuple("PasswdRuleRecord", ["minlen"])
+PackageRuleRecord = namedtuple("PackageRuleRecord", ["add_pkgs", "remove_pkgs"])
+BootloaderRuleRecord = namedtuple("BootloaderRuleRecord", ["passwd"])
+
+# a whitespace-separated token with optional (single or double) quoted parts
+TOKEN_RE = re.compile(r"""\s+|((?:[^\s"']+|"[^"]*"|'[^']*')+)""")
 
-PART_RULE_PARSER = optparse.OptionParser()
-PART_RULE_PARSER.add_option("--mountoptions", dest="mount_options",
-                            action="callback", callback=parse_csv, nargs=1,
-                            type="string")
+# parts of a token (to get rid of the quotes)
+TOKEN_PART_RE = re.compile(r"""([^"']+)|"([^"]*)"|'([^']*)'""")
 
-PASSWD_RULE_PARSER = optparse.OptionParser()
-PASSWD_RULE_PARSER.add_option("--minlen", dest="minlen", action="store",
-                              default=0, type="int")
+class RuleParseError(OSCAPaddonError):
+    """Exception class for cases when a rule cannot be parsed."""
+
+    pass
 
-PACKAGE_RULE_PARSER = optparse.OptionParser()
-PACKAGE_RULE_PARSER.add_option("--add", dest="add_pkgs", action="append",
-                               type="string")
-PACKAGE_RULE_PARSER.add_option("--remove", dest="remove_pkgs", action="append",
-                               type="string")
+class UknownRuleError(RuleParseError):
+    """Exception class for cases when an uknown rule is to be processed."""
+
+    pass
 
-BOOTLOADER_RULE_PARSER = optparse.OptionParser()
-BOOTLOADER_RULE_PARSER.add_option("--passwd", dest="passwd", action="store_true",
-                                  default=False)
+def _csv_items(value):
+    """Split comma-separated values skipping the empty ones."""
+
+    return [utils.intern_value(item) for item in value.split(",") if item]
+
+def _str_value(value):
+    """Use the (interned) value as it is."""
+
+    return utils.intern_value(value)
+
+def _int_value(value):
+    """Convert the value to int or raise ValueError with a nice message."""
+
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError("invalid integer value: '%s'" % value)
+
+# rule -> (number of positional arguments, {option -> conversion function}),
+# options with no conversion function are flags without values
+RULE_SYNTAX = { "part": (1, {"--mountoptions": _csv_items}),
+                "passwd": (0, {"--minlen": _int_value}),
+                "package": (0, {"--add": _str_value, "--remove": _str_value}),
+                "bootloader": (0, {"--passwd": None}),
+                }
+
+def tokenize_rule(line):
+    """
+    Split a rule line into tokens the same way a shell would (with no
+    variable expansion, escaping,...), i.e. whitespace separates tokens unless
+    quoted and quotes are removed.
+
+    :param line: a single rule line
+    :type line: str
+    :return: tokens found on the line
+    :rtype: list of strings
+    :raise ValueError: if there is no closing quotation
+
+    """
+
+    tokens = []
+    pos = 0
+    while pos < len(line):
+        match = TOKEN_RE.match(line, pos)
+        if not match:
+            raise ValueError("no closing quotation")
+
+        pos = match.end()
+        if match.group(1) is not None:
+            parts = TOKEN_PART_RE.finditer(match.group(1))
+            tokens.append("".join(part.group(part.lastindex) for part in parts))
+
+    return tokens
+
+def parse_rule(line, lineno=None):
+    """
+    Parse a single rule line (e.g. "part /tmp --mountoptions=nodev").
+
+    :param line: a single rule line
+    :type line: str
+    :param lineno: number of the line used in error messages
+    :type lineno: int or None
+    :return: a (hashable) record for the rule or None for empty and comment
+             lines
+    :rtype: one of the *RuleRecord classes or None
+    :raise RuleParseError: if the line cannot be parsed
+
+    """
+
+    def error(msg, exc_class=RuleParseError):
+        if lineno is not None:
+            msg = "line %d: %s" % (lineno, msg)
+        return exc_class(msg)
+
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+
+    try:
+        tokens = tokenize_rule(line)
+    except ValueError as verr:
+        raise error("%s in '%s'" % (verr, line))
+
+    rule = tokens[0]
+    if rule not in RULE_SYNTAX:
+        raise error("Unknown rule: '%s'" % rule, UknownRuleError)
+
+    num_args, option_convs = RULE_SYNTAX[rule]
+    args = []
+    opts = dict((option, []) for option in option_convs)
+
+    tokens_itr = iter(tokens[1:])
+    for token in tokens_itr:
+        if not token.startswith("--"):
+            args.append(token)
+            continue
+
+        option, sep, value = token.partition("=")
+        if option not in option_convs:
+            raise error("Unknown option '%s' for the '%s' rule" % (option, rule))
+
+        conv = option_convs[option]
+        if conv is None:
+            if sep:
+                raise error("Option '%s' takes no value" % option)
+            opts[option].append(True)
+            continue
+
+        if not sep:
+            # value given as the next token
+            value = next(tokens_itr, None)
+            if value is None:
+                raise error("Option '%s' requires a value" % option)
+
+        try:
+            opts[option].append(conv(value))
+        except ValueError as verr:
+            raise error("Option '%s': %s" % (option, verr))
+
+    if len(args) != num_args:
+        msg = "Wrong number of arguments for the '%s' rule: '%s'" % (rule, line)
+        raise error(msg)
+
+    if rule == "part":
+        mount_options = tuple(opt for opts_list in opts["--mountoptions"]
+                              for opt in opts_list)
+        return PartRuleRecord(utils.intern_value(args[0]), mount_options)
+    elif rule == "passwd":
+        # the last value wins
+        minlen = opts["--minlen"][-1] if opts["--minlen"] else 0
+        return PasswdRuleRecord(minlen)
+    elif rule == "package":
+        return PackageRuleRecord(tuple(opts["--add"]), tuple(opts["--remove"]))
+    else:
+        return BootloaderRuleRecord(bool(opts["--passwd"]))
+
+def parse_rules(lines):
+    """
+    Parse rule lines (e.g. the output of 'oscap xccdf generate fix' with the
+    pre-installation template) in one pass.
+
+    :param lines: the rule lines or the whole text
+    :type lines: iterable of strings or str
+    :return: records for the rules (empty lines and comments skipped)
+    :rtype: list of *RuleRecord instances
+    :raise RuleParseError: if any of the lines cannot be parsed
+
+    """
+
+    if isinstance(lines, basestring):
+        lines = lines.splitlines()
+
+    records = []
+    for lineno, line in enumerate(lines, 1):
+        record = parse_rule(line, lineno)
+        if record is not None:
+            records.append(record)
+
+    return records
 
 class RuleHandler(object):
     """Base class for the rule handlers."""
 
+    __slots__ = ()
+
     def eval_rules(self, ksdata, storage, report_only=False):
         """
         Method that should check the current state (as defined by the ksdata and
@@ -89,6 +252,23 @@ class RuleHandler(object):
 
         return []
 
+    def get_inputs(self, ksdata, storage):
+        """
+        Method that should return a snapshot of all the values (from ksdata,
+        storage and the instance itself) the eval_rules method depends on. If
+        two snapshots are equal, the evaluation is expected to give the same
+        results. None means that the inputs are not known and the rules always
+        have to be evaluated.
+
+        :see: eval_rules
+        :return: snapshot of the values the evaluation depends on or None
+        :rtype: tuple or None
+
+        """
+
+        # inheriting classes are supposed to override this
+        return None
+
     def revert_changes(self, ksdata, storage):
         """
         Method that should revert all changes done by the previous calls of the
@@ -101,14 +281,12 @@ class RuleHandler(object):
         # inheriting classes are supposed to override this
         pass
 
-class UknownRuleError(OSCAPaddonError):
-    """Exception class for cases when an uknown rule is to be processed."""
-
-    pass
-
 class RuleData(RuleHandler):
     """Class holding data parsed from the applied rules."""
 
+    __slots__ = ("_part_rules", "_passwd_rules", "_package_rules",
+                 "_bootloader_rules", "_rule_handlers", "_eval_cache")
+
     def __init__(self):
         """Constructor initializing attributes."""
 
@@ -121,6 +299,26 @@ class RuleData(RuleHandler):
                                self._package_rules, self._bootloader_rules,
                                )
 
+        # (rule_handler, report_only) -> (inputs, messages) from the last
+        # evaluation used to skip handlers whose inputs haven't changed
+        self._eval_cache = dict()
+
+    @classmethod
+    def from_text(cls, rules):
+        """
+        Create a new instance holding the given rules.
+
+        :see: add_rules
+        :return: a new instance with the rules added
+        :rtype: RuleData
+
+        """
+
+        rule_data = cls()
+        rule_data.add_rules(rules)
+
+        return rule_data
+
     def __str__(self):
         """Standard method useful for debugging and testing."""
 
@@ -146,38 +344,83 @@ class RuleData(RuleHandler):
 
         :param rule: a single rule line
         :type rule: str
+        :raise RuleParseError: if the rule cannot be parsed
 
         """
 
-        actions = { "part" : self._new_part_rule,
-                    "passwd" : self._new_passwd_rule,
-                    "package": self._new_package_rule,
-                    "bootloader": self._new_bootloader_rule,
-                    }
+        record = parse_rule(rule)
+        if record is None:
+            return
 
-        rule = rule.strip()
-        if not rule:
+        # new rule may change results of the evaluation
+        self._eval_cache.clear()
+
+        self._add_record(record)
+
+    def add_rules(self, rules):
+        """
+        Method that handles multiple rule lines at once (e.g. the whole output
+        of the 'oscap xccdf generate fix' command). All the lines are parsed
+        first so that no rule is added if any of them is invalid and identical
+        rules are only added once.
+
+        :param rules: rule lines or the whole text with the rules
+        :type rules: str or iterable of strings (e.g. a file object)
+        :raise RuleParseError: if any of the rules cannot be parsed
+
+        """
+
+        records = parse_rules(rules)
+        if not records:
             return
 
-        first_word = rule.split(None, 1)[0]
-        try:
-            actions[first_word](rule)
-        except KeyError:
-            # should never happen
-            # TODO: only log error instead?
-            raise UknownRuleError("Unknown rule: '%s'" % first_word)
+        # new rules may change results of the evaluation
+        self._eval_cache.clear()
+
+        seen = set()
+        for record in records:
+            if record not in seen:
+                seen.add(record)
+                self._add_record(record)
 
+    @timing.timed("rule evaluation")
     def eval_rules(self, ksdata, storage, report_only=False):
         """:see: RuleHandler.eval_rules"""
 
         messages = []
 
-        # evaluate all subgroups of rules
+        # evaluate all subgroups of rules with changed inputs
         for rule_handler in self._rule_handlers:
-            messages += rule_handler.eval_rules(ksdata, storage, report_only)
+            cache_key = (rule_handler, report_only)
+            inputs = rule_handler.get_inputs(ksdata, storage)
+            if inputs is not None and cache_key in self._eval_cache:
+                cached_inputs, cached_messages = self._eval_cache[cache_key]
+                if inputs == cached_inputs:
+                    messages += cached_messages
+                    continue
+
+            handler_messages = rule_handler.eval_rules(ksdata, storage,
+                                                       report_only)
+            messages += handler_messages
+
+            # evaluation may have changed the inputs (automatic fixes), store
+            # the new ones
+            inputs = rule_handler.get_inputs(ksdata, storage)
+            if inputs is not None:
+                self._eval_cache[cache_key] = (inputs, handler_messages)
 
         return messages
 
+    def get_inputs(self, ksdata, storage):
+        """:see: RuleHandler.get_inputs"""
+
+        inputs = tuple(rule_handler.get_inputs(ksdata, storage)
+                       for rule_handler in self._rule_handlers)
+        if any(item is None for item in inputs):
+            return None
+
+        return inputs
+
     def revert_changes(self, ksdata, storage):
         """:see: RuleHandler.revert_changes"""
 
@@ -185,42 +428,49 @@ class RuleData(RuleHandler):
         for rule_handler in self._rule_handlers:
             rule_handler.revert_changes(ksdata, storage)
 
-    def _new_part_rule(self, rule):
-        args = shlex.split(rule)
-        (opts, args) = PART_RULE_PARSER.parse_args(args)
+        # cached results are no longer valid
+        self._eval_cache.clear()
 
-        # args contain both "part" and mount point (e.g. "/tmp")
-        mount_point = args[1]
+    def _add_record(self, record):
+        """
+        Merge a parsed rule into the handlers.
+
+        :param record: a parsed rule
+        :type record: one of the *RuleRecord classes
 
-        self._part_rules.ensure_mount_point(mount_point)
+        """
 
-        if opts.mount_options:
-            part_data = self._part_rules[mount_point]
-            part_data.add_mount_options(opts.mount_options)
+        actions = { PartRuleRecord: self._new_part_rule,
+                    PasswdRuleRecord: self._new_passwd_rule,
+                    PackageRuleRecord: self._new_package_rule,
+                    BootloaderRuleRecord: self._new_bootloader_rule,
+                    }
 
-    def _new_passwd_rule(self, rule):
-        args = shlex.split(rule)
-        (opts, args) = PASSWD_RULE_PARSER.parse_args(args)
+        actions[type(record)](record)
 
-        self._passwd_rules.update_minlen(opts.minlen)
+    def _new_part_rule(self, record):
+        self._part_rules.ensure_mount_point(record.mount_point)
 
-    def _new_package_rule(self, rule):
-        args = shlex.split(rule)
-        (opts, args) = PACKAGE_RULE_PARSER.parse_args(args)
+        if record.mount_options:
+            part_data = self._part_rules[record.mount_point]
+            part_data.add_mount_options(record.mount_options)
 
-        self._package_rules.add_packages(opts.add_pkgs)
-        self._package_rules.remove_packages(opts.remove_pkgs)
+    def _new_passwd_rule(self, record):
+        self._passwd_rules.update_minlen(record.minlen)
 
-    def _new_bootloader_rule(self, rule):
-        args = shlex.split(rule)
-        (opts, args) = BOOTLOADER_RULE_PARSER.parse_args(args)
+    def _new_package_rule(self, record):
+        self._package_rules.add_packages(record.add_pkgs)
+        self._package_rules.remove_packages(record.remove_pkgs)
 
-        if opts.passwd:
+    def _new_bootloader_rule(self, record):
+        if record.passwd:
             self._bootloader_rules.require_password()
 
 class PartRules(RuleHandler):
     """Simple class holding data from the rules affecting partitioning."""
 
+    __slots__ = ("_rules",)
+
     def __init__(self):
         """Constructor initializing attributes."""
 
@@ -269,6 +519,12 @@ class PartRules(RuleHandler):
 
         return messages
 
+    def get_inputs(self, ksdata, storage):
+        """:see: RuleHandler.get_inputs"""
+
+        return tuple(part_rule.get_inputs(ksdata, storage)
+                     for part_rule in self._rules.itervalues())
+
     def revert_changes(self, ksdata, storage):
         """:see: RuleHandler.revert_changes"""
 
@@ -278,6 +534,8 @@ class PartRules(RuleHandler):
 class PartRule(RuleHandler):
     """Simple class holding rule data for a single partition/mount point."""
 
+    __slots__ = ("_mount_point", "_mount_options", "_added_mount_options")
+
     def __init__(self, mount_point):
         """
         Constructor initializing attributes.
@@ -356,6 +614,17 @@ class PartRule(RuleHandler):
 
         return messages
 
+    def get_inputs(self, ksdata, storage):
+        """:see: RuleHandler.get_inputs"""
+
+        if self._mount_point in storage.mountpoints:
+            target_options = storage.mountpoints[self._mount_point].format.options
+        else:
+            target_options = None
+
+        return (self._mount_point, tuple(self._mount_options),
+                tuple(self._added_mount_options), target_options)
+
     def revert_changes(self, ksdata, storage):
         """
         Removes the mount options added to the mount point by this PartRule
@@ -388,6 +657,8 @@ class PartRule(RuleHandler):
 class PasswdRules(RuleHandler):
     """Simple class holding data from the rules affecting passwords."""
 
+    __slots__ = ("_minlen", "_removed_password")
+
     def __init__(self):
         """Constructor initializing attributes."""
 
@@ -441,6 +712,16 @@ class PasswdRules(RuleHandler):
             else:
                 return []
 
+    def get_inputs(self, ksdata, storage):
+        """:see: RuleHandler.get_inputs"""
+
+        if self._minlen == 0:
+            # nothing is checked
+            return (self._minlen,)
+
+        return (self._minlen, self._removed_password, ksdata.rootpw.password,
+                ksdata.rootpw.isCrypted)
+
     def revert_changes(self, ksdata, storage):
         """:see: RuleHandler.revert_changes"""
 
@@ -451,9 +732,74 @@ class PasswdRules(RuleHandler):
 
             self._removed_password = None
 
+class IndexedList(object):
+    """
+    Helper class providing constant-time membership checks for a list (e.g.
+    ksdata.packages.packageList) that is changed only through the instance
+    while the instance is used. The index is built on the first membership
+    check.
+
+    """
+
+    __slots__ = ("_list", "_index")
+
+    def __init__(self, lst):
+        """
+        :param lst: the list that should be indexed (and modified in place)
+        :type lst: list
+
+        """
+
+        self._list = lst
+        self._index = None
+
+    def __contains__(self, item):
+        """Method needed for the 'in' operator to work."""
+
+        if self._index is None:
+            self._index = set(self._list)
+
+        return item in self._index
+
+    def append(self, item):
+        """Append item to the underlying list."""
+
+        self._list.append(item)
+        if self._index is not None:
+            self._index.add(item)
+
+    def remove_items(self, items):
+        """
+        Remove the first occurrence of every given item from the underlying
+        list in a single pass over the list.
+
+        :param items: items to be removed (missing items are ignored)
+        :type items: iterable
+
+        """
+
+        to_remove = set(items)
+        if not to_remove:
+            return
+
+        kept = []
+        for item in self._list:
+            if item in to_remove:
+                to_remove.remove(item)
+            else:
+                kept.append(item)
+
+        # keep the same list object (referenced from ksdata)
+        self._list[:] = kept
+
+        # there may be duplicates left in the list
+        self._index = None
+
 class PackageRules(RuleHandler):
     """Simple class holding data from the rules affecting installed packages."""
 
+    __slots__ = ("_add_pkgs", "_remove_pkgs", "_added_pkgs", "_removed_pkgs")
+
     def __init__(self):
         """Constructor setting the initial value of attributes."""
 
@@ -507,6 +853,10 @@ class PackageRules(RuleHandler):
 
         messages = []
 
+        # indexed views of the lists so that membership checks are cheap
+        package_list = IndexedList(ksdata.packages.packageList)
+        excluded_list = IndexedList(ksdata.packages.excludedList)
+
         # add messages for the already added packages
         for pkg in self._added_pkgs:
             msg = _("package '%s' has been added to the list of to be installed "
@@ -515,13 +865,13 @@ class PackageRules(RuleHandler):
 
         # packages, that should be added
         packages_to_add = (pkg for pkg in self._add_pkgs
-                           if pkg not in ksdata.packages.packageList)
+                           if pkg not in package_list)
 
         for pkg in packages_to_add:
             # add the package unless already added
             if not report_only:
                 self._added_pkgs.add(pkg)
-                ksdata.packages.packageList.append(pkg)
+                package_list.append(pkg)
 
             msg = _("package '%s' has been added to the list of to be installed "
                     "packages" % pkg)
@@ -537,13 +887,13 @@ class PackageRules(RuleHandler):
 
         # packages, that should be added
         packages_to_remove = (pkg for pkg in self._remove_pkgs
-                              if pkg not in ksdata.packages.excludedList)
+                              if pkg not in excluded_list)
 
         for pkg in packages_to_remove:
             # exclude the package unless already excluded
             if not report_only:
                 self._removed_pkgs.add(pkg)
-                ksdata.packages.excludedList.append(pkg)
+                excluded_list.append(pkg)
 
             msg = _("package '%s' has been added to the list of excluded "
                     "packages" % pkg)
@@ -551,18 +901,37 @@ class PackageRules(RuleHandler):
 
         return messages
 
+    def get_inputs(self, ksdata, storage):
+        """:see: RuleHandler.get_inputs"""
+
+        # only the presence of the packages the rules care about matters
+        if self._add_pkgs:
+            present_pkgs = self._add_pkgs.intersection(ksdata.packages.packageList)
+        else:
+            present_pkgs = set()
+
+        if self._remove_pkgs:
+            excluded_pkgs = self._remove_pkgs.intersection(
+                                               ksdata.packages.excludedList)
+        else:
+            excluded_pkgs = set()
+
+        return (frozenset(self._add_pkgs), frozenset(self._remove_pkgs),
+                frozenset(self._added_pkgs), frozenset(self._removed_pkgs),
+                frozenset(present_pkgs), frozenset(excluded_pkgs))
+
     def revert_changes(self, ksdata, storage):
         """:see: RuleHander.revert_changes"""
 
         # remove all packages this handler added
-        for pkg in self._added_pkgs:
-            if pkg in ksdata.packages.packageList:
-                ksdata.packages.packageList.remove(pkg)
+        if self._added_pkgs:
+            package_list = IndexedList(ksdata.packages.packageList)
+            package_list.remove_items(self._added_pkgs)
 
         # remove all packages this handler excluded
-        for pkg in self._removed_pkgs:
-            if pkg in ksdata.packages.excludedList:
-                ksdata.packages.excludedList.remove(pkg)
+        if self._removed_pkgs:
+            excluded_list = IndexedList(ksdata.packages.excludedList)
+            excluded_list.remove_items(self._removed_pkgs)
 
         self._added_pkgs = set()
         self._removed_pkgs = set()
@@ -570,6 +939,8 @@ class PackageRules(RuleHandler):
 class BootloaderRules(RuleHandler):
     """Simple class holding data from the rules affecting bootloader."""
 
+    __slots__ = ("_require_password",)
+
     def __init__(self):
         """Constructor setting the initial value of attributes."""
 
@@ -602,4 +973,13 @@ class BootloaderRules(RuleHandler):
         else:
             return []
 
+    def get_inputs(self, ksdata, storage):
+        """:see: RuleHandler.get_inputs"""
+
+        if not self._require_password:
+            # nothing is checked
+            return (False,)
+
+        return (True, bool(storage.bootloader.password))
+
     # nothing to be reverted for now
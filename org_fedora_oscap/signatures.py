@@ -0,0 +1,215 @@
+#
+# Copyright (C) 2013  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+
+"""
+Module for verification of detached signatures (OpenPGP or X.509/CMS) of the
+content. The data is verified as it is streamed (e.g. downloaded), so the
+verification needs no extra pass over the content file.
+
+"""
+
+import os
+import errno
+
+from org_fedora_oscap import tool_runner
+
+# everything else should be private
+__all__ = ["SignatureVerifier", "get_signature_type", "SIGNATURE_TYPE_PGP",
+           "SIGNATURE_TYPE_CMS"]
+
+SIGNATURE_TYPE_PGP = "pgp"
+SIGNATURE_TYPE_CMS = "cms"
+
+PGP_ARMOR_HEADER = "-----BEGIN PGP SIGNATURE-----"
+CMS_ARMOR_HEADERS = ("-----BEGIN PKCS7-----", "-----BEGIN CMS-----")
+
+class SignatureError(Exception):
+    """Parent class for the exception classes defined in this module."""
+
+    pass
+
+class UnknownSignatureError(SignatureError):
+    """Class for the errors of signatures of an unknown format."""
+
+    pass
+
+class SignatureVerificationError(SignatureError):
+    """Class for the failed signature verifications."""
+
+    pass
+
+def get_signature_type(sig_path):
+    """
+    Find out the type and format of the given detached signature.
+
+    :param sig_path: path to the signature file
+    :type sig_path: str
+    :return: type of the signature (SIGNATURE_TYPE_PGP or SIGNATURE_TYPE_CMS)
+             and its format ("PEM" or "DER", None for OpenPGP signatures)
+    :rtype: (str, str or None)
+    :raise UnknownSignatureError: if the signature is of an unknown format
+
+    """
+
+    with open(sig_path, "rb") as sig_file:
+        head = sig_file.read(64).lstrip()
+
+    if head.startswith(PGP_ARMOR_HEADER):
+        return (SIGNATURE_TYPE_PGP, None)
+    if any(head.startswith(header) for header in CMS_ARMOR_HEADERS):
+        return (SIGNATURE_TYPE_CMS, "PEM")
+
+    if head:
+        first = ord(head[0])
+        if first == 0x30:
+            # ASN.1 SEQUENCE, i.e. DER-encoded CMS (PKCS #7) structure
+            return (SIGNATURE_TYPE_CMS, "DER")
+        if first & 0x80:
+            # OpenPGP packet tag
+            return (SIGNATURE_TYPE_PGP, None)
+
+    msg = "Unknown format of the signature '%s'" % sig_path
+    raise UnknownSignatureError(msg)
+
+def _get_verify_args(sig_type, sig_format, sig_path, trust_path):
+    """
+    Get the command verifying the signature of the data from its stdin.
+
+    :see: SignatureVerifier
+    :rtype: list of strings
+
+    """
+
+    if sig_type == SIGNATURE_TYPE_PGP:
+        return ["gpgv", "--keyring", os.path.abspath(trust_path), sig_path,
+                "-"]
+    else:
+        # only certificates allowed for signing, not e.g. any TLS server
+        # certificate issued by the CA
+        return ["openssl", "cms", "-verify", "-binary", "-inform", sig_format,
+                "-in", sig_path, "-content", "/dev/stdin",
+                "-CAfile", trust_path, "-purpose", "smimesign",
+                "-out", os.devnull]
+
+class SignatureVerifier(object):
+    """
+    Class verifying a detached signature of the data fed to it in chunks. It
+    has the update method like the hashlib's hash objects, so that it can be
+    fed with the data wherever they are.
+
+    """
+
+    def __init__(self, sig_path, trust_path):
+        """
+        :param sig_path: path to the detached signature
+        :type sig_path: str
+        :param trust_path: path to the OpenPGP keyring with the trusted keys or
+                           to the PEM file with the trusted CA certificates
+                           (for CMS signatures, the signer's certificate must
+                           be usable for S/MIME signing)
+        :type trust_path: str
+        :raise UnknownSignatureError: if the signature is of an unknown format
+        :raise SignatureError: if the verification tool cannot be run
+
+        """
+
+        self.sig_type, sig_format = get_signature_type(sig_path)
+        args = _get_verify_args(self.sig_type, sig_format, sig_path,
+                                trust_path)
+
+        # the data are written to the pipe as they come, the tool's output is
+        # collected by the job
+        read_fd, write_fd = os.pipe()
+        try:
+            self._job = tool_runner.start_tool(args, ok_codes=None,
+                                               stdin=read_fd,
+                                               merge_stderr=True)
+            started = self._job.wait_started()
+        finally:
+            # only the tool reads the data, EPIPE once it exits
+            os.close(read_fd)
+
+        self._input = os.fdopen(write_fd, "wb")
+        self._input_closed = False
+        if not started:
+            self._close_input()
+            try:
+                self._job.wait()
+            except tool_runner.ToolRunError as err:
+                raise SignatureError(str(err))
+
+    def update(self, data):
+        """
+        Feed the verification with the next chunk of the data.
+
+        :param data: next chunk of the signed data
+        :type data: str
+
+        """
+
+        if self._input_closed:
+            return
+
+        try:
+            self._input.write(data)
+        except IOError as ioerr:
+            if ioerr.errno != errno.EPIPE:
+                raise
+            # the tool has given up, verify reports why
+            self._close_input()
+
+    def _close_input(self):
+        self._input_closed = True
+        try:
+            self._input.close()
+        except IOError:
+            pass
+
+    def _finish(self):
+        """Wait for the tool to finish and get its return code and output."""
+
+        self._close_input()
+        result = self._job.wait()
+
+        return (result.returncode, result.stdout)
+
+    def verify(self):
+        """
+        Finish the verification once all the data was fed to the verifier.
+
+        :raise SignatureVerificationError: if the signature verification fails
+
+        """
+
+        ret, output = self._finish()
+        if ret != 0:
+            msg = "Verification of the %s signature failed: %s" % \
+                  (self.sig_type, output.strip())
+            raise SignatureVerificationError(msg)
+
+    def abort(self):
+        """Stop the verification (e.g. if the data cannot be fetched)."""
+
+        self._job.cancel()
+        self._close_input()
+        try:
+            self._job.wait()
+        except tool_runner.ToolRunError:
+            # cancelled (or just failed), nobody is interested anymore
+            pass
@@ -0,0 +1,195 @@
+#
+# Copyright (C) 2013  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+"""
+Module with lightweight instrumentation of the addon's phases. Spans (timed
+with a monotonic clock) are recorded in a timeline that can be written out as
+JSON.
+
+"""
+
+import os
+import json
+import time
+import ctypes
+import ctypes.util
+import logging
+import threading
+
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import wraps
+
+log = logging.getLogger("anaconda")
+
+# everything else should be private
+__all__ = ["monotonic", "Timeline", "span", "timed", "write_timeline"]
+
+CLOCK_MONOTONIC = 1
+
+class _Timespec(ctypes.Structure):
+    """struct timespec for clock_gettime"""
+
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+def _get_clock_gettime():
+    """Get the clock_gettime function from libc/librt or None."""
+
+    for lib in ("c", "rt"):
+        lib_path = ctypes.util.find_library(lib)
+        if not lib_path:
+            continue
+        try:
+            func = getattr(ctypes.CDLL(lib_path, use_errno=True),
+                           "clock_gettime")
+        except (OSError, AttributeError):
+            continue
+        func.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+        return func
+
+    return None
+
+_clock_gettime = _get_clock_gettime()
+
+def monotonic():
+    """
+    Get the time (in seconds) of a monotonic clock, i.e. one not affected by
+    the changes of the system time (that happen during installation).
+
+    :rtype: float
+
+    """
+
+    if _clock_gettime:
+        tspec = _Timespec()
+        if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(tspec)) == 0:
+            return tspec.tv_sec + tspec.tv_nsec * 1e-9
+
+    # elapsed real time (monotonic, but with the clock tick resolution)
+    return os.times()[4]
+
+# pylint: disable-msg=C0103
+Span = namedtuple("Span", ["name", "parent", "thread", "start", "duration",
+                           "error"])
+
+class Timeline(object):
+    """Class recording the spans of the instrumented phases."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._spans = []
+        self._origin = monotonic()
+        self._origin_wall = time.time()
+
+    @contextmanager
+    def span(self, name):
+        """
+        Context manager recording the time spent in the block as a span with
+        the given name. Spans started within the block are its children.
+
+        :param name: name of the span (e.g. "extraction")
+        :type name: str
+
+        """
+
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        start = monotonic()
+        error = None
+        try:
+            yield
+        except BaseException as exc:
+            error = type(exc).__name__
+            raise
+        finally:
+            duration = monotonic() - start
+            stack.pop()
+            record = Span(name, parent, threading.current_thread().name,
+                          start - self._origin, duration, error)
+            with self._lock:
+                self._spans.append(record)
+
+    def timed(self, name):
+        """
+        Decorator recording every call of the function as a span.
+
+        :see: span
+
+        """
+
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+
+        return decorator
+
+    def get_spans(self):
+        """
+        Get the recorded spans sorted by their start.
+
+        :rtype: list of Span instances
+
+        """
+
+        with self._lock:
+            return sorted(self._spans, key=lambda item: item.start)
+
+    def to_json(self):
+        """
+        Get the timeline as a JSON string. Times of the spans are in seconds
+        relative to the origin (creation of the timeline) given as a UNIX
+        timestamp.
+
+        :rtype: str
+
+        """
+
+        return json.dumps({"origin": self._origin_wall,
+                           "spans": [item._asdict()
+                                     for item in self.get_spans()]},
+                          sort_keys=True)
+
+# the timeline of the addon
+_TIMELINE = Timeline()
+
+span = _TIMELINE.span
+timed = _TIMELINE.timed
+
+def write_timeline(fpath=None):
+    """
+    Write the addon's timeline to the installer logs and (if given) to a file.
+
+    :param fpath: path to the file the timeline should be written to or None
+    :type fpath: str or None
+
+    """
+
+    timeline = _TIMELINE.to_json()
+    log.info("OSCAP addon timeline: %s", timeline)
+
+    if fpath:
+        with open(fpath, "w") as fobj:
+            fobj.write(timeline)
@@ -0,0 +1,656 @@
+"""
+Module for running external tools (oscap, bash, rpm2cpio, yum,...) in a unified
+way. Supports limiting the number of tools running concurrently, timeouts,
+streaming of the tools' output, cancellation and accounting of the resources
+used by the tools.
+
+"""
+
+import os
+import time
+import errno
+import signal
+import logging
+import threading
+import subprocess
+import multiprocessing
+import Queue
+
+from collections import namedtuple, defaultdict
+from distutils.spawn import find_executable
+
+log = logging.getLogger("anaconda")
+
+# the tools' output goes where the installer logs output of other programs
+program_log = logging.getLogger("program")
+
+# everything else should be private
+__all__ = ["ToolRunner", "run_tool", "iter_tool_lines", "run_tools",
+           "start_tool", "cancel_tools", "get_tool_stats", "log_tool_stats",
+           "chroot_fn", "ToolRunError", "ToolFailedError", "ToolTimeoutError",
+           "ToolCancelledError"]
+
+# maximum size of the tools' stderr kept in memory (in bytes)
+MAX_STDERR_SIZE = 64 * 1024
+
+# commands running the tools in a given root and in their own session (and
+# thus process group) so that no Python code needs to be run in the child
+# process which is not safe if other threads are running
+CHROOT_CMD = "chroot"
+SETSID_CMD = "setsid"
+
+# pylint: disable-msg=C0103
+# wall and CPU times in seconds, peak RSS in KiB (None if not available)
+ToolStats = namedtuple("ToolStats", ["args", "returncode", "wall_time",
+                                     "cpu_time", "max_rss"])
+
+# pylint: disable-msg=C0103
+ToolResult = namedtuple("ToolResult", ["returncode", "stdout", "stderr",
+                                       "stats"])
+
+class ToolRunError(Exception):
+    """Parent class for the exception classes defined in this module."""
+
+    def __init__(self, msg, stderr=""):
+        Exception.__init__(self, msg)
+        self.stderr = stderr
+
+class ToolFailedError(ToolRunError):
+    """Class for the errors of tools that cannot be run or failed."""
+
+    pass
+
+class ToolTimeoutError(ToolRunError):
+    """Class for the errors of tools that didn't finish in time."""
+
+    pass
+
+class ToolCancelledError(ToolRunError):
+    """Class for the errors of tools killed due to cancellation."""
+
+    pass
+
+def chroot_fn(root):
+    """
+    Function returning a function that can be used as the preexec_fn to run
+    the tool in the given root. Not to be used when other threads may be
+    running, use the root argument of the ToolRunner's methods instead.
+
+    :param root: path to the root the tool should be run in
+    :type root: str
+    :rtype: callable
+
+    """
+
+    def do_chroot():
+        """Helper function doing the chroot if requested."""
+        if root and root != "/":
+            os.chroot(root)
+            os.chdir("/")
+
+    return do_chroot
+
+def _read_capped(fobj, chunks, max_size):
+    """
+    Read the given file object until EOF, but only store the first max_size
+    bytes. Reading everything prevents the writer from blocking on a full pipe.
+
+    :param fobj: file object to read from
+    :param chunks: list the read data should be appended to
+    :type chunks: list
+    :param max_size: maximum number of bytes to store
+    :type max_size: int
+
+    """
+
+    stored = 0
+    buf = fobj.read(4 * 1024)
+    while buf:
+        if stored < max_size:
+            chunks.append(buf[:max_size - stored])
+            stored += len(chunks[-1])
+        buf = fobj.read(4 * 1024)
+
+def _write_stdin(fobj, data):
+    """
+    Write the data to the given file object and close it. The tool may exit
+    without reading everything, that is not an error here.
+
+    :param fobj: file object to write to
+    :param data: data to write
+    :type data: str
+
+    """
+
+    try:
+        fobj.write(data)
+    except IOError as ioerr:
+        if ioerr.errno != errno.EPIPE:
+            raise
+    finally:
+        try:
+            fobj.close()
+        except IOError:
+            pass
+
+def _reap(proc):
+    """
+    Wait for the process to finish and get its resource usage.
+
+    :param proc: the process
+    :type proc: subprocess.Popen
+    :return: resource usage of the process (see resource.getrusage) or None if
+             it is not available
+    :rtype: resource.struct_rusage or None
+
+    """
+
+    while True:
+        try:
+            _pid, status, usage = os.wait4(proc.pid, 0)
+        except OSError as oserr:
+            if oserr.errno == errno.EINTR:
+                continue
+            # not our child or already reaped, no accounting possible
+            proc.wait()
+            return None
+        break
+
+    if os.WIFSIGNALED(status):
+        proc.returncode = -os.WTERMSIG(status)
+    else:
+        proc.returncode = os.WEXITSTATUS(status)
+
+    return usage
+
+def _have_setsid():
+    """
+    Check if the setsid tool is available (the result is cached).
+
+    :rtype: bool
+
+    """
+
+    global _HAVE_SETSID # pylint: disable-msg=W0603
+    if _HAVE_SETSID is None:
+        _HAVE_SETSID = find_executable(SETSID_CMD) is not None
+    return _HAVE_SETSID
+
+_HAVE_SETSID = None
+
+class _ToolProcess(object):
+    """Class representing a running tool and the threads serving it."""
+
+    def __init__(self, args, stdin_data=None, stdin=None, stdout=None,
+                 merge_stderr=False, preexec_fn=None, root=None, timeout=None):
+        self.args = args
+        self.timed_out = False
+        self.killed = False
+        self.stderr = ""
+        self.stats = None
+        self._stderr_chunks = []
+        self._threads = []
+        self._timer = None
+        self._start = time.time()
+
+        if stdin_data is not None:
+            stdin = subprocess.PIPE
+        if stdout is None:
+            stdout = subprocess.PIPE
+        stderr = subprocess.STDOUT if merge_stderr else subprocess.PIPE
+
+        popen_args = list(args)
+        if root and root != "/":
+            popen_args = [CHROOT_CMD, root] + popen_args
+
+        # own process group so that the tool can be killed together with its
+        # children (which could keep the pipes open)
+        if preexec_fn:
+            def setup_child():
+                """Helper function run in the child process before the tool."""
+                os.setpgrp()
+                preexec_fn()
+        else:
+            setup_child = None
+            if _have_setsid():
+                if not (root and root != "/") and \
+                   find_executable(args[0]) is None:
+                    # setsid would fail to run it, not Popen
+                    msg = "Failed to run '%s': %s" % (args[0],
+                                                      os.strerror(errno.ENOENT))
+                    raise ToolFailedError(msg)
+                popen_args = [SETSID_CMD] + popen_args
+
+        program_log.info("Running... %s", " ".join(popen_args))
+        try:
+            # no descriptors leaked to the tools run concurrently (e.g. the
+            # write end of another tool's stdin)
+            self.proc = subprocess.Popen(popen_args, stdin=stdin,
+                                         stdout=stdout, stderr=stderr,
+                                         preexec_fn=setup_child,
+                                         close_fds=True)
+        except OSError as oserr:
+            msg = "Failed to run '%s': %s" % (popen_args[0], oserr)
+            raise ToolFailedError(msg)
+
+        if not merge_stderr:
+            self._start_thread(_read_capped, self.proc.stderr,
+                               self._stderr_chunks, MAX_STDERR_SIZE)
+        if stdin_data is not None:
+            self._start_thread(_write_stdin, self.proc.stdin, stdin_data)
+
+        if timeout is not None:
+            self._timer = threading.Timer(timeout, self._time_out)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _start_thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def _time_out(self):
+        self.timed_out = True
+        self.kill()
+
+    def kill(self):
+        """Kill the tool if it is still running."""
+
+        self.killed = True
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except OSError:
+            # already finished (or not run in its own process group)
+            try:
+                self.proc.kill()
+            except OSError:
+                pass
+
+    def lines(self):
+        """
+        Generator of the lines of the tool's stdout as they come.
+
+        """
+
+        if self.proc.stdout is None:
+            return
+
+        # readline instead of iteration over the file object to get lines
+        # as soon as they are written (no read-ahead buffering)
+        for line in iter(self.proc.stdout.readline, ""):
+            program_log.info(line.rstrip("\n"))
+            yield line
+
+    def finish(self):
+        """
+        Wait for the tool to finish and collect its stderr and resource usage.
+
+        """
+
+        usage = _reap(self.proc)
+        if self._timer:
+            self._timer.cancel()
+        for thread in self._threads:
+            thread.join()
+
+        self.stderr = "".join(self._stderr_chunks)
+        for line in self.stderr.splitlines():
+            program_log.info(line)
+        # pylint: disable-msg=E1101
+        program_log.debug("Return code: %s", self.proc.returncode)
+
+        if usage:
+            cpu_time = usage.ru_utime + usage.ru_stime
+            max_rss = usage.ru_maxrss
+        else:
+            cpu_time = max_rss = None
+
+        # pylint thinks Popen has no attribute returncode
+        # pylint: disable-msg=E1101
+        self.stats = ToolStats(list(self.args), self.proc.returncode,
+                               time.time() - self._start, cpu_time, max_rss)
+
+class ToolJob(object):
+    """Class representing a tool run in a separate thread."""
+
+    def __init__(self, runner, args, kwargs):
+        self._tool = None
+        self._result = None
+        self._error = None
+        self._cancelled = False
+        self._lock = threading.Lock()
+        self._started_event = threading.Event()
+
+        self._thread = threading.Thread(target=self._run,
+                                        args=(runner, args, kwargs))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, runner, args, kwargs):
+        try:
+            self._result = runner.run(args, _job=self, **kwargs)
+        except ToolRunError as err:
+            self._error = err
+        finally:
+            # not started at all if it failed early
+            self._started_event.set()
+
+    def _started(self, tool):
+        """Called by the runner once the tool is started."""
+
+        with self._lock:
+            self._tool = tool
+            if self._cancelled:
+                tool.kill()
+        self._started_event.set()
+
+    def wait_started(self):
+        """
+        Wait for the tool to be started (which may wait for a free slot in the
+        runner).
+
+        :return: whether the tool was started or not (it cannot be run or the
+                 job was cancelled)
+        :rtype: bool
+
+        """
+
+        self._started_event.wait()
+        return self._tool is not None
+
+    def cancel(self):
+        """Kill the tool (now or once it is started)."""
+
+        with self._lock:
+            self._cancelled = True
+            if self._tool:
+                self._tool.kill()
+
+    def wait(self):
+        """
+        Wait for the tool to finish.
+
+        :return: the result of the tool
+        :rtype: ToolResult
+        :raise ToolRunError: if the tool failed (see ToolRunner.run)
+
+        """
+
+        self._thread.join()
+        if self._error:
+            raise self._error
+        return self._result
+
+class ToolRunner(object):
+    """
+    Class running external tools with a limit on the number of tools running
+    concurrently and collecting statistics about the tools.
+
+    """
+
+    def __init__(self, max_jobs=None):
+        """
+        :param max_jobs: maximum number of tools running concurrently (the
+                         number of CPUs, but at least 2 by default)
+        :type max_jobs: int or None
+
+        """
+
+        if not max_jobs:
+            try:
+                max_jobs = max(multiprocessing.cpu_count(), 2)
+            except NotImplementedError:
+                max_jobs = 2
+
+        self.max_jobs = max_jobs
+        self._slots = threading.BoundedSemaphore(max_jobs)
+        self._lock = threading.Lock()
+        self._running = set()
+        self._cancelled = False
+        self._stats = []
+
+    def _start(self, args, job=None, **kwargs):
+        with self._lock:
+            if self._cancelled:
+                raise ToolCancelledError("Running of '%s' cancelled" % args[0])
+            tool = _ToolProcess(args, **kwargs)
+            self._running.add(tool)
+
+        if job:
+            job._started(tool)
+
+        return tool
+
+    def _finish(self, tool, kill=False):
+        if kill:
+            tool.kill()
+        tool.finish()
+
+        with self._lock:
+            self._running.discard(tool)
+            self._stats.append(tool.stats)
+
+    @staticmethod
+    def _check(tool, ok_codes, check_stderr):
+        if tool.timed_out:
+            msg = "'%s' didn't finish in time" % tool.args[0]
+            raise ToolTimeoutError(msg, tool.stderr)
+        if tool.killed:
+            msg = "Running of '%s' cancelled" % tool.args[0]
+            raise ToolCancelledError(msg, tool.stderr)
+
+        # pylint: disable-msg=E1101
+        returncode = tool.proc.returncode
+        if ok_codes is not None and returncode not in ok_codes:
+            msg = "'%s' exited with status %d" % (tool.args[0], returncode)
+            raise ToolFailedError(msg, tool.stderr)
+        if check_stderr and tool.stderr:
+            msg = "'%s' reported errors" % tool.args[0]
+            raise ToolFailedError(msg, tool.stderr)
+
+    def iter_lines(self, args, ok_codes=(0,), check_stderr=False,
+                   stdin_data=None, merge_stderr=False, preexec_fn=None,
+                   root=None, timeout=None):
+        """
+        Run the tool and yield lines from its stdout as they come. The tool is
+        only started once the iteration starts and killed if the iteration is
+        stopped before the end.
+
+        :param args: the command and its arguments
+        :type args: list of strings
+        :param ok_codes: return codes of the tool meaning success or None if
+                         any return code is fine
+        :type ok_codes: tuple of ints or None
+        :param check_stderr: whether the tool writing something to stderr
+                             means failure or not
+        :type check_stderr: bool
+        :param stdin_data: data written to the tool's stdin or None
+        :type stdin_data: str or None
+        :param merge_stderr: whether to merge stderr into stdout or not
+        :type merge_stderr: bool
+        :param preexec_fn: function called in the child process before the tool
+                           is executed (see chroot_fn), not safe to use if
+                           other threads may be running
+        :type preexec_fn: callable or None
+        :param root: path to the root the tool should be run in or None
+        :type root: str or None
+        :param timeout: number of seconds after which the tool is killed
+        :type timeout: int, float or None
+        :return: generator of the lines from the tool's stdout
+        :rtype: generator of strings
+        :raise ToolRunError: if the tool cannot be run, fails (see ok_codes and
+                             check_stderr), times out or is cancelled
+
+        """
+
+        with self._slots:
+            tool = self._start(args, stdin_data=stdin_data,
+                               merge_stderr=merge_stderr, preexec_fn=preexec_fn,
+                               root=root, timeout=timeout)
+            finished = False
+            try:
+                for line in tool.lines():
+                    yield line
+                finished = True
+            finally:
+                # kill the tool if the caller is no longer interested in the
+                # output (or failed)
+                self._finish(tool, kill=not finished)
+
+        self._check(tool, ok_codes, check_stderr)
+
+    def run(self, args, ok_codes=(0,), check_stderr=False, stdin_data=None,
+            stdin=None, stdout=None, merge_stderr=False, preexec_fn=None,
+            root=None, timeout=None, _job=None):
+        """
+        Run the tool and wait for it to finish.
+
+        :see: iter_lines
+        :param stdin: file object or descriptor the tool's stdin should come
+                      from if no stdin_data are given (None to inherit it)
+        :param stdout: file object or descriptor the tool's stdout should go
+                       to or None to capture it
+        :return: the result of the tool
+        :rtype: ToolResult
+
+        """
+
+        with self._slots:
+            tool = self._start(args, job=_job, stdin_data=stdin_data,
+                               stdin=stdin, stdout=stdout,
+                               merge_stderr=merge_stderr,
+                               preexec_fn=preexec_fn, root=root,
+                               timeout=timeout)
+            finished = False
+            try:
+                output = "".join(tool.lines())
+                finished = True
+            finally:
+                self._finish(tool, kill=not finished)
+
+        self._check(tool, ok_codes, check_stderr)
+
+        # pylint: disable-msg=E1101
+        return ToolResult(tool.proc.returncode, output, tool.stderr,
+                          tool.stats)
+
+    def start(self, args, **kwargs):
+        """
+        Run the tool in a separate thread.
+
+        :see: run
+        :return: job that can be waited for or cancelled
+        :rtype: ToolJob
+
+        """
+
+        return ToolJob(self, args, kwargs)
+
+    def run_many(self, args_list, **kwargs):
+        """
+        Run the tools concurrently (as many as allowed) and wait for all of
+        them to finish.
+
+        :see: run
+        :param args_list: the commands and their arguments
+        :type args_list: list of lists of strings
+        :return: results of the tools in the order of args_list
+        :rtype: list of ToolResult
+        :raise ToolRunError: the first error of the tools (once all of them
+                             finished)
+
+        """
+
+        queue = Queue.Queue()
+        for (idx, args) in enumerate(args_list):
+            queue.put((idx, args))
+
+        results = [None] * len(args_list)
+        errors = [None] * len(args_list)
+        def worker():
+            """Helper function running tools until there are no more."""
+            while True:
+                try:
+                    idx, args = queue.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    results[idx] = self.run(args, **kwargs)
+                except ToolRunError as err:
+                    errors[idx] = err
+
+        threads = [threading.Thread(target=worker)
+                   for _i in range(min(self.max_jobs, len(args_list)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for error in errors:
+            if error:
+                raise error
+
+        return results
+
+    def cancel(self):
+        """
+        Kill all the running tools and refuse to run new ones.
+
+        """
+
+        with self._lock:
+            self._cancelled = True
+            for tool in self._running:
+                tool.kill()
+
+    def get_stats(self):
+        """
+        Get statistics about the finished tools.
+
+        :return: statistics of the finished tools and summary of them per tool
+                 name (number of runs, total wall time, total CPU time and
+                 maximum peak RSS)
+        :rtype: (list of ToolStats, dict(name -> (int, float, float, int)))
+
+        """
+
+        with self._lock:
+            stats = list(self._stats)
+
+        summary = defaultdict(lambda: [0, 0.0, 0.0, 0])
+        for item in stats:
+            entry = summary[os.path.basename(item.args[0])]
+            entry[0] += 1
+            entry[1] += item.wall_time
+            entry[2] += item.cpu_time or 0.0
+            entry[3] = max(entry[3], item.max_rss or 0)
+
+        return (stats, dict((name, tuple(entry))
+                            for (name, entry) in summary.iteritems()))
+
+    def log_stats(self):
+        """
+        Log the summary of the statistics about the finished tools.
+
+        :see: get_stats
+
+        """
+
+        _stats, summary = self.get_stats()
+        for (name, entry) in sorted(summary.iteritems()):
+            (runs, wall_time, cpu_time, max_rss) = entry
+            log.info("OSCAP addon tool '%s': %d runs, %.2f s wall time, "
+                     "%.2f s CPU time, %d KiB peak RSS", name, runs,
+                     wall_time, cpu_time, max_rss)
+
+# the runner used by the addon for all the tools
+_RUNNER = ToolRunner()
+
+run_tool = _RUNNER.run
+iter_tool_lines = _RUNNER.iter_lines
+run_tools = _RUNNER.run_many
+start_tool = _RUNNER.start
+cancel_tools = _RUNNER.cancel
+get_tool_stats = _RUNNER.get_stats
+log_tool_stats = _RUNNER.log_stats
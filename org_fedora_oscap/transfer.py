@@ -0,0 +1,320 @@
+#
+# Copyright (C) 2013  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+
+"""
+Module for transferring the content to the target system. Files are cloned
+(reflinked) or copied by the kernel (copy_file_range) where the file systems
+allow it, hard links among the files are preserved and many files are copied
+by multiple threads.
+
+"""
+
+import os
+import sys
+import stat
+import errno
+import fcntl
+import ctypes
+import ctypes.util
+import shutil
+import logging
+import threading
+import multiprocessing
+import Queue
+
+from collections import namedtuple
+
+from org_fedora_oscap import utils
+
+log = logging.getLogger("anaconda")
+
+# everything else should be private
+__all__ = ["copy_file", "transfer_files", "TransferStats"]
+
+# ioctl cloning the whole file (see ioctl_ficlone(2))
+FICLONE = 0x40049409
+
+# maximum number of bytes copied by one copy_file_range call and buffer size
+# for the copying in the user space
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+IO_BUF_SIZE = 1024 * 1024
+
+# errors meaning the method is not available for the files
+_UNSUPPORTED_ERRNOS = (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.ENOTTY,
+                       errno.EOPNOTSUPP, errno.EBADF, errno.EPERM)
+
+# methods of the file transfer
+METHOD_CLONE = "clone"
+METHOD_COPY_RANGE = "copy_file_range"
+METHOD_COPY = "copy"
+METHOD_LINK = "link"
+
+# namedtuple class for statistics of the transfer (bytes only count the data
+# actually cloned or copied, methods map to the numbers of files)
+# pylint: disable-msg=C0103
+TransferStats = namedtuple("TransferStats", ["files", "bytes", "methods"])
+
+def _get_copy_file_range():
+    """Get the copy_file_range function from libc or None."""
+
+    lib_path = ctypes.util.find_library("c")
+    if not lib_path:
+        return None
+
+    try:
+        func = getattr(ctypes.CDLL(lib_path, use_errno=True),
+                       "copy_file_range")
+    except (OSError, AttributeError):
+        return None
+
+    func.argtypes = [ctypes.c_int, ctypes.POINTER(ctypes.c_longlong),
+                     ctypes.c_int, ctypes.POINTER(ctypes.c_longlong),
+                     ctypes.c_size_t, ctypes.c_uint]
+    func.restype = ctypes.c_ssize_t
+    return func
+
+_copy_file_range = _get_copy_file_range()
+
+def _clone(src_fd, dst_fd):
+    """
+    Clone (reflink) the data of the source file to the destination file.
+
+    :return: whether the file was cloned or not (not supported)
+    :rtype: bool
+
+    """
+
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except IOError as ioerr:
+        if ioerr.errno in _UNSUPPORTED_ERRNOS:
+            return False
+        raise
+
+    return True
+
+def _copy_range(src_fd, dst_fd):
+    """
+    Copy the data of the source file (from its current offset) to the
+    destination file by the kernel.
+
+    :return: whether the whole file was copied or not (the copy_file_range
+             not supported, the rest needs to be copied in the user space)
+    :rtype: bool
+
+    """
+
+    if not _copy_file_range:
+        return False
+
+    while True:
+        ret = _copy_file_range(src_fd, None, dst_fd, None, COPY_CHUNK_SIZE, 0)
+        if ret == 0:
+            return True
+        elif ret < 0:
+            err = ctypes.get_errno()
+            if err == errno.EINTR:
+                continue
+            if err in _UNSUPPORTED_ERRNOS:
+                return False
+            raise OSError(err, os.strerror(err))
+
+def _copy(src_fd, dst_fd):
+    """Copy the data of the source file (from its current offset)."""
+
+    buf = os.read(src_fd, IO_BUF_SIZE)
+    while buf:
+        while buf:
+            written = os.write(dst_fd, buf)
+            buf = buf[written:]
+        buf = os.read(src_fd, IO_BUF_SIZE)
+
+def copy_file(src, dst):
+    """
+    Copy the file with its metadata (like shutil.copy2). The data is cloned if
+    the file systems allow it, copied by the kernel if possible and by reading
+    and writing it otherwise.
+
+    :param src: path to the source file
+    :type src: str
+    :param dst: path to the destination file (not a directory)
+    :type dst: str
+    :return: the method used to copy the data (one of the METHOD_* constants)
+    :rtype: str
+
+    """
+
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            if _clone(src_fd, dst_fd):
+                method = METHOD_CLONE
+            elif _copy_range(src_fd, dst_fd):
+                method = METHOD_COPY_RANGE
+            else:
+                # continue from where the copy_file_range stopped (if it
+                # copied something)
+                _copy(src_fd, dst_fd)
+                method = METHOD_COPY
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+    shutil.copystat(src, dst)
+    return method
+
+def _collect_files(src_root, paths):
+    """
+    Get the files (also from the directories) given by the paths relative to
+    the source root.
+
+    :return: relative paths of the files and of the directories
+    :rtype: ([str], [str])
+
+    """
+
+    files = []
+    dirs = []
+    for path in paths:
+        full_path = utils.join_paths(src_root, path)
+        if not os.path.isdir(full_path):
+            files.append(os.path.normpath(path))
+            continue
+
+        dirs.append(os.path.normpath(path))
+        for (dirpath, dirnames, filenames) in os.walk(full_path):
+            rel_dir = os.path.relpath(dirpath, src_root)
+            dirs.extend(os.path.join(rel_dir, name) for name in dirnames)
+            files.extend(os.path.join(rel_dir, name) for name in filenames)
+
+    return (files, dirs)
+
+def transfer_files(src_root, paths, dst_root, jobs=None):
+    """
+    Transfer the given files and directories (with everything in them) from
+    the source root to the destination root keeping their relative paths.
+    Files that are hard links to the same data in the source are hard links
+    to the same data in the destination. The files are copied by multiple
+    threads.
+
+    :see: copy_file
+    :param src_root: the source root directory
+    :type src_root: str
+    :param paths: paths of the files and directories relative to the source
+                  root
+    :type paths: iterable of strings
+    :param dst_root: the destination root directory
+    :type dst_root: str
+    :param jobs: maximum number of files copied concurrently (the number of
+                 CPUs, but at least 2 by default)
+    :type jobs: int or None
+    :return: statistics of the transfer
+    :rtype: TransferStats
+    :raise OSError, IOError: if some of the files cannot be transferred
+
+    """
+
+    files, dirs = _collect_files(src_root, paths)
+
+    # create the directory tree first, the files are copied in any order
+    utils.ensure_dir_exists(dst_root)
+    for rel_path in dirs + [os.path.dirname(fpath) for fpath in files]:
+        utils.ensure_dir_exists(utils.join_paths(dst_root, rel_path))
+
+    # copy the data of every inode only once, link the rest in the end
+    to_copy = []
+    to_link = []
+    copied_inodes = dict()
+    total_size = 0
+    for rel_path in sorted(set(files)):
+        src_stat = os.stat(utils.join_paths(src_root, rel_path))
+        if not stat.S_ISREG(src_stat.st_mode):
+            # nothing like devices or FIFOs in the content
+            continue
+
+        inode = (src_stat.st_dev, src_stat.st_ino)
+        if src_stat.st_nlink > 1 and inode in copied_inodes:
+            to_link.append((copied_inodes[inode], rel_path))
+        else:
+            copied_inodes[inode] = rel_path
+            to_copy.append((src_stat.st_size, rel_path))
+            total_size += src_stat.st_size
+
+    # the biggest files first so that the threads finish at the same time
+    queue = Queue.Queue()
+    for (_size, rel_path) in sorted(to_copy, reverse=True):
+        queue.put(rel_path)
+
+    methods = dict()
+    errors = []
+    lock = threading.Lock()
+
+    def worker():
+        """Helper function copying files until there are no more."""
+        while True:
+            try:
+                rel_path = queue.get_nowait()
+            except Queue.Empty:
+                return
+
+            try:
+                method = copy_file(utils.join_paths(src_root, rel_path),
+                                   utils.join_paths(dst_root, rel_path))
+            except (OSError, IOError):
+                with lock:
+                    errors.append(sys.exc_info())
+                return
+
+            with lock:
+                methods[method] = methods.get(method, 0) + 1
+
+    if not jobs:
+        try:
+            jobs = max(multiprocessing.cpu_count(), 2)
+        except NotImplementedError:
+            jobs = 2
+
+    threads = [threading.Thread(target=worker)
+               for _i in range(min(jobs, len(to_copy)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        exc_info = errors[0]
+        raise exc_info[0], exc_info[1], exc_info[2]
+
+    for (target, rel_path) in to_link:
+        dst = utils.join_paths(dst_root, rel_path)
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        os.link(utils.join_paths(dst_root, target), dst)
+    if to_link:
+        methods[METHOD_LINK] = len(to_link)
+
+    stats = TransferStats(len(to_copy) + len(to_link), total_size, methods)
+    log.info("Transferred %d files (%d bytes) from '%s' to '%s': %s",
+             stats.files, stats.bytes, src_root, dst_root,
+             ", ".join("%d by %s" % (count, method)
+                       for (method, count) in sorted(methods.items())))
+
+    return stats
@@ -25,6 +25,24 @@ import os.path
 import shutil
 import glob
 import hashlib
+import threading
+
+from org_fedora_oscap import timing
+
+# names of the hashing algorithms supported for fingerprints by the size of
+# their digests (in bytes)
+HASH_ALGORITHMS = {16: "md5", 20: "sha1", 28: "sha224", 32: "sha256",
+                   48: "sha384", 64: "sha512"}
+
+# size of the buffer the files are read into when computing digests
+DIGEST_BUF_SIZE = 1024 * 1024
+
+# (path, device, inode, mtime, ctime, size) -> {algorithm: hexdigest}
+_DIGESTS_CACHE = dict()
+_DIGESTS_CACHE_LOCK = threading.Lock()
+
+# reusable buffers for reading files (one per thread)
+_BUFFERS = threading.local()
 
 def ensure_dir_exists(dirpath):
     """
@@ -109,6 +127,19 @@ def keep_type_map(func, iterable):
     else:
         return items_gen
 
+def intern_value(value):
+    """
+    Intern the value (an ID, mount point, package name,...) if possible. The
+    same values appear in many rules and profiles, there is no need to store
+    them multiple times. Only byte strings can be interned, other values
+    (e.g. unicode strings) are returned as they are.
+
+    """
+
+    if type(value) is str:
+        return intern(value)
+    return value
+
 def join_paths(path1, path2):
     """
     Joins two paths as one would expect -- i.e. just like the os.path.join
@@ -141,40 +172,111 @@ def get_hashing_algorithm(fingerprint):
 
     """
 
-    hashes = (hashlib.md5(), hashlib.sha1(), hashlib.sha224(),
-              hashlib.sha256(), hashlib.sha384(), hashlib.sha512())
-
     if len(fingerprint) % 2 == 1:
         return None
 
-    num_bytes = len(fingerprint) / 2
+    algorithm = HASH_ALGORITHMS.get(len(fingerprint) / 2)
+    if algorithm is None:
+        return None
+
+    return hashlib.new(algorithm)
 
-    for hash_obj in hashes:
-        # pylint: disable-msg=E1103
-        if hash_obj.digest_size == num_bytes:
-            return hash_obj
+def _get_buffer():
+    """Get the current thread's buffer for reading files."""
 
-    return None
+    buf = getattr(_BUFFERS, "buf", None)
+    if buf is None:
+        buf = _BUFFERS.buf = bytearray(DIGEST_BUF_SIZE)
 
+    return buf
+
+def _get_digests_cache_key(fpath, stat):
+    """Get the key of the file's digests in the cache."""
+
+    return (os.path.realpath(fpath), stat.st_dev, stat.st_ino, stat.st_mtime,
+            stat.st_ctime, stat.st_size)
+
+def cache_file_digests(fpath, hash_objs):
+    """
+    Store digests of the given file computed elsewhere (e.g. while the file
+    was being written) in the cache used by get_file_digests.
+
+    :param fpath: path to the file the digests were computed for
+    :type fpath: str
+    :param hash_objs: hash objects updated with all the file's data
+    :type hash_objs: iterable of hashlib.HASH objects
+
+    """
+
+    cache_key = _get_digests_cache_key(fpath, os.stat(fpath))
+    digests = dict((hash_obj.name.lower(), hash_obj.hexdigest())
+                   for hash_obj in hash_objs)
+    with _DIGESTS_CACHE_LOCK:
+        digests.update(_DIGESTS_CACHE.get(cache_key, dict()))
+        _DIGESTS_CACHE[cache_key] = digests
+
+def get_file_digests(fpath, algorithms):
+    """
+    Get digests of the given file computed by the given hashing algorithms in
+    a single pass over the file. The digests are cached until the file is
+    changed (its inode, mtime, ctime or size changes).
+
+    :param fpath: path to the file to get digests for
+    :type fpath: str
+    :param algorithms: names of the hashing algorithms (e.g. "sha256") as
+                       accepted by hashlib.new
+    :type algorithms: iterable of str
+    :return: hexadecimal digests of the file by the (lowercase) algorithm
+             names
+    :rtype: dict
+
+    """
+
+    algorithms = set(algorithm.lower() for algorithm in algorithms)
+    with open(fpath, "rb") as fobj:
+        cache_key = _get_digests_cache_key(fpath, os.fstat(fobj.fileno()))
+
+        with _DIGESTS_CACHE_LOCK:
+            cached = _DIGESTS_CACHE.get(cache_key, dict())
+        missing = algorithms.difference(cached)
+
+        if missing:
+            hash_objs = [(algorithm, hashlib.new(algorithm))
+                         for algorithm in missing]
+            buf = _get_buffer()
+            view = memoryview(buf)
+            num_read = fobj.readinto(buf)
+            while num_read:
+                chunk = view[:num_read]
+                for (_algorithm, hash_obj) in hash_objs:
+                    hash_obj.update(chunk)
+                num_read = fobj.readinto(buf)
+
+            digests = dict(cached)
+            digests.update((algorithm, hash_obj.hexdigest())
+                           for (algorithm, hash_obj) in hash_objs)
+            with _DIGESTS_CACHE_LOCK:
+                _DIGESTS_CACHE[cache_key] = digests
+        else:
+            digests = cached
+
+    return dict((algorithm, digests[algorithm]) for algorithm in algorithms)
+
+@timing.timed("fingerprint check")
 def get_file_fingerprint(fpath, hash_obj):
     """
     Get fingerprint of the given file with the given hashing algorithm.
 
+    :see: get_file_digests
     :param fpath: path to the file to get fingerprint for
     :type fpath: str
-    :param hash_obj: hashing algorithm to get fingerprint with
+    :param hash_obj: hashing algorithm to get fingerprint with (only its name
+                     is used, the object is not updated)
     :type hash_obj: hashlib.HASH
     :return: fingerprint of the given file with the given algorithm
     :rtype: hexadecimal str
 
     """
 
-    with open(fpath, "r") as fobj:
-        bsize = 4*1024
-        # process file as 4 KB blocks
-        buf = fobj.read(bsize)
-        while buf:
-            hash_obj.update(buf)
-            buf = fobj.read(bsize)
-
-    return hash_obj.hexdigest()
+    algorithm = hash_obj.name.lower()
+    return get_file_digests(fpath, [algorithm])[algorithm]
@@ -22,36 +22,59 @@
 
 import unittest
 import os
+import io
+import shutil
+import tempfile
+import tarfile
+import zipfile
+import subprocess
 import mock
+from collections import OrderedDict
 from org_fedora_oscap import common
+from org_fedora_oscap import utils
+from org_fedora_oscap import tool_runner
 
 class OSCAPtoolRunningTest(unittest.TestCase):
     def setUp(self):
         self.mock_subprocess = mock.Mock()
         self.mock_subprocess.Popen = mock.Mock()
         self.mock_popen = mock.Mock()
-        self.mock_communicate = mock.Mock()
 
-        self.mock_communicate.return_value = ("", "")
-
-        self.mock_popen.communicate = self.mock_communicate
+        # the output of the oscap tool is streamed
+        self.mock_popen.stdout = io.BytesIO(b"")
+        self.mock_popen.stderr = io.BytesIO(b"")
         self.mock_popen.returncode = 0
 
+        # above the maximum PID on Linux, no such process (group) exists
+        self.mock_popen.pid = 2**22 + 1
+
         self.mock_subprocess.Popen.return_value = self.mock_popen
         self.mock_subprocess.PIPE = mock.Mock()
 
         self.mock_utils = mock.Mock()
         self.mock_utils.ensure_dir_exists = mock.Mock()
 
+        # the tools are run by the tool_runner module (directly, not through
+        # setsid, to check the command line)
+        tool_runner.subprocess = self.mock_subprocess
+        self.setsid = mock.patch.object(tool_runner, "_have_setsid",
+                                        return_value=False)
+        self.setsid.start()
+
         self.run_oscap_remediate = common.run_oscap_remediate
-        self.run_oscap_remediate.func_globals["subprocess"] = self.mock_subprocess
         self.run_oscap_remediate.func_globals["utils"] = self.mock_utils
 
+    def tearDown(self):
+        # other tests run the real processes
+        tool_runner.subprocess = subprocess
+        self.setsid.stop()
+        self.run_oscap_remediate.func_globals["utils"] = utils
+
     def run_oscap_remediate_profile_only_test(self):
         self.run_oscap_remediate("myprofile", "my_ds.xml")
 
         # check calls where done right
-        args = ["oscap", "xccdf", "eval", "--remediate",
+        args = ["oscap", "xccdf", "eval", "--remediate", "--progress",
                 "--results=%s" % common.RESULTS_PATH, "--profile=myprofile",
                 "my_ds.xml"]
 
@@ -79,7 +102,7 @@ class OSCAPtoolRunningTest(unittest.TestCase):
         self.run_oscap_remediate("myprofile", "my_ds.xml", "my_ds_id")
 
         # check calls where done right
-        args = ["oscap", "xccdf", "eval", "--remediate",
+        args = ["oscap", "xccdf", "eval", "--remediate", "--progress",
                 "--results=%s" % common.RESULTS_PATH, "--profile=myprofile",
                 "--datastream-id=my_ds_id", "my_ds.xml"]
 
@@ -108,7 +131,7 @@ class OSCAPtoolRunningTest(unittest.TestCase):
                                  "my_xccdf_id")
 
         # check calls where done right
-        args = ["oscap", "xccdf", "eval", "--remediate",
+        args = ["oscap", "xccdf", "eval", "--remediate", "--progress",
                 "--results=%s" % common.RESULTS_PATH, "--profile=myprofile",
                 "--datastream-id=my_ds_id", "--xccdf-id=my_xccdf_id",
                 "my_ds.xml"]
@@ -145,5 +168,621 @@ class OSCAPtoolRunningTest(unittest.TestCase):
         chroot_dir = "/mnt/test" + common.RESULTS_PATH
         self.mock_utils.ensure_dir_exists.assert_called_with_args(chroot_dir)
 
+    def run_oscap_remediate_output_test(self):
+        self.mock_popen.stdout = io.BytesIO(b"Title\nRule\nResult\n")
+
+        output = self.run_oscap_remediate("myprofile", "my_ds.xml")
+        self.assertEqual(output, "Title\nRule\nResult\n")
+
+    def run_oscap_remediate_stderr_test(self):
+        self.mock_popen.stderr = io.BytesIO(b"Something went wrong")
+
+        with self.assertRaisesRegexp(common.OSCAPaddonError, "went wrong"):
+            self.run_oscap_remediate("myprofile", "my_ds.xml")
+
+    def run_oscap_remediate_failed_test(self):
+        self.mock_popen.returncode = 1
+
+        with self.assertRaises(common.OSCAPaddonError):
+            self.run_oscap_remediate("myprofile", "my_ds.xml")
+
+    def run_oscap_remediate_checks_failed_test(self):
+        # 2 -- some checks/fixes failed, not an error of the tool
+        self.mock_popen.returncode = 2
+
+        self.run_oscap_remediate("myprofile", "my_ds.xml")
+
+    def iter_oscap_remediate_test(self):
+        self.mock_popen.stdout = io.BytesIO(b"Title\nRule\n")
+
+        lines = common.iter_oscap_remediate("myprofile", "my_ds.xml")
+        self.assertEqual(next(lines), "Title\n")
+
+        # closing the generator before the end should kill the process
+        lines.close()
+        self.assertTrue(self.mock_popen.kill.called)
+
+class RemediationProgressTest(unittest.TestCase):
+    """Tests for the progress reporting of the evaluation and remediation."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.tmp_dir, "timing.log")
+        self.report_path = os.path.join(self.tmp_dir, "hot_rules.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def progress_test(self):
+        lines = ["--- Starting Evaluation ---\n",
+                 "xccdf_org.ssgproject.content_rule_a:pass\n",
+                 "xccdf_org.ssgproject.content_rule_b:fail\n",
+                 "xccdf_org.ssgproject.content_rule_b:fixed\n",
+                 ]
+        progress_cb = mock.Mock()
+
+        tracked = common._track_remediation_progress(iter(lines), self.log_path,
+                                                     self.report_path,
+                                                     progress_cb)
+
+        # lines should be passed through
+        self.assertEqual(list(tracked), lines)
+
+        # one progress report for each processed rule
+        self.assertEqual(progress_cb.call_count, 3)
+        progress = progress_cb.call_args[0][0]
+        self.assertEqual(progress.done, 3)
+        self.assertEqual(progress.rule, "xccdf_org.ssgproject.content_rule_b")
+        self.assertEqual(progress.result, "fixed")
+
+        with open(self.log_path, "r") as log_file:
+            log_lines = log_file.readlines()
+
+        # rule, result, start and duration for every processed rule
+        self.assertEqual(len(log_lines), 3)
+        fields = log_lines[0].split("\t")
+        self.assertEqual(fields[:2], ["xccdf_org.ssgproject.content_rule_a",
+                                      "pass"])
+        self.assertTrue(all(float(field) >= 0 for field in fields[2:]))
+
+        # hot rules report should be written in the end
+        self.assertTrue(os.path.exists(self.report_path))
+
+    def times_test(self):
+        lines = ["rule_a:pass\n", "rule_b:fail\n", "rule_b:fixed\n"]
+        progress_cb = mock.Mock()
+
+        # the first call is when rule_a is reported, oscap's startup before
+        # that is not counted
+        with mock.patch.object(common.timing, "monotonic",
+                               side_effect=[100.0, 101.5, 104.0]):
+            list(common._track_remediation_progress(iter(lines),
+                                                    self.log_path,
+                                                    self.report_path,
+                                                    progress_cb))
+
+        with open(self.log_path, "r") as log_file:
+            log_lines = [line.split("\t") for line in log_file]
+        self.assertEqual([[float(field) for field in fields[2:]]
+                          for fields in log_lines],
+                         [[0.0, 0.0], [0.0, 1.5], [1.5, 2.5]])
+        self.assertEqual([call[0][0].elapsed
+                          for call in progress_cb.call_args_list],
+                         [0.0, 1.5, 4.0])
+
+    def no_rules_test(self):
+        tracked = common._track_remediation_progress(iter(["Error\n"]),
+                                                     self.log_path,
+                                                     self.report_path)
+        self.assertEqual(list(tracked), ["Error\n"])
+
+        # no rule processed --> no log, no report
+        self.assertFalse(os.path.exists(self.log_path))
+        self.assertFalse(os.path.exists(self.report_path))
+
+    def report_failure_test(self):
+        # the tool's failure is not masked and its output is closed even if
+        # the report cannot be written
+        def tool_lines():
+            yield "rule_a:pass\n"
+            raise common.OSCAPaddonError("oscap failed")
+
+        lines = mock.Mock()
+        lines.__iter__ = mock.Mock(return_value=tool_lines())
+        report_path = os.path.join(self.tmp_dir, "missing", "hot_rules.txt")
+        tracked = common._track_remediation_progress(lines, self.log_path,
+                                                     report_path)
+
+        with self.assertRaisesRegexp(common.OSCAPaddonError, "oscap failed"):
+            list(tracked)
+        lines.close.assert_called_once_with()
+        self.assertFalse(os.path.exists(report_path))
+
+    def hot_rules_report_test(self):
+        rule_times = {"rule_a": [0.5, ["pass"]],
+                      "rule_b": [3.0, ["fail", "fixed"]],
+                      "rule_c": [1.5, ["fail", "error"]],
+                      }
+        common.write_hot_rules_report(rule_times, self.report_path)
+
+        with open(self.report_path, "r") as report:
+            lines = [line for line in report if not line.startswith("#")]
+
+        # slowest rules first
+        self.assertEqual([line.split("\t")[2] for line in lines],
+                         ["rule_b", "rule_c", "rule_a"])
+        self.assertEqual(lines[0], "3.000\t60.0\trule_b\tfail,fixed\n")
+
+FIX_SCRIPT = """#!/bin/bash
+# generated fix script
+###############################################################################
+# BEGIN fix (1 / 4) for 'rule_pkg'
+###############################################################################
+yum -y install aide
+# END fix for 'rule_pkg'
+###############################################################################
+# BEGIN fix (2 / 4) for 'rule_a'
+###############################################################################
+echo "a" >> /etc/login.defs
+# END fix for 'rule_a'
+###############################################################################
+# BEGIN fix (3 / 4) for 'rule_b'
+###############################################################################
+echo "b" >> /etc/issue
+# END fix for 'rule_b'
+###############################################################################
+# BEGIN fix (4 / 4) for 'rule_c'
+###############################################################################
+sed -i 's/x/y/' /etc/login.defs
+# END fix for 'rule_c'
+"""
+
+class ParallelRemediationTest(unittest.TestCase):
+    """Tests for the helper functions of the parallel remediation."""
+
+    def split_fix_script_test(self):
+        prologue, fixes = common.split_fix_script(FIX_SCRIPT)
+
+        self.assertTrue(prologue.startswith("#!/bin/bash\n"))
+        self.assertEqual(fixes.keys(), ["rule_pkg", "rule_a", "rule_b",
+                                        "rule_c"])
+        self.assertIn("yum -y install aide", fixes["rule_pkg"])
+        self.assertNotIn("/etc/issue", fixes["rule_a"])
+
+    def group_fixes_test(self):
+        _prologue, fixes = common.split_fix_script(FIX_SCRIPT)
+        groups = common.group_fixes(fixes)
+
+        # packages first, fixes touching the same file together
+        self.assertEqual(groups.keys()[0], "packages")
+        group_rules = sorted([rule for (rule, _fix) in group]
+                             for group in groups.itervalues())
+        self.assertEqual(group_rules, [["rule_a", "rule_c"], ["rule_b"],
+                                       ["rule_pkg"]])
+
+    def group_overlapping_fixes_test(self):
+        fixes = OrderedDict([
+            ("rule_sshd", "sed -i 's/^X11/#X11/' /etc/ssh/sshd_config"),
+            ("rule_svc", "echo 'Ciphers aes' >> /etc/ssh/sshd_config\n"
+                         "systemctl restart sshd"),
+            ("rule_sysctl", "sysctl -w kernel.randomize_va_space=2"),
+            ("rule_var", 'echo "b" >> "$conf_dir/issue"'),
+            ("rule_issue", 'echo "b" >> /etc/issue'),
+            ])
+        groups = common.group_fixes(fixes)
+
+        # fixes with unknown files first, a file shared with a service fix
+        # merges the groups
+        self.assertEqual(groups.keys()[0], "misc")
+        self.assertEqual(sorted(groups.keys()), ["files0", "misc", "services",
+                                                 "sysctl"])
+        self.assertEqual(groups["misc"], [("rule_var", fixes["rule_var"])])
+        self.assertEqual([rule for (rule, _fix) in groups["services"]],
+                         ["rule_sshd", "rule_svc"])
+
+    def group_globs_and_dirs_test(self):
+        fixes = OrderedDict([
+            ("rule_pam_all", "sed -i 's/nullok//' /etc/pam.d/*"),
+            ("rule_pam_auth", "sed -i 's/x/y/' /etc/pam.d/system-auth"),
+            ("rule_ssh_dir", "find /etc/ssh -name '*_key' -delete"),
+            ("rule_sshd", 'echo "Protocol 2" >> /etc/ssh/sshd_config'),
+            ("rule_issue", 'echo "b" >> /etc/issue'),
+            ])
+        groups = common.group_fixes(fixes)
+
+        # a glob or a directory overlaps with the files under it
+        group_rules = sorted([rule for (rule, _fix) in group]
+                             for group in groups.itervalues())
+        self.assertEqual(group_rules, [["rule_issue"],
+                                       ["rule_pam_all", "rule_pam_auth"],
+                                       ["rule_ssh_dir", "rule_sshd"]])
+
+    def package_fixes_test(self):
+        script = FIX_SCRIPT + """
+###############################################################################
+# BEGIN fix (5 / 7) for 'rule_remove'
+###############################################################################
+(>&2 echo "Remediating rule 5/7: 'rule_remove'")
+# Include source function library.
+. /usr/share/scap-security-guide/remediation_functions
+package_command remove telnet-server
+# END fix for 'rule_remove'
+###############################################################################
+# BEGIN fix (6 / 7) for 'rule_dnf'
+###############################################################################
+dnf install -y tmux screen
+# END fix for 'rule_dnf'
+###############################################################################
+# BEGIN fix (7 / 7) for 'rule_conditional'
+###############################################################################
+if rpm --quiet -q kernel; then
+yum -y install audit
+fi
+# END fix for 'rule_conditional'
+"""
+        _prologue, fixes = common.split_fix_script(script)
+        add_pkgs, remove_pkgs = common.package_fixes_from_script(fixes)
+
+        # only fixes doing nothing else than installing/removing packages
+        self.assertEqual(add_pkgs, {"aide", "tmux", "screen"})
+        self.assertEqual(remove_pkgs, {"telnet-server"})
+
+    def get_failed_rules_test(self):
+        results = """<?xml version="1.0"?>
+<Benchmark xmlns="http://checklists.nist.gov/xccdf/1.2">
+  <TestResult id="xccdf_org.open-scap_testresult_default">
+    <rule-result idref="rule_a"><result>pass</result></rule-result>
+    <rule-result idref="rule_b"><result>fail</result></rule-result>
+    <rule-result idref="rule_c"><result>notselected</result></rule-result>
+  </TestResult>
+</Benchmark>
+"""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            results_path = os.path.join(tmp_dir, "results.xml")
+            with open(results_path, "w") as results_file:
+                results_file.write(results)
+
+            result_id, failed = common._get_failed_rules(results_path)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        self.assertEqual(result_id, "xccdf_org.open-scap_testresult_default")
+        self.assertEqual(failed, ["rule_b"])
+
+FAKE_OSCAP = """#!/bin/bash
+# fake oscap tool, rule_a fails until its fix is applied
+echo "$@" >> "$FAKE_ROOT/calls"
+if [ "$2" = "eval" ]; then
+    for arg in "$@"; do
+        case "$arg" in --results=*) results="$FAKE_ROOT${arg#--results=}";; esac
+    done
+    [ -e "$FAKE_ROOT/fixed" ] && result=pass || result=fail
+    mkdir -p "$(dirname "$results")"
+    cat > "$results" <<END
+<Benchmark><TestResult id="test_result">
+<rule-result idref="rule_a"><result>$result</result></rule-result>
+</TestResult></Benchmark>
+END
+    echo "rule_a:$result"
+    [ $result = pass ] && exit 0 || exit 2
+elif [ "$2" = "generate" ]; then
+    echo "# BEGIN fix (1 / 1) for 'rule_a'"
+    echo "${FAKE_FIX:-touch \"\$FAKE_ROOT/fixed\"}"
+    echo "# END fix for 'rule_a'"
+fi
+"""
+
+class FakeOSCAPTestCase(unittest.TestCase):
+    """Base class for tests running the remediation with a fake oscap."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp_dir, "root")
+        self.cache_dir = os.path.join(self.tmp_dir, "cache")
+        bin_dir = os.path.join(self.tmp_dir, "bin")
+        os.makedirs(bin_dir)
+        os.makedirs(self.root)
+
+        oscap_path = os.path.join(bin_dir, "oscap")
+        with open(oscap_path, "w") as oscap:
+            oscap.write(FAKE_OSCAP)
+        os.chmod(oscap_path, 0755)
+
+        with open(os.path.join(self.root, "ds.xml"), "w") as content:
+            content.write("<content/>")
+
+        # the fake root is no real system, run everything outside of it
+        chroot_path = os.path.join(bin_dir, "chroot")
+        with open(chroot_path, "w") as chroot:
+            chroot.write("#!/bin/bash\nshift\nexec \"$@\"\n")
+        os.chmod(chroot_path, 0755)
+
+        self.env = mock.patch.dict(os.environ,
+                                   {"FAKE_ROOT": self.root,
+                                    "PATH": bin_dir + ":" + os.environ["PATH"]})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def _calls(self):
+        with open(os.path.join(self.root, "calls"), "r") as calls:
+            return [line.split()[1] for line in calls]
+
+class ParallelEngineTest(FakeOSCAPTestCase):
+    """Tests for the parallel remediation (with a fake oscap)."""
+
+    def _remediate(self):
+        return common.run_oscap_remediate_parallel("myprofile", "/ds.xml",
+                                                   chroot=self.root)
+
+    def _saved_result(self):
+        results_path = os.path.normpath(self.root + common.RESULTS_PATH)
+        _result_id, results = common._get_rule_results(results_path)
+        return results["rule_a"]
+
+    def fixed_test(self):
+        self.assertEqual(self._remediate(), {"rule_a": "fixed"})
+        self.assertEqual(self._calls(), ["eval", "generate", "eval"])
+        self.assertEqual(self._saved_result(), "fixed")
+
+    def ineffective_fix_test(self):
+        # the fix succeeds, but the rule still fails
+        with mock.patch.dict(os.environ, {"FAKE_FIX": "true"}):
+            self.assertEqual(self._remediate(), {"rule_a": "error"})
+        self.assertEqual(self._saved_result(), "error")
+
+    def failed_fix_test(self):
+        with mock.patch.dict(os.environ, {"FAKE_FIX": "exit 1"}):
+            self.assertEqual(self._remediate(), {"rule_a": "error"})
+        self.assertEqual(self._saved_result(), "error")
+
+    def worker_error_test(self):
+        # errors from the worker threads are not lost
+        with mock.patch("org_fedora_oscap.common._run_fix",
+                        side_effect=common.OSCAPaddonError("no bash")):
+            with self.assertRaises(common.OSCAPaddonError):
+                self._remediate()
+
+class CachedRemediationTest(FakeOSCAPTestCase):
+    """Tests for the remediation replaying cached fixes (with a fake oscap)."""
+
+    def _remediate(self, packages=("aide",)):
+        return common.run_oscap_remediate_cached("myprofile", "/ds.xml",
+                                                 self.cache_dir, packages,
+                                                 chroot=self.root)
+
+    def replay_test(self):
+        # nothing recorded yet, full remediation
+        self.assertFalse(self._remediate())
+        self.assertTrue(os.path.exists(os.path.join(self.root, "fixed")))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        # same key on a fresh system --> replay and verification only
+        os.unlink(os.path.join(self.root, "fixed"))
+        os.unlink(os.path.join(self.root, "calls"))
+        self.assertTrue(self._remediate())
+        self.assertTrue(os.path.exists(os.path.join(self.root, "fixed")))
+        self.assertEqual(self._calls(), ["eval"])
+
+    def different_key_test(self):
+        self.assertFalse(self._remediate())
+        os.unlink(os.path.join(self.root, "fixed"))
+
+        # different packages --> no replay
+        self.assertFalse(self._remediate(packages=("aide", "tmux")))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def recording_failure_test(self):
+        # the cache directory cannot be created, the remediation still runs
+        with open(self.cache_dir, "w"):
+            pass
+        self.assertFalse(self._remediate())
+        self.assertTrue(os.path.exists(os.path.join(self.root, "fixed")))
+
+    def _check_untrusted(self):
+        # no recording and no replay, just the full remediation
+        for _i in range(2):
+            self.assertFalse(self._remediate())
+            self.assertTrue(os.path.exists(os.path.join(self.root, "fixed")))
+            self.assertEqual(os.listdir(self.cache_dir), [])
+            os.unlink(os.path.join(self.root, "fixed"))
+
+    def writable_cache_dir_test(self):
+        os.makedirs(self.cache_dir)
+        for mode in (0o777, 0o775, 0o757):
+            os.chmod(self.cache_dir, mode)
+            self._check_untrusted()
+
+    def foreign_cache_dir_test(self):
+        if os.geteuid() != 0:
+            raise unittest.SkipTest("changing the owner requires root")
+
+        os.makedirs(self.cache_dir)
+        os.chown(self.cache_dir, 65534, -1)
+        self._check_untrusted()
+
+    def remediation_failure_test(self):
+        # failures of the remediation itself are not hidden
+        with mock.patch("org_fedora_oscap.common.run_oscap_remediate_parallel",
+                        side_effect=OSError("no bash")):
+            with self.assertRaises(OSError):
+                self._remediate()
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+class ExtractDataTest(unittest.TestCase):
+    """Tests for the extract_data function."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def extract_tar_test(self):
+        content_path = os.path.join(self.tmp_dir, "ds.xml")
+        with open(content_path, "w") as content:
+            content.write("<content/>")
+
+        archive = os.path.join(self.tmp_dir, "content.tar.gz")
+        tfile = tarfile.open(archive, "w:gz")
+        tfile.add(content_path, "ds.xml")
+        tfile.close()
+
+        out_dir = os.path.join(self.tmp_dir, "out")
+        fpaths = common.extract_data(archive, out_dir, ["ds.xml"])
+
+        self.assertEqual(fpaths, [os.path.join(out_dir, "ds.xml")])
+        self.assertTrue(os.path.exists(fpaths[0]))
+
+    def _make_tar(self, *members):
+        archive = os.path.join(self.tmp_dir, "content.tar")
+        tfile = tarfile.open(archive, "w")
+        for member in members:
+            tfile.addfile(member)
+        tfile.close()
+
+        return archive
+
+    def _link(self, name, target, link_type=tarfile.SYMTYPE):
+        member = tarfile.TarInfo(name)
+        member.type = link_type
+        member.linkname = target
+        return member
+
+    def unsafe_tar_paths_test(self):
+        out_dir = os.path.join(self.tmp_dir, "out")
+        for name in ("../escaped.txt", "dir/../../escaped.txt", "/tmp/escaped.txt"):
+            archive = self._make_tar(tarfile.TarInfo(name))
+            with self.assertRaises(common.ExtractionError):
+                common.extract_data(archive, out_dir, [])
+        self.assertFalse(os.path.exists(out_dir))
+
+    def unsafe_tar_links_test(self):
+        out_dir = os.path.join(self.tmp_dir, "out")
+        for member in (self._link("link", "/etc"),
+                       self._link("dir/link", "../../etc"),
+                       self._link("link", "../escaped.txt", tarfile.LNKTYPE)):
+            archive = self._make_tar(member)
+            with self.assertRaises(common.ExtractionError):
+                common.extract_data(archive, out_dir, [])
+        self.assertFalse(os.path.exists(out_dir))
+
+        # links within the archive are fine
+        archive = self._make_tar(tarfile.TarInfo("ds.xml"),
+                                 self._link("dir/link", "file.xml"),
+                                 self._link("hardlink", "ds.xml",
+                                            tarfile.LNKTYPE))
+        common.extract_data(archive, out_dir, [])
+        self.assertTrue(os.path.exists(os.path.join(out_dir, "hardlink")))
+
+    def unsafe_zip_paths_test(self):
+        archive = os.path.join(self.tmp_dir, "content.zip")
+        zfile = zipfile.ZipFile(archive, "w")
+        zfile.writestr("../escaped.txt", "escaped")
+        zfile.close()
+
+        with self.assertRaises(common.ExtractionError):
+            common.extract_data(archive, os.path.join(self.tmp_dir, "out"), [])
+
+class ExtractDataVerifiedTest(unittest.TestCase):
+    """Tests for the staged extraction of the checked archives."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.out_dir = os.path.join(self.tmp_dir, "out")
+
+        content_path = os.path.join(self.tmp_dir, "ds.xml")
+        with open(content_path, "w") as content:
+            content.write("<content/>")
+
+        self.archive = os.path.join(self.tmp_dir, "content.tar.gz")
+        tfile = tarfile.open(self.archive, "w:gz")
+        tfile.add(content_path, "ds.xml")
+        tfile.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _check_fail(self):
+        raise ValueError("Integrity check failed")
+
+    def check_passed_test(self):
+        # existing files in the output directory are kept or replaced
+        os.mkdir(self.out_dir)
+        with open(os.path.join(self.out_dir, "ds.xml"), "w") as old:
+            old.write("<old/>")
+        with open(os.path.join(self.out_dir, "content.xml"), "w") as raw:
+            raw.write("<raw/>")
+
+        fpaths = common.extract_data_verified(self.archive, self.out_dir,
+                                              ["ds.xml"], lambda: None)
+
+        self.assertEqual(fpaths, [os.path.join(self.out_dir, "ds.xml")])
+        with open(fpaths[0], "r") as content:
+            self.assertEqual(content.read(), "<content/>")
+        self.assertEqual(sorted(os.listdir(self.out_dir)),
+                         ["content.xml", "ds.xml"])
+
+        # no staging directory left behind
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         ["content.tar.gz", "ds.xml", "out"])
+
+    def check_failed_test(self):
+        with self.assertRaisesRegexp(ValueError, "Integrity check failed"):
+            common.extract_data_verified(self.archive, self.out_dir,
+                                         ["ds.xml"], self._check_fail)
+
+        # nothing committed, no staging directory left behind
+        self.assertFalse(os.path.exists(self.out_dir))
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         ["content.tar.gz", "ds.xml"])
+
+    def check_failure_priority_test(self):
+        # the failed check is the cause of the failed extraction
+        with self.assertRaisesRegexp(ValueError, "Integrity check failed"):
+            common.extract_data_verified(self.archive, self.out_dir,
+                                         ["missing.xml"], self._check_fail)
+
+        with self.assertRaises(common.ExtractionError):
+            common.extract_data_verified(self.archive, self.out_dir,
+                                         ["missing.xml"], lambda: None)
+        self.assertFalse(os.path.exists(self.out_dir))
+
+    def malicious_archive_test(self):
+        # nothing written outside of the staging directory before the check
+        # of the archive fails
+        escaped = os.path.join(self.tmp_dir, "escaped.txt")
+        content_path = os.path.join(self.tmp_dir, "ds.xml")
+        tfile = tarfile.open(self.archive, "w:gz")
+        tfile.add(content_path, "ds.xml")
+        tfile.add(content_path, "../escaped.txt")
+        tfile.close()
+
+        with self.assertRaisesRegexp(ValueError, "Integrity check failed"):
+            common.extract_data_verified(self.archive, self.out_dir,
+                                         ["ds.xml"], self._check_fail)
+        self.assertFalse(os.path.exists(escaped))
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         ["content.tar.gz", "ds.xml"])
+
+        with self.assertRaisesRegexp(common.ExtractionError, "Unsafe path"):
+            common.extract_data_verified(self.archive, self.out_dir,
+                                         ["ds.xml"], lambda: None)
+        self.assertFalse(os.path.exists(escaped))
+        self.assertFalse(os.path.exists(self.out_dir))
+
+    def staged_test(self):
+        staging_dir, fpaths = common.extract_data_staged(self.archive,
+                                                         self.out_dir,
+                                                         ["ds.xml"])
+        self.assertEqual(fpaths, [os.path.join(staging_dir, "ds.xml")])
+        self.assertFalse(os.path.exists(self.out_dir))
+
+        common.discard_staged_data(staging_dir)
+        self.assertFalse(os.path.exists(staging_dir))
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,205 @@
+#
+# Copyright (C) 2013  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# Red Hat Author(s): Vratislav Podzimek <vpodzime@redhat.com>
+#
+
+"""Module with unit tests for the content_handling.py module"""
+
+import unittest
+import mock
+
+from org_fedora_oscap import content_handling
+
+class FakeIterator(object):
+    """Fake OSCAP iterator over a list of items."""
+
+    def __init__(self, items):
+        self.items = list(items)
+        self.freed = False
+
+    def has_more(self):
+        assert not self.freed, "iterator used after being freed"
+        return bool(self.items)
+
+    def next(self):
+        assert not self.freed, "iterator used after being freed"
+        return self.items.pop(0)
+
+    def free(self):
+        assert not self.freed, "iterator freed twice"
+        self.freed = True
+
+def mock_oscap():
+    """
+    Create a mock of the OSCAP object working with FakeIterator instances of
+    (lang, text) tuples and of (id, title_itr, description_itr) tuples.
+
+    """
+
+    oscap = mock.Mock()
+
+    oscap.oscap_text_iterator_has_more.side_effect = FakeIterator.has_more
+    oscap.oscap_text_iterator_next.side_effect = FakeIterator.next
+    oscap.oscap_text_iterator_free.side_effect = FakeIterator.free
+    oscap.oscap_text_get_lang.side_effect = lambda item: item[0]
+    oscap.oscap_text_get_text.side_effect = lambda item: item[1]
+
+    oscap.xccdf_profile_iterator_has_more.side_effect = FakeIterator.has_more
+    oscap.xccdf_profile_iterator_next.side_effect = FakeIterator.next
+    oscap.xccdf_profile_iterator_free.side_effect = FakeIterator.free
+    oscap.xccdf_profile_get_id.side_effect = lambda profile: profile[0]
+    oscap.xccdf_profile_get_title.side_effect = lambda profile: profile[1]
+    oscap.xccdf_profile_get_description.side_effect = lambda profile: profile[2]
+
+    return oscap
+
+class PreferredLangsTest(unittest.TestCase):
+    """Tests for the get_preferred_langs function."""
+
+    def full_locale_test(self):
+        self.assertEqual(content_handling.get_preferred_langs("cs_CZ.UTF-8@latin"),
+                         ("cs-cz", "cs", "en-us", "en"))
+
+    def lang_only_test(self):
+        self.assertEqual(content_handling.get_preferred_langs("de"),
+                         ("de", "en-us", "en"))
+
+    def c_locale_test(self):
+        self.assertEqual(content_handling.get_preferred_langs("C"),
+                         ("en-us", "en"))
+        self.assertEqual(content_handling.get_preferred_langs("POSIX"),
+                         ("en-us", "en"))
+        self.assertEqual(content_handling.get_preferred_langs(""),
+                         ("en-us", "en"))
+
+    def no_duplicates_test(self):
+        self.assertEqual(content_handling.get_preferred_langs("en_US.UTF-8"),
+                         ("en-us", "en"))
+
+    def env_lang_test(self):
+        with mock.patch.dict("os.environ", {"LANG": "fr_FR.UTF-8"}):
+            self.assertEqual(content_handling.get_preferred_langs(),
+                             ("fr-fr", "fr", "en-us", "en"))
+
+class TextItrGetTextTest(unittest.TestCase):
+    """Tests for the oscap_text_itr_get_text function."""
+
+    def setUp(self):
+        self.oscap_patcher = mock.patch.object(content_handling, "OSCAP",
+                                               mock_oscap())
+        self.oscap_patcher.start()
+
+    def tearDown(self):
+        self.oscap_patcher.stop()
+
+    def _get_text(self, items, langs=("cs-cz", "cs", "en-us", "en")):
+        itr = FakeIterator(items)
+        text = content_handling.oscap_text_itr_get_text(itr, langs)
+        self.assertTrue(itr.freed)
+        return text
+
+    def preferred_lang_test(self):
+        items = [("en-US", "Hello"), ("cs-CZ", "Ahoj")]
+        self.assertEqual(self._get_text(items), "Ahoj")
+
+    def lang_fallback_test(self):
+        # the region-less language is preferred over English
+        items = [("en-US", "Hello"), ("cs", "Ahoj")]
+        self.assertEqual(self._get_text(items), "Ahoj")
+
+        # English if there is no text in the language of the locale
+        items = [("de", "Hallo"), ("en", "Hello")]
+        self.assertEqual(self._get_text(items), "Hello")
+
+    def fragments_test(self):
+        # all fragments in the selected language are joined
+        items = [("en-US", "Hello, "), ("cs", "Ahoj"), ("en-US", "world")]
+        self.assertEqual(self._get_text(items, ("en-us", "en")),
+                         "Hello, world")
+
+    def no_lang_test(self):
+        # texts without the xml:lang attribute come after the preferred ones
+        items = [(None, "Untagged"), ("de", "Hallo")]
+        self.assertEqual(self._get_text(items), "Untagged")
+
+        items = [(None, "Untagged"), ("cs", "Ahoj")]
+        self.assertEqual(self._get_text(items), "Ahoj")
+
+    def no_match_test(self):
+        # none of the preferred languages, the first one available is used
+        items = [("de", "Hallo"), ("fr", "Bonjour")]
+        self.assertEqual(self._get_text(items), "Hallo")
+
+    def empty_test(self):
+        self.assertEqual(self._get_text([]), "")
+
+class ProfilesInfoTest(unittest.TestCase):
+    """Tests for the get_profiles_info function."""
+
+    def setUp(self):
+        self.oscap_patcher = mock.patch.object(content_handling, "OSCAP",
+                                               mock_oscap())
+        self.oscap_patcher.start()
+
+    def tearDown(self):
+        self.oscap_patcher.stop()
+
+    @staticmethod
+    def _profile(id_, title, desc):
+        title_itr = FakeIterator([("en-US", title)])
+        desc_itr = FakeIterator([("en-US", desc)])
+        return (id_, title_itr, desc_itr)
+
+    def profiles_test(self):
+        profiles = [self._profile("common", "Common", "Common profile"),
+                    self._profile("strict", "Strict", "Strict profile")]
+        profile_itr = FakeIterator(profiles)
+        text_itrs = [itr for profile in profiles for itr in profile[1:]]
+
+        infos = content_handling.get_profiles_info(profile_itr, ("en-us", "en"))
+
+        self.assertEqual(infos,
+                         [content_handling.ProfileInfo("common", "Common",
+                                                       "Common profile"),
+                          content_handling.ProfileInfo("strict", "Strict",
+                                                       "Strict profile")])
+        self.assertTrue(profile_itr.freed)
+        self.assertTrue(all(itr.freed for itr in text_itrs))
+
+    def no_profiles_test(self):
+        profile_itr = FakeIterator([])
+        self.assertEqual(content_handling.get_profiles_info(profile_itr,
+                                                            ("en-us", "en")),
+                         [])
+        self.assertTrue(profile_itr.freed)
+
+    def shared_texts_test(self):
+        texts = dict()
+        first = content_handling.get_profiles_info(
+            FakeIterator([self._profile("common", "Common", "Common profile")]),
+            ("en-us", "en"), texts)
+        # equal, but not identical strings
+        second = content_handling.get_profiles_info(
+            FakeIterator([self._profile("common", "".join(["Com", "mon"]),
+                                        " ".join(["Common", "profile"]))]),
+            ("en-us", "en"), texts)
+
+        # the texts from the second call are the ones stored by the first one
+        self.assertIs(first[0].title, second[0].title)
+        self.assertIs(first[0].description, second[0].description)
+        self.assertEqual(set(texts.keys()), set(["Common", "Common profile"]))
@@ -2,9 +2,22 @@
 
 import unittest
 import os
+import shutil
+import tempfile
+import mock
 from pykickstart.errors import KickstartValueError
+from org_fedora_oscap.ks import oscap
 from org_fedora_oscap.ks.oscap import OSCAPdata
-from org_fedora_oscap import common
+from org_fedora_oscap import common, data_fetch, content_handling, signatures
+
+# no content prefetch threads started by finalize()
+THREAD_MGR_PATCHER = mock.patch.object(oscap, "threadMgr")
+
+def setup_module():
+    THREAD_MGR_PATCHER.start()
+
+def teardown_module():
+    THREAD_MGR_PATCHER.stop()
 
 class ParsingTest(unittest.TestCase):
     def setUp(self):
@@ -332,3 +345,314 @@ class FingerprintTests(unittest.TestCase):
         with self.assertRaisesRegexp(KickstartValueError, "Unsupported fingerprint"):
             self.oscap_data.handle_line("fingerprint = %s" % ("a" * 124))
 
+
+class RemediationJobsTests(unittest.TestCase):
+    """Tests for the remediation-jobs option."""
+
+    def setUp(self):
+        self.oscap_data = OSCAPdata("org_fedora_oscap")
+
+    def default_test(self):
+        self.assertEqual(self.oscap_data.remediation_jobs, 1)
+        self.assertNotIn("remediation-jobs", str(self.oscap_data))
+
+    def valid_jobs_test(self):
+        self.oscap_data.handle_line("remediation-jobs = 8")
+        self.assertEqual(self.oscap_data.remediation_jobs, 8)
+        self.assertIn("remediation-jobs = 8", str(self.oscap_data))
+
+    def invalid_jobs_test(self):
+        with self.assertRaises(KickstartValueError):
+            self.oscap_data.handle_line("remediation-jobs = 0")
+        with self.assertRaises(KickstartValueError):
+            self.oscap_data.handle_line("remediation-jobs = many")
+
+class RemediationCacheTests(unittest.TestCase):
+    """Tests for the remediation-cache option."""
+
+    def setUp(self):
+        self.oscap_data = OSCAPdata("org_fedora_oscap")
+
+    def default_test(self):
+        self.assertEqual(self.oscap_data.remediation_cache, "")
+        self.assertNotIn("remediation-cache", str(self.oscap_data))
+
+    def valid_cache_test(self):
+        self.oscap_data.handle_line("remediation-cache = /mnt/cache")
+        self.assertEqual(self.oscap_data.remediation_cache, "/mnt/cache")
+        self.assertIn("remediation-cache = /mnt/cache", str(self.oscap_data))
+
+    def relative_cache_test(self):
+        with self.assertRaises(KickstartValueError):
+            self.oscap_data.handle_line("remediation-cache = cache")
+
+class FilesToTransferTest(unittest.TestCase):
+    """Tests for the selection of the content files for the target system."""
+
+    def setUp(self):
+        self.content_dir = tempfile.mkdtemp(prefix="oscap_transfer_test")
+        self.addCleanup(shutil.rmtree, self.content_dir)
+        patcher = mock.patch.object(common, "INSTALLATION_CONTENT_DIR",
+                                    self.content_dir + "/")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        os.makedirs(os.path.join(self.content_dir, "content"))
+        files = {"content/xccdf.xml":
+                     '<Benchmark xmlns="http://checklists.nist.gov/xccdf/1.2">'
+                     '<Rule><check><check-content-ref href="oval.xml"/>'
+                     '<check-content-ref href="http://example.com/remote.xml"/>'
+                     '</check></Rule></Benchmark>',
+                 "content/oval.xml": "<oval_definitions/>",
+                 "content/unused.xml": "<unused/>",
+                 "content.zip": "archive"}
+        for (rel_path, data) in files.items():
+            with open(os.path.join(self.content_dir, rel_path), "w") as fobj:
+                fobj.write(data)
+
+        self.oscap_data = OSCAPdata("org_fedora_oscap")
+        self.oscap_data.content_type = "archive"
+        self.oscap_data.xccdf_path = "content/xccdf.xml"
+
+    def referenced_files_test(self):
+        self.assertEqual(self.oscap_data._get_files_to_transfer(),
+                         ["content/oval.xml", "content/xccdf.xml"])
+
+    def unparsable_content_test(self):
+        with open(os.path.join(self.content_dir, "content", "xccdf.xml"),
+                  "w") as fobj:
+            fobj.write("<Benchmark")
+
+        self.assertEqual(sorted(self.oscap_data._get_files_to_transfer()),
+                         ["content", "content.zip"])
+
+class SignatureTests(unittest.TestCase):
+    """Tests for the signature option."""
+
+    def setUp(self):
+        self.oscap_data = OSCAPdata("org_fedora_oscap")
+        self.oscap_data.handle_line("content-type = datastream")
+        self.oscap_data.handle_line("content-url = http://example.com/ds.xml")
+
+    def valid_signature_test(self):
+        self.oscap_data.handle_line("signature = http://example.com/ds.xml.asc")
+        self.assertEqual(self.oscap_data.signature,
+                         "http://example.com/ds.xml.asc")
+        self.assertEqual(self.oscap_data.raw_preinst_signature_path,
+                         common.INSTALLATION_CONTENT_DIR + "ds.xml.asc")
+        self.assertIn("signature = http://example.com/ds.xml.asc",
+                      str(self.oscap_data))
+
+    def invalid_signature_test(self):
+        with self.assertRaises(KickstartValueError):
+            self.oscap_data.handle_line("signature = ds.xml.asc")
+
+    def no_certificates_test(self):
+        self.oscap_data.handle_line("signature = http://example.com/ds.xml.asc")
+        with self.assertRaisesRegexp(KickstartValueError, "certificates"):
+            self.oscap_data.finalize()
+
+class PrefetchTests(unittest.TestCase):
+    """Tests for the content prefetch."""
+
+    def setUp(self):
+        self.oscap_data = OSCAPdata("org_fedora_oscap")
+        for line in ["content-type = datastream\n",
+                     "content-url = \"https://example.com/hardening.xml\"\n",
+                     ]:
+            self.oscap_data.handle_line(line)
+
+        # run the prefetch "thread" right away
+        self.thread_mgr = mock.Mock()
+        self.thread_mgr.get.return_value = None
+        self.thread_mgr.add.side_effect = lambda thread: thread.run()
+
+        self.patchers = [mock.patch.object(oscap, "threadMgr", self.thread_mgr),
+                         mock.patch.object(common, "wait_for_network"),
+                         mock.patch.object(data_fetch, "fetch_data"),
+                         mock.patch.object(content_handling,
+                                           "DataStreamHandler")]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def finalize_starts_prefetch_test(self):
+        self.oscap_data.finalize()
+
+        (thread,), _kwargs = self.thread_mgr.add.call_args
+        self.assertEqual(thread.name, common.THREAD_PREFETCH_CONTENT)
+        self.assertTrue(self.oscap_data.prefetch_started)
+
+    def prefetch_test(self):
+        self.oscap_data.finalize()
+
+        self.assertTrue(self.oscap_data.wait_for_prefetch())
+        data_fetch.fetch_data.assert_called_once_with(
+                                    "https://example.com/hardening.xml",
+                                    self.oscap_data.raw_preinst_content_path,
+                                    "", [])
+        self.assertIs(self.oscap_data.content_handling_cls,
+                      content_handling.DataStreamHandler)
+        self.assertIs(self.oscap_data.content_handler,
+                      content_handling.DataStreamHandler.return_value)
+
+    def prefetch_error_test(self):
+        data_fetch.fetch_data.side_effect = data_fetch.FetchError("failed")
+        self.oscap_data.finalize()
+
+        # error raised only once
+        with self.assertRaises(data_fetch.FetchError):
+            self.oscap_data.wait_for_prefetch()
+        self.assertFalse(self.oscap_data.prefetch_started)
+        self.assertFalse(self.oscap_data.wait_for_prefetch())
+
+    def network_retry_test(self):
+        # no network yet when the kickstart is parsed
+        common.wait_for_network.side_effect = [common.OSCAPaddonNetworkError(),
+                                               None, None]
+        with mock.patch.object(oscap, "PREFETCH_NETWORK_CHECK_INTERVAL", 0):
+            self.oscap_data.finalize()
+
+        self.assertTrue(self.oscap_data.wait_for_prefetch())
+        data_fetch.fetch_data.assert_called_once_with(
+                                    "https://example.com/hardening.xml",
+                                    self.oscap_data.raw_preinst_content_path,
+                                    "", [])
+
+    def setup_fallback_test(self):
+        # no network in time for the prefetch, but later
+        common.wait_for_network.side_effect = [common.OSCAPaddonNetworkError(),
+                                               None]
+        with mock.patch.object(oscap, "PREFETCH_NETWORK_TIMEOUT", 0):
+            self.oscap_data.finalize()
+        self.assertFalse(data_fetch.fetch_data.called)
+
+        self.oscap_data.dry_run = True
+        self.oscap_data.setup(mock.Mock(), mock.Mock(), mock.Mock())
+        self.assertTrue(data_fetch.fetch_data.called)
+        self.assertIs(self.oscap_data.content_handler,
+                      content_handling.DataStreamHandler.return_value)
+
+    def clear_all_test(self):
+        # the prefetch is still running when the values are cleared
+        self.thread_mgr.add.side_effect = None
+        self.oscap_data.finalize()
+        (thread,), _kwargs = self.thread_mgr.add.call_args
+
+        self.oscap_data.clear_all()
+        self.assertFalse(self.thread_mgr.wait.called)
+
+        # its results are ignored
+        thread.run()
+        self.assertTrue(data_fetch.fetch_data.called)
+        self.assertEqual(self.oscap_data.content_url, "")
+        self.assertIsNone(self.oscap_data.content_handler)
+        self.assertFalse(self.oscap_data.wait_for_prefetch())
+
+    def changed_content_test(self):
+        self.oscap_data.finalize()
+        self.oscap_data.content_url = "https://example.com/other.xml"
+
+        self.assertFalse(self.oscap_data.prefetch_started)
+        self.assertFalse(self.oscap_data.wait_for_prefetch())
+
+    def fingerprint_mismatch_test(self):
+        tmp_dir = tempfile.mkdtemp(prefix="oscap_prefetch_test")
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        content_path = os.path.join(tmp_dir, "hardening.xml")
+        with open(content_path, "w") as fobj:
+            fobj.write("<content/>")
+
+        self.oscap_data.handle_line("fingerprint = %s" % ("a" * 32))
+        with mock.patch.object(OSCAPdata, "raw_preinst_content_path",
+                               content_path):
+            self.oscap_data.finalize()
+
+            with self.assertRaises(content_handling.ContentCheckError):
+                self.oscap_data.wait_for_prefetch()
+
+    def signature_test(self):
+        self.oscap_data.handle_line("certificates = /root/keyring.gpg")
+        self.oscap_data.handle_line("signature = http://example.com/hardening.xml.asc")
+
+        with mock.patch.object(signatures, "SignatureVerifier") as verifier_cls:
+            self.oscap_data.finalize()
+            self.assertTrue(self.oscap_data.wait_for_prefetch())
+
+        verifier = verifier_cls.return_value
+        verifier_cls.assert_called_once_with(\
+                                    self.oscap_data.raw_preinst_signature_path,
+                                    "/root/keyring.gpg")
+        verifier.verify.assert_called_once_with()
+
+        # the certificates are used for the signature, the content is fed to
+        # the verifier as it is being fetched
+        self.assertEqual(data_fetch.fetch_data.call_args_list,
+                         [mock.call("http://example.com/hardening.xml.asc",
+                                    self.oscap_data.raw_preinst_signature_path,
+                                    None),
+                          mock.call("https://example.com/hardening.xml",
+                                    self.oscap_data.raw_preinst_content_path,
+                                    None, [verifier])])
+
+    def signature_mismatch_test(self):
+        self.oscap_data.handle_line("certificates = /root/keyring.gpg")
+        self.oscap_data.handle_line("signature = https://example.com/hardening.xml.asc")
+
+        with mock.patch.object(signatures, "SignatureVerifier") as verifier_cls:
+            verifier_cls.return_value.verify.side_effect = \
+                signatures.SignatureVerificationError("BAD signature")
+            self.oscap_data.finalize()
+
+            with self.assertRaises(signatures.SignatureVerificationError):
+                self.oscap_data.wait_for_prefetch()
+
+class SetupPackagesTests(unittest.TestCase):
+    """Tests for the package lists changed by the setup method."""
+
+    def setUp(self):
+        self.oscap_data = OSCAPdata("org_fedora_oscap")
+        self.oscap_data.content_type = "scap-security-guide"
+        self.oscap_data.profile_id = "common"
+        self.oscap_data.rule_data = mock.Mock()
+        self.oscap_data.rule_data.eval_rules.return_value = []
+
+        self.ksdata = mock.Mock()
+        self.ksdata.packages.packageList = ["vim", "aide"]
+        self.ksdata.packages.excludedList = ["telnet"]
+
+        self.patchers = [mock.patch.object(OSCAPdata, "wait_for_prefetch",
+                                           return_value=True),
+                         mock.patch.object(common, "get_package_fixes")]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def package_lists_test(self):
+        common.get_package_fixes.return_value = (set(["aide", "audit"]),
+                                                 set(["aide", "telnet",
+                                                      "rsh"]))
+
+        self.oscap_data.setup(mock.Mock(), self.ksdata, mock.Mock())
+
+        # no duplicates, the explicitly requested packages are kept
+        self.assertEqual(self.ksdata.packages.packageList,
+                         ["vim", "aide", "openscap", "openscap-utils",
+                          "scap-security-guide", "audit"])
+        self.assertEqual(self.ksdata.packages.excludedList, ["telnet", "rsh"])
+
+    def package_fixes_error_test(self):
+        common.get_package_fixes.side_effect = common.OSCAPaddonError()
+
+        self.oscap_data.setup(mock.Mock(), self.ksdata, mock.Mock())
+
+        self.assertEqual(self.ksdata.packages.packageList,
+                         ["vim", "aide", "openscap", "openscap-utils",
+                          "scap-security-guide"])
+        self.assertEqual(self.ksdata.packages.excludedList, ["telnet"])
@@ -0,0 +1,106 @@
+#
+# Copyright (C) 2013  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# Red Hat Author(s): Vratislav Podzimek <vpodzime@redhat.com>
+#
+
+
+"""Module with unit tests for the pipeline.py module"""
+
+import unittest
+import threading
+
+from org_fedora_oscap import pipeline
+
+class PipelineTest(unittest.TestCase):
+    """Tests for the Pipeline class."""
+
+    def dependencies_test(self):
+        order = []
+        lock = threading.Lock()
+
+        def stage(name):
+            def func():
+                with lock:
+                    order.append(name)
+                return name.upper()
+            return func
+
+        pipe = pipeline.Pipeline()
+        pipe.add_stage("fetch", stage("fetch"))
+        pipe.add_stage("check", stage("check"), ["fetch"])
+        pipe.add_stage("extract", stage("extract"), ["fetch"])
+        pipe.add_stage("load", stage("load"), ["check", "extract"])
+        pipe.run()
+
+        self.assertEqual(order[0], "fetch")
+        self.assertEqual(set(order[1:3]), set(["check", "extract"]))
+        self.assertEqual(order[3], "load")
+        self.assertEqual(pipe.get_result("load"), "LOAD")
+
+    def concurrent_stages_test(self):
+        # both stages have to run at the same time to pass the barrier
+        started = [threading.Event(), threading.Event()]
+
+        def stage(idx):
+            def func():
+                started[idx].set()
+                return started[1 - idx].wait(5)
+            return func
+
+        pipe = pipeline.Pipeline()
+        pipe.add_stage("first", stage(0))
+        pipe.add_stage("second", stage(1))
+        pipe.run()
+
+        self.assertTrue(pipe.get_result("first"))
+        self.assertTrue(pipe.get_result("second"))
+
+    def failure_test(self):
+        done = []
+        finished = []
+
+        def fail():
+            raise ValueError("failed")
+
+        pipe = pipeline.Pipeline(lambda name, err: done.append((name, err)),
+                                 lambda: finished.append(True))
+        pipe.add_stage("fail", fail)
+        pipe.add_stage("dependent", lambda: "never", ["fail"])
+        pipe.add_stage("independent", lambda: "ok")
+        pipe.run()
+
+        self.assertIsInstance(pipe.get_error("fail"), ValueError)
+        self.assertIsInstance(pipe.get_error("dependent"),
+                              pipeline.StageSkippedError)
+        self.assertIsNone(pipe.get_error("independent"))
+        self.assertEqual(pipe.get_result("independent"), "ok")
+        with self.assertRaises(ValueError):
+            pipe.get_result("fail")
+        self.assertEqual(pipe.get_exc_info("fail")[0], ValueError)
+
+        self.assertEqual(len(done), 3)
+        self.assertEqual(finished, [True])
+
+    def invalid_stages_test(self):
+        pipe = pipeline.Pipeline()
+        pipe.add_stage("stage", lambda: None)
+
+        with self.assertRaises(ValueError):
+            pipe.add_stage("stage", lambda: None)
+        with self.assertRaises(ValueError):
+            pipe.add_stage("other", lambda: None, ["unknown"])
@@ -50,6 +50,92 @@ class PartRulesSyntaxSupportTest(unittest.TestCase):
         del(self.part_rules["/tmp"])
         self.assertNotIn("/tmp", self.part_rules)
 
+class IndexedListTest(unittest.TestCase):
+    """Test the IndexedList helper class."""
+
+    def setUp(self):
+        self.lst = ["vim", "firewalld", "vim"]
+        self.indexed = rule_handling.IndexedList(self.lst)
+
+    def contains_test(self):
+        self.assertIn("vim", self.indexed)
+        self.assertNotIn("telnet", self.indexed)
+
+    def append_test(self):
+        self.assertNotIn("telnet", self.indexed)
+        self.indexed.append("telnet")
+
+        # both the index and the underlying list should be updated
+        self.assertIn("telnet", self.indexed)
+        self.assertEqual(self.lst, ["vim", "firewalld", "vim", "telnet"])
+
+    def remove_items_test(self):
+        lst = self.lst
+        self.indexed.remove_items(["vim", "telnet"])
+
+        # only the first occurrence removed, the same list object modified
+        self.assertIs(self.lst, lst)
+        self.assertEqual(self.lst, ["firewalld", "vim"])
+        self.assertIn("vim", self.indexed)
+
+class RuleParsingTest(unittest.TestCase):
+    """Test the parser of the rule lines."""
+
+    def tokenize_test(self):
+        tokens = rule_handling.tokenize_rule(""" part  /tmp --mountoptions="nodev,a b" 'x'y """)
+        self.assertEqual(tokens, ["part", "/tmp", "--mountoptions=nodev,a b",
+                                  "xy"])
+
+    def tokenize_no_closing_quotation_test(self):
+        with self.assertRaises(ValueError):
+            rule_handling.tokenize_rule('part /tmp --mountoptions="nodev')
+
+    def interned_values_test(self):
+        first, second = rule_handling.parse_rules(["package --add=vim",
+                                                   "package --add=v" + "im"])
+
+        # the same package names should be stored only once
+        self.assertIs(first.add_pkgs[0], second.add_pkgs[0])
+
+    def parse_records_test(self):
+        records = rule_handling.parse_rules("""
+        # comment
+        part /tmp --mountoptions=nodev,,noexec --mountoptions noauto
+        passwd --minlen 8
+        package --add=firewalld --remove telnet
+        bootloader --passwd
+        """)
+
+        self.assertEqual(records,
+                         [rule_handling.PartRuleRecord("/tmp", ("nodev", "noexec",
+                                                                "noauto")),
+                          rule_handling.PasswdRuleRecord(8),
+                          rule_handling.PackageRuleRecord(("firewalld",),
+                                                          ("telnet",)),
+                          rule_handling.BootloaderRuleRecord(True),
+                          ])
+
+    def unknown_rule_test(self):
+        with self.assertRaises(rule_handling.UknownRuleError):
+            rule_handling.parse_rules(["part /tmp", "firewall --enabled"])
+
+    def line_number_test(self):
+        lines = ["part /tmp", "", "passwd --minlen=eight"]
+        with self.assertRaisesRegexp(rule_handling.RuleParseError, "^line 3:"):
+            rule_handling.parse_rules(lines)
+
+    def unknown_option_test(self):
+        with self.assertRaises(rule_handling.RuleParseError):
+            rule_handling.parse_rule("part /tmp --mountopts=nodev")
+
+    def missing_value_test(self):
+        with self.assertRaises(rule_handling.RuleParseError):
+            rule_handling.parse_rule("package --add")
+
+    def missing_mount_point_test(self):
+        with self.assertRaises(rule_handling.RuleParseError):
+            rule_handling.parse_rule("part --mountoptions=nodev")
+
 class RuleDataParsingTest(unittest.TestCase):
     """Test rule data parsing."""
 
@@ -112,6 +198,46 @@ class RuleDataParsingTest(unittest.TestCase):
         self.assertEqual(str(self.rule_data._part_rules),
                          "part /tmp --mountoptions=nodev")
 
+class RuleDataBulkParsingTest(unittest.TestCase):
+    """Test adding multiple rules at once."""
+
+    def from_text_test(self):
+        rule_data = rule_handling.RuleData.from_text("""
+        part /tmp --mountoptions=nodev
+        part /tmp --mountoptions=noexec
+        passwd --minlen=8
+        """)
+
+        self.assertEqual(rule_data._part_rules["/tmp"]._mount_options,
+                         ["nodev", "noexec"])
+        self.assertEqual(rule_data._passwd_rules._minlen, 8)
+
+    def add_rules_lines_test(self):
+        rule_data = rule_handling.RuleData()
+        lines = (line for line in ["part /tmp", "package --add=vim"])
+        rule_data.add_rules(lines)
+
+        self.assertIn("/tmp", rule_data._part_rules)
+        self.assertEqual(rule_data._package_rules._add_pkgs, {"vim"})
+
+    def duplicates_test(self):
+        rule_data = rule_handling.RuleData()
+        # the handlers have __slots__, patch the class
+        with mock.patch.object(rule_handling.RuleData,
+                               "_add_record") as add_mock:
+            rule_data.add_rules(["part /tmp", "part  /tmp ", "part /var"])
+
+        # identical rules should be added only once
+        self.assertEqual(add_mock.call_count, 2)
+
+    def invalid_rule_test(self):
+        rule_data = rule_handling.RuleData()
+        with self.assertRaises(rule_handling.RuleParseError):
+            rule_data.add_rules(["part /tmp", "part"])
+
+        # nothing should be added
+        self.assertNotIn("/tmp", rule_data._part_rules)
+
 class RuleEvaluationTest(unittest.TestCase):
     """Test if the rule evaluation works properly."""
 
@@ -669,3 +795,60 @@ class RevertingTest(unittest.TestCase):
         # (only) added and excluded packages should have been removed from the list
         self.assertEqual(self.ksdata_mock.packages.packageList, ["vim"])
         self.assertEqual(self.ksdata_mock.packages.excludedList, [])
+
+class IncrementalEvaluationTest(unittest.TestCase):
+    """Test that rules are only re-evaluated if their inputs change."""
+
+    def setUp(self):
+        self.rule_data = rule_handling.RuleData()
+        self.ksdata_mock = mock.Mock()
+        self.storage_mock = mock.Mock()
+
+        self.rule_data.new_rule("part /tmp --mountoptions=nodev")
+        self.storage_mock.mountpoints = dict()
+        self.storage_mock.mountpoints["/tmp"] = mock.Mock()
+        self.storage_mock.mountpoints["/tmp"].format.options = "defaults"
+
+    def unchanged_inputs_test(self):
+        messages = self.rule_data.eval_rules(self.ksdata_mock, self.storage_mock)
+
+        # the handlers have __slots__, patch the class
+        with mock.patch.object(rule_handling.PartRules,
+                               "eval_rules") as eval_mock:
+            cached = self.rule_data.eval_rules(self.ksdata_mock,
+                                               self.storage_mock)
+
+        # nothing changed --> cached messages, no evaluation
+        self.assertFalse(eval_mock.called)
+        self.assertEqual(messages, cached)
+
+    def changed_inputs_test(self):
+        messages = self.rule_data.eval_rules(self.ksdata_mock, self.storage_mock)
+        self.assertEqual(len(messages), 1)
+
+        # mount point removed --> has to be re-evaluated
+        del self.storage_mock.mountpoints["/tmp"]
+        messages = self.rule_data.eval_rules(self.ksdata_mock, self.storage_mock)
+
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0].type, common.MESSAGE_TYPE_FATAL)
+
+    def report_only_not_reused_test(self):
+        messages = self.rule_data.eval_rules(self.ksdata_mock,
+                                             self.storage_mock, report_only=True)
+        self.assertEqual(len(messages), 1)
+
+        # cached report_only results must not prevent the automatic fixes
+        messages = self.rule_data.eval_rules(self.ksdata_mock, self.storage_mock)
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(self.storage_mock.mountpoints["/tmp"].format.options,
+                         "defaults,nodev")
+
+    def new_rule_test(self):
+        messages = self.rule_data.eval_rules(self.ksdata_mock, self.storage_mock)
+        self.assertEqual(len(messages), 1)
+
+        # new rule --> new results
+        self.rule_data.new_rule("part /var --mountoptions=nodev")
+        messages = self.rule_data.eval_rules(self.ksdata_mock, self.storage_mock)
+        self.assertEqual(len(messages), 2)
@@ -0,0 +1,141 @@
+#
+# Copyright (C) 2013  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# Red Hat Author(s): Vratislav Podzimek <vpodzime@redhat.com>
+#
+
+
+"""Module with unit tests for the signatures.py module"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+
+from org_fedora_oscap import signatures
+from org_fedora_oscap import tool_runner
+
+class SignatureTypeTest(unittest.TestCase):
+    """Tests for the get_signature_type function."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="oscap_signatures_test")
+        self.sig_path = os.path.join(self.tmp_dir, "content.sig")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _get_type(self, data):
+        with open(self.sig_path, "wb") as sig_file:
+            sig_file.write(data)
+        return signatures.get_signature_type(self.sig_path)
+
+    def armored_test(self):
+        self.assertEqual(self._get_type("-----BEGIN PGP SIGNATURE-----\n\n"),
+                         (signatures.SIGNATURE_TYPE_PGP, None))
+        self.assertEqual(self._get_type("\n-----BEGIN PKCS7-----\nMIIE"),
+                         (signatures.SIGNATURE_TYPE_CMS, "PEM"))
+        self.assertEqual(self._get_type("-----BEGIN CMS-----\nMIIE"),
+                         (signatures.SIGNATURE_TYPE_CMS, "PEM"))
+
+    def binary_test(self):
+        self.assertEqual(self._get_type("\x30\x82\x05\x74\x06\x09"),
+                         (signatures.SIGNATURE_TYPE_CMS, "DER"))
+        self.assertEqual(self._get_type("\x89\x01\x33\x04\x00\x01"),
+                         (signatures.SIGNATURE_TYPE_PGP, None))
+
+    def unknown_test(self):
+        with self.assertRaises(signatures.UnknownSignatureError):
+            self._get_type("some text")
+        with self.assertRaises(signatures.UnknownSignatureError):
+            self._get_type("")
+
+class VerifyArgsTest(unittest.TestCase):
+    """Tests for the _get_verify_args function."""
+
+    def cms_purpose_test(self):
+        # only signing certificates, not e.g. TLS server certificates
+        args = signatures._get_verify_args(signatures.SIGNATURE_TYPE_CMS,
+                                           "PEM", "content.p7s", "ca.pem")
+        self.assertIn("-purpose", args)
+        self.assertEqual(args[args.index("-purpose") + 1], "smimesign")
+
+class SignatureVerifierTest(unittest.TestCase):
+    """Tests for the SignatureVerifier class."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="oscap_signatures_test")
+        self.sig_path = os.path.join(self.tmp_dir, "content.asc")
+        with open(self.sig_path, "w") as sig_file:
+            sig_file.write("-----BEGIN PGP SIGNATURE-----\n")
+        self.data_path = os.path.join(self.tmp_dir, "data")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _get_verifier(self, script):
+        # the tool is replaced by a shell script
+        with mock.patch.object(signatures, "_get_verify_args",
+                               return_value=["sh", "-c", script]):
+            return signatures.SignatureVerifier(self.sig_path, "keyring.gpg")
+
+    def streamed_data_test(self):
+        verifier = self._get_verifier("cat > %s" % self.data_path)
+        for chunk in ("some ", "signed ", "data"):
+            verifier.update(chunk)
+        verifier.verify()
+
+        with open(self.data_path, "r") as data:
+            self.assertEqual(data.read(), "some signed data")
+
+    def failed_verification_test(self):
+        verifier = self._get_verifier("cat > /dev/null; echo BAD signature; exit 1")
+        verifier.update("some data")
+        with self.assertRaisesRegexp(signatures.SignatureVerificationError,
+                                     "BAD signature"):
+            verifier.verify()
+
+    def early_exit_test(self):
+        # the tool exits without reading the data
+        verifier = self._get_verifier("echo no public key; exit 2")
+        for _i in range(100):
+            verifier.update("x" * 64 * 1024)
+        with self.assertRaisesRegexp(signatures.SignatureVerificationError,
+                                     "no public key"):
+            verifier.verify()
+
+    def missing_tool_test(self):
+        with mock.patch.object(signatures, "_get_verify_args",
+                               return_value=["/nonexistent/gpgv"]):
+            with self.assertRaises(signatures.SignatureError):
+                signatures.SignatureVerifier(self.sig_path, "keyring.gpg")
+
+    def tool_runner_test(self):
+        # run like the other tools (logs, statistics, cancellation)
+        with mock.patch.object(tool_runner, "start_tool",
+                               wraps=tool_runner.start_tool) as start_tool:
+            verifier = self._get_verifier("cat > /dev/null")
+        verifier.update("some data")
+        verifier.verify()
+        self.assertEqual(start_tool.call_args[0][0], ["sh", "-c",
+                                                      "cat > /dev/null"])
+
+    def abort_test(self):
+        verifier = self._get_verifier("sleep 60")
+        verifier.update("some data")
+        verifier.abort()
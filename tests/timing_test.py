@@ -0,0 +1,106 @@
+#
+# Copyright (C) 2013  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# Red Hat Author(s): Vratislav Podzimek <vpodzime@redhat.com>
+#
+
+
+"""Module with unit tests for the timing.py module"""
+
+import unittest
+import os
+import json
+import shutil
+import tempfile
+
+from org_fedora_oscap import timing
+
+class MonotonicTest(unittest.TestCase):
+    """Tests for the monotonic function."""
+
+    def monotonic_test(self):
+        first = timing.monotonic()
+        second = timing.monotonic()
+        self.assertGreaterEqual(second, first)
+
+class TimelineTest(unittest.TestCase):
+    """Tests for the Timeline class."""
+
+    def setUp(self):
+        self.timeline = timing.Timeline()
+
+    def nested_spans_test(self):
+        with self.timeline.span("outer"):
+            with self.timeline.span("inner"):
+                pass
+
+        outer, inner = self.timeline.get_spans()
+        self.assertEqual(outer.name, "outer")
+        self.assertIsNone(outer.parent)
+        self.assertEqual(inner.name, "inner")
+        self.assertEqual(inner.parent, "outer")
+        self.assertGreaterEqual(outer.duration, inner.duration)
+        self.assertGreaterEqual(inner.start, outer.start)
+
+    def error_test(self):
+        with self.assertRaises(ValueError):
+            with self.timeline.span("failing"):
+                raise ValueError("failed")
+
+        (span,) = self.timeline.get_spans()
+        self.assertEqual(span.error, "ValueError")
+
+    def timed_test(self):
+        @self.timeline.timed("phase")
+        def func(arg):
+            return arg * 2
+
+        self.assertEqual(func(21), 42)
+        self.assertEqual(func.__name__, "func")
+        self.assertEqual([span.name for span in self.timeline.get_spans()],
+                         ["phase"])
+
+    def to_json_test(self):
+        with self.timeline.span("phase"):
+            pass
+
+        data = json.loads(self.timeline.to_json())
+        self.assertIn("origin", data)
+        self.assertEqual(len(data["spans"]), 1)
+        self.assertEqual(data["spans"][0]["name"], "phase")
+        self.assertIsNone(data["spans"][0]["error"])
+
+class WriteTimelineTest(unittest.TestCase):
+    """Tests for the write_timeline function."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="oscap_timing_test")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_timeline_test(self):
+        with timing.span("write_timeline_test"):
+            pass
+
+        fpath = os.path.join(self.tmp_dir, "timeline.json")
+        timing.write_timeline(fpath)
+
+        with open(fpath) as fobj:
+            data = json.load(fobj)
+        self.assertIn("write_timeline_test",
+                      [span["name"] for span in data["spans"]])
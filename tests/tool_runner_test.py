@@ -0,0 +1,164 @@
+#
+# Copyright (C) 2013  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# Red Hat Author(s): Vratislav Podzimek <vpodzime@redhat.com>
+#
+
+"""Module with unit tests for the tool_runner.py module"""
+
+import unittest
+import io
+import time
+import tempfile
+import threading
+import mock
+
+from org_fedora_oscap import tool_runner
+
+class ReadCappedTest(unittest.TestCase):
+    """Tests for the _read_capped function."""
+
+    def read_capped_test(self):
+        chunks = []
+        tool_runner._read_capped(io.BytesIO(b"a" * 10000), chunks, 5000)
+        self.assertEqual("".join(chunks), "a" * 5000)
+
+class ToolRunnerTest(unittest.TestCase):
+    """Tests for the ToolRunner class (running real processes)."""
+
+    def setUp(self):
+        self.runner = tool_runner.ToolRunner(max_jobs=2)
+
+    def run_test(self):
+        result = self.runner.run(["sh", "-c", "echo out; echo err >&2"])
+
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout, "out\n")
+        self.assertEqual(result.stderr, "err\n")
+        self.assertEqual(result.stats.args, ["sh", "-c",
+                                             "echo out; echo err >&2"])
+        self.assertGreaterEqual(result.stats.cpu_time, 0)
+        self.assertGreater(result.stats.max_rss, 0)
+
+    def stdin_test(self):
+        result = self.runner.run(["cat"], stdin_data="some\ndata\n")
+        self.assertEqual(result.stdout, "some\ndata\n")
+
+    def stdout_file_test(self):
+        with tempfile.TemporaryFile() as out_file:
+            result = self.runner.run(["echo", "data"], stdout=out_file)
+            out_file.seek(0)
+            self.assertEqual(out_file.read(), "data\n")
+        self.assertEqual(result.stdout, "")
+
+    def failure_test(self):
+        with self.assertRaises(tool_runner.ToolFailedError) as ctx:
+            self.runner.run(["sh", "-c", "echo wrong >&2; exit 3"])
+        self.assertEqual(ctx.exception.stderr, "wrong\n")
+
+        # any return code is fine
+        result = self.runner.run(["sh", "-c", "exit 3"], ok_codes=None)
+        self.assertEqual(result.returncode, 3)
+
+        with self.assertRaises(tool_runner.ToolFailedError):
+            self.runner.run(["sh", "-c", "echo wrong >&2"], check_stderr=True)
+
+    def no_such_tool_test(self):
+        with self.assertRaises(tool_runner.ToolFailedError):
+            self.runner.run(["/no/such/tool"])
+
+    def no_such_tool_setsid_test(self):
+        # reported as a failure to run the tool, not of setsid
+        with self.assertRaisesRegexp(tool_runner.ToolFailedError,
+                                     "Failed to run 'no-such-tool'"):
+            self.runner.run(["no-such-tool"], ok_codes=None)
+
+    def timeout_test(self):
+        with self.assertRaises(tool_runner.ToolTimeoutError):
+            self.runner.run(["sleep", "10"], timeout=0.1)
+
+    def timeout_children_test(self):
+        # the children of the tool keeping its stdout open are killed too
+        start = time.time()
+        with self.assertRaises(tool_runner.ToolTimeoutError):
+            self.runner.run(["sh", "-c", "sleep 10 & wait"], timeout=0.1)
+        self.assertLess(time.time() - start, 10)
+
+    def no_preexec_fn_test(self):
+        # no Python code run in the child process unless requested
+        with mock.patch("subprocess.Popen",
+                        side_effect=OSError("fail")) as popen:
+            with self.assertRaises(tool_runner.ToolFailedError):
+                self.runner.run(["true"], root="/mnt/sysimage")
+        self.assertIsNone(popen.call_args[1]["preexec_fn"])
+        self.assertEqual(popen.call_args[0][0][-3:],
+                         [tool_runner.CHROOT_CMD, "/mnt/sysimage", "true"])
+
+    def output_logged_test(self):
+        with mock.patch.object(tool_runner, "program_log") as program_log:
+            self.runner.run(["sh", "-c", "echo out; echo err >&2"])
+        logged = [call[0][0] for call in program_log.info.call_args_list]
+        self.assertIn("out", logged)
+        self.assertIn("err", logged)
+
+    def log_stats_test(self):
+        self.runner.run(["true"])
+        with mock.patch.object(tool_runner, "log") as log:
+            self.runner.log_stats()
+        self.assertEqual(log.info.call_count, 1)
+        self.assertEqual(log.info.call_args[0][1:3], ("true", 1))
+
+    def iter_lines_test(self):
+        lines = self.runner.iter_lines(["sh", "-c", "echo a; echo b; sleep 10"])
+        self.assertEqual(next(lines), "a\n")
+
+        # closing the generator kills the tool
+        lines.close()
+        stats, _summary = self.runner.get_stats()
+        self.assertLess(stats[-1].wall_time, 10)
+        self.assertLess(stats[-1].returncode, 0)
+
+    def run_many_test(self):
+        args_list = [["echo", str(i)] for i in range(5)]
+        results = self.runner.run_many(args_list)
+        self.assertEqual([result.stdout for result in results],
+                         ["%d\n" % i for i in range(5)])
+
+        _stats, summary = self.runner.get_stats()
+        self.assertEqual(summary["echo"][0], 5)
+
+    def job_cancel_test(self):
+        job = self.runner.start(["sleep", "10"])
+        job.cancel()
+        with self.assertRaises(tool_runner.ToolCancelledError):
+            job.wait()
+
+    def cancel_test(self):
+        lines = self.runner.iter_lines(["sh", "-c", "echo a; sleep 10"])
+        self.assertEqual(next(lines), "a\n")
+
+        # cancel from another thread, the tool is killed
+        threading.Thread(target=self.runner.cancel).start()
+        with self.assertRaises(tool_runner.ToolCancelledError):
+            list(lines)
+
+        # and no new tools are run
+        with self.assertRaises(tool_runner.ToolCancelledError):
+            self.runner.run(["true"])
+
+if __name__ == "__main__":
+    unittest.main()
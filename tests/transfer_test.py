@@ -0,0 +1,130 @@
+#
+# Copyright (C) 2013  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# Red Hat Author(s): Vratislav Podzimek <vpodzime@redhat.com>
+#
+
+
+"""Module with unit tests for the transfer.py module"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+
+from org_fedora_oscap import transfer
+
+class CopyFileTest(unittest.TestCase):
+    """Tests for the copy_file function."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="oscap_transfer_test")
+        self.src = os.path.join(self.tmp_dir, "src.xml")
+        self.dst = os.path.join(self.tmp_dir, "dst.xml")
+
+        # more than one chunk when copied in the user space
+        self.data = "<content/>\n" * (transfer.IO_BUF_SIZE / 5)
+        with open(self.src, "w") as src:
+            src.write(self.data)
+        os.chmod(self.src, 0o640)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _check_copy(self):
+        with open(self.dst, "r") as dst:
+            self.assertEqual(dst.read(), self.data)
+        self.assertEqual(os.stat(self.dst).st_mode, os.stat(self.src).st_mode)
+
+    def copy_test(self):
+        method = transfer.copy_file(self.src, self.dst)
+
+        self.assertIn(method, (transfer.METHOD_CLONE, transfer.METHOD_COPY_RANGE,
+                               transfer.METHOD_COPY))
+        self._check_copy()
+
+    def overwrite_test(self):
+        with open(self.dst, "w") as dst:
+            dst.write("some longer previous content" * 10 ** 6)
+
+        transfer.copy_file(self.src, self.dst)
+        self._check_copy()
+
+    def user_space_copy_test(self):
+        with mock.patch.object(transfer, "_clone", return_value=False):
+            with mock.patch.object(transfer, "_copy_file_range", None):
+                method = transfer.copy_file(self.src, self.dst)
+
+        self.assertEqual(method, transfer.METHOD_COPY)
+        self._check_copy()
+
+class TransferFilesTest(unittest.TestCase):
+    """Tests for the transfer_files function."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="oscap_transfer_test")
+        self.src_root = os.path.join(self.tmp_dir, "src")
+        self.dst_root = os.path.join(self.tmp_dir, "dst")
+
+        for rel_path in ("ds.xml", "unused.xml", "oval/a.xml", "oval/b/c.xml"):
+            fpath = os.path.join(self.src_root, rel_path)
+            if not os.path.isdir(os.path.dirname(fpath)):
+                os.makedirs(os.path.dirname(fpath))
+            with open(fpath, "w") as fobj:
+                fobj.write(rel_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _read(self, rel_path):
+        with open(os.path.join(self.dst_root, rel_path), "r") as fobj:
+            return fobj.read()
+
+    def selected_files_test(self):
+        stats = transfer.transfer_files(self.src_root, ["ds.xml", "oval"],
+                                        self.dst_root, jobs=2)
+
+        self.assertEqual(stats.files, 3)
+        self.assertEqual(stats.bytes, len("ds.xml" "oval/a.xml" "oval/b/c.xml"))
+        self.assertEqual(sum(stats.methods.values()), 3)
+        for rel_path in ("ds.xml", "oval/a.xml", "oval/b/c.xml"):
+            self.assertEqual(self._read(rel_path), rel_path)
+        self.assertFalse(os.path.exists(os.path.join(self.dst_root,
+                                                     "unused.xml")))
+
+    def hard_links_test(self):
+        os.link(os.path.join(self.src_root, "ds.xml"),
+                os.path.join(self.src_root, "oval", "ds_link.xml"))
+
+        stats = transfer.transfer_files(self.src_root, ["ds.xml", "oval"],
+                                        self.dst_root)
+
+        # the data copied only once
+        self.assertEqual(stats.files, 4)
+        self.assertEqual(stats.bytes, len("ds.xml" "oval/a.xml" "oval/b/c.xml"))
+        self.assertEqual(stats.methods[transfer.METHOD_LINK], 1)
+        self.assertEqual(os.stat(os.path.join(self.dst_root, "ds.xml")).st_ino,
+                         os.stat(os.path.join(self.dst_root, "oval",
+                                              "ds_link.xml")).st_ino)
+
+    def failed_copy_test(self):
+        with mock.patch.object(transfer, "copy_file",
+                               side_effect=IOError(28, "No space left")):
+            with self.assertRaises(IOError):
+                transfer.transfer_files(self.src_root, ["oval"],
+                                        self.dst_root)
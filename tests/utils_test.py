@@ -22,6 +22,9 @@
 
 import unittest
 import os
+import shutil
+import hashlib
+import tempfile
 import mock
 from collections import namedtuple
 
@@ -139,3 +142,83 @@ class KeepTypeMapTest(unittest.TestCase):
 
         # any better test for this?
         self.assertIn("next", dir(mapped_gen))
+
+class InternValueTest(unittest.TestCase):
+    """Tests for the intern_value function."""
+
+    def str_test(self):
+        value = "".join(["profile", "_id"])
+        self.assertIs(utils.intern_value(value), intern("profile_id"))
+
+    def unicode_test(self):
+        # cannot be interned, returned as it is
+        value = u"profile_id"
+        self.assertIs(utils.intern_value(value), value)
+
+class HashingAlgorithmTest(unittest.TestCase):
+    """Tests for the get_hashing_algorithm function."""
+
+    def supported_test(self):
+        for (size, algorithm) in utils.HASH_ALGORITHMS.iteritems():
+            hash_obj = utils.get_hashing_algorithm("a" * 2 * size)
+            self.assertEqual(hash_obj.name.lower(), algorithm)
+            self.assertEqual(hash_obj.digest_size, size)
+
+    def unsupported_test(self):
+        self.assertIsNone(utils.get_hashing_algorithm("a" * 31))
+        self.assertIsNone(utils.get_hashing_algorithm("a" * 30))
+
+class FileDigestsTest(unittest.TestCase):
+    """Tests for the get_file_digests and get_file_fingerprint functions."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="oscap_digests_test")
+        self.fpath = os.path.join(self.tmp_dir, "content.xml")
+
+        # more than one buffer
+        self.data = b"some content\n" * (utils.DIGEST_BUF_SIZE / 10)
+        with open(self.fpath, "wb") as fobj:
+            fobj.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def multiple_digests_test(self):
+        digests = utils.get_file_digests(self.fpath, ["sha256", "SHA512", "md5"])
+
+        self.assertEqual(digests, {"sha256": hashlib.sha256(self.data).hexdigest(),
+                                   "sha512": hashlib.sha512(self.data).hexdigest(),
+                                   "md5": hashlib.md5(self.data).hexdigest()})
+
+    def fingerprint_test(self):
+        hash_obj = utils.get_hashing_algorithm("a" * 64)
+        self.assertEqual(utils.get_file_fingerprint(self.fpath, hash_obj),
+                         hashlib.sha256(self.data).hexdigest())
+
+    def cached_digests_test(self):
+        utils.get_file_digests(self.fpath, ["sha1"])
+
+        with mock.patch.object(utils.hashlib, "new") as mock_new:
+            digests = utils.get_file_digests(self.fpath, ["sha1"])
+            self.assertFalse(mock_new.called)
+        self.assertEqual(digests["sha1"], hashlib.sha1(self.data).hexdigest())
+
+    def changed_file_test(self):
+        utils.get_file_digests(self.fpath, ["sha1"])
+
+        with open(self.fpath, "ab") as fobj:
+            fobj.write(b"more content")
+        digests = utils.get_file_digests(self.fpath, ["sha1"])
+
+        self.assertEqual(digests["sha1"],
+                         hashlib.sha1(self.data + b"more content").hexdigest())
+
+    def cache_file_digests_test(self):
+        hash_obj = hashlib.new("sha384")
+        hash_obj.update(self.data)
+        utils.cache_file_digests(self.fpath, [hash_obj])
+
+        with mock.patch.object(utils.hashlib, "new") as mock_new:
+            digests = utils.get_file_digests(self.fpath, ["sha384"])
+            self.assertFalse(mock_new.called)
+        self.assertEqual(digests["sha384"], hash_obj.hexdigest())